@@ -0,0 +1,31 @@
+"""add doc_id and chunk_id to document_chunks
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('document_chunks', sa.Column('doc_id', sa.String(), nullable=True))
+    op.add_column('document_chunks', sa.Column('chunk_id', sa.String(), nullable=True))
+    op.create_index('ix_document_chunks_doc_id', 'document_chunks', ['doc_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_document_chunks_doc_id', table_name='document_chunks')
+    op.drop_column('document_chunks', 'chunk_id')
+    op.drop_column('document_chunks', 'doc_id')
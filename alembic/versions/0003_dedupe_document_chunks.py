@@ -0,0 +1,40 @@
+"""unique chunk text per document url
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Every request used to re-insert its chunks; keep only the newest copy
+    op.execute("""
+        DELETE FROM document_chunks a
+        USING document_chunks b
+        WHERE a.document_url = b.document_url
+          AND md5(a.chunk_text) = md5(b.chunk_text)
+          AND (a.created_at, a.id::text) < (b.created_at, b.id::text)
+    """)
+    op.create_index(
+        'uq_document_chunks_url_text_md5',
+        'document_chunks',
+        ['document_url', sa.text('md5(chunk_text)')],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_document_chunks_url_text_md5', table_name='document_chunks')
@@ -0,0 +1,44 @@
+"""chunk ordinal, page, content hash and embedding model
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('document_chunks', sa.Column('ordinal', sa.Integer(), nullable=True))
+    op.add_column('document_chunks', sa.Column('page', sa.Integer(), nullable=True))
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(32), nullable=True))
+    op.add_column('document_chunks', sa.Column('embedding_model', sa.String(), nullable=True))
+    # Existing rows: the hash is recomputable and the ordinal is the chunk_<n> suffix
+    op.execute("""
+        UPDATE document_chunks
+        SET content_hash = md5(chunk_text),
+            ordinal = NULLIF(substring(chunk_id from '_([0-9]+)$'), '')::integer
+    """)
+    # (doc_id, chunk_id) resolves vector hits; its doc_id prefix replaces the old index
+    op.create_index('ix_document_chunks_doc_id_chunk_id', 'document_chunks', ['doc_id', 'chunk_id'])
+    op.drop_index('ix_document_chunks_doc_id', table_name='document_chunks')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_document_chunks_doc_id', 'document_chunks', ['doc_id'])
+    op.drop_index('ix_document_chunks_doc_id_chunk_id', table_name='document_chunks')
+    op.drop_column('document_chunks', 'embedding_model')
+    op.drop_column('document_chunks', 'content_hash')
+    op.drop_column('document_chunks', 'page')
+    op.drop_column('document_chunks', 'ordinal')
@@ -0,0 +1,37 @@
+"""document completion markers
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingested_documents',
+        sa.Column('doc_id', sa.String(), primary_key=True),
+        sa.Column('document_url', sa.String(), nullable=False),
+        sa.Column('content_hash', sa.String(64), nullable=True),
+        sa.Column('chunk_count', sa.Integer(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    # No backfill: a partial ingest left by the old code can't be told apart from
+    # a complete one, so documents stored before markers existed are ingested
+    # once more (unchanged chunks reuse their stored vectors)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ingested_documents')
@@ -0,0 +1,151 @@
+"""Cache of answers for repeated (document, question) pairs.
+
+The exact tier is keyed by the document's content key, the normalised
+question and the prompt/model version. The optional near-duplicate tier
+(off by default) compares question embeddings within the same document and
+prompt version, and returns a cached answer above a similarity threshold. It
+can serve one question's answer for a near-identical question about another
+entity ("plan A" vs "plan B"), so only turn it on with a real embedding
+model; the hashing fallback scores such pairs far too close. Each lookup
+compares against at most ANSWER_CACHE_SEMANTIC_CANDIDATES recent questions
+of that document. Entries expire after a TTL and are evicted
+least-recently-used.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '5000'))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '86400'))
+ANSWER_CACHE_SEMANTIC = os.getenv('ANSWER_CACHE_SEMANTIC', '0') == '1'
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.92'))
+ANSWER_CACHE_SEMANTIC_CANDIDATES = int(os.getenv('ANSWER_CACHE_SEMANTIC_CANDIDATES', '256'))  # per document
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_question(question: str) -> str:
+    return _SPACE_RE.sub(' ', _PUNCT_RE.sub(' ', question.lower())).strip()
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 semantic: bool = ANSWER_CACHE_SEMANTIC, similarity: float = ANSWER_CACHE_SIMILARITY,
+                 embed=None, max_candidates: int = ANSWER_CACHE_SEMANTIC_CANDIDATES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic and embed is not None
+        self.similarity = similarity
+        self.embed = embed
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.max_candidates = max_candidates
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any, Optional[np.ndarray]]]" = OrderedDict()
+        # (doc_key, version) -> keys of its entries with a vector, most recent last;
+        # the near-duplicate tier only ever scans one of these
+        self._candidates: Dict[Tuple[str, str], "OrderedDict[Tuple[str, str, str], None]"] = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, expires_at: float, now: float) -> bool:
+        return expires_at <= now
+
+    def _forget(self, key: Tuple[str, str, str]):
+        group = self._candidates.get(key[:2])
+        if group is not None:
+            group.pop(key, None)
+            if not group:
+                del self._candidates[key[:2]]
+
+    def _embed(self, questions: List[str]) -> Optional[np.ndarray]:
+        if not self.semantic or not questions:
+            return None
+        return self.embed(questions)
+
+    def get_many(self, doc_key: str, version: str, questions: List[str]) -> List[Optional[Any]]:
+        """Look up each question; returns the cached value or None per question."""
+        now = time.monotonic()
+        results: List[Optional[Any]] = [None] * len(questions)
+        missing = []
+        with self._lock:
+            for i, q in enumerate(questions):
+                key = (doc_key, version, normalize_question(q))
+                entry = self._entries.get(key)
+                if entry is not None and self._expired(entry[0], now):
+                    del self._entries[key]
+                    self._forget(key)
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+
+        if missing and self.semantic:
+            vectors = self._embed([questions[i] for i in missing])
+            with self._lock:
+                group = self._candidates.get((doc_key, version), {})
+                candidates = [(k, self._entries[k]) for k in group if not self._expired(self._entries[k][0], now)]
+                if candidates:
+                    matrix = np.stack([e[2] for _, e in candidates])
+                    scores = vectors @ matrix.T
+                    best = scores.argmax(axis=1)
+                    still_missing = []
+                    for row, i in enumerate(missing):
+                        if scores[row, best[row]] >= self.similarity:
+                            key, entry = candidates[best[row]]
+                            self._entries.move_to_end(key)
+                            results[i] = entry[1]
+                            self.semantic_hits += 1
+                        else:
+                            still_missing.append(i)
+                    missing = still_missing
+
+        with self._lock:
+            self.misses += len(missing)
+        return results
+
+    def put_many(self, doc_key: str, version: str, items: List[Tuple[str, Any]]):
+        if not items:
+            return
+        vectors = self._embed([q for q, _ in items])
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for row, (q, value) in enumerate(items):
+                key = (doc_key, version, normalize_question(q))
+                self._entries[key] = (expires_at, value, vectors[row] if vectors is not None else None)
+                self._entries.move_to_end(key)
+                if vectors is not None:
+                    group = self._candidates.setdefault(key[:2], OrderedDict())
+                    group[key] = None
+                    group.move_to_end(key)
+                    while len(group) > self.max_candidates:
+                        group.popitem(last=False)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+def _default_embed(questions: List[str]) -> np.ndarray:
+    from app.embeddings_ import get_embeddings
+    return get_embeddings(questions)
+
+
+answer_cache = AnswerCache(embed=_default_embed)
@@ -0,0 +1,249 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.schema import AnswerItem, EvidenceItem
+from app.retriever import query_top_k_batch
+from app.reasoner import (explain_and_answer_async, explain_and_answer_adaptive_async,
+                          explain_and_answer_batch_async, prompt_version)
+from app.answer_cache import AnswerCache, answer_cache
+from app.metrics import STAGE_SECONDS, log_event, record_cache
+from app.db import AsyncSessionLocal
+from app.crud import get_chunks_by_ids_async
+
+DEFAULT_CONCURRENCY = 8
+TOP_K = 5
+
+
+def _build_evidence(top: List[Dict]) -> List[Dict]:
+    evidence = []
+    for t in top:
+        evidence.append({
+            'doc_id': t.get('doc_id'),
+            'document_url': t.get('document_url'),
+            'chunk_id': t.get('chunk_id'),
+            'page': t.get('page'),
+            'text_snippet': t.get('text', ''),
+            'similarity_score': float(t.get('score', 0.0)),
+            'vector_score': t.get('vector_score')
+        })
+    return evidence
+
+
+def _facts_list(facts) -> Optional[List[str]]:
+    # The prompt asks for a facts object; EvidenceItem carries them as "key: value" strings
+    if not facts:
+        return None
+    if isinstance(facts, dict):
+        return [f'{k}: {v}' for k, v in facts.items()]
+    if isinstance(facts, list):
+        return [str(f) for f in facts]
+    return [str(facts)]
+
+
+def _to_answer_item(question: str, evidence: List[Dict], parsed: Dict) -> AnswerItem:
+    sources = []
+    for e in evidence:
+        sources.append(
+            EvidenceItem(
+                doc_id=e.get('doc_id'),
+                document_url=e.get('document_url'),
+                page=e.get('page'),
+                chunk_id=e.get('chunk_id'),
+                text_snippet=e.get('text_snippet')[:1000],
+                similarity_score=e.get('similarity_score'),
+                extracted_facts=_facts_list(parsed.get('facts'))
+            )
+        )
+    return AnswerItem(
+        question=question,
+        answer=parsed.get('answer', 'Not found'),
+        confidence=float(parsed.get('confidence', 0.0)),
+        sources=sources,
+        rationale=parsed.get('rationale', '')
+    )
+
+
+def _error_item(question: str, e: Exception) -> AnswerItem:
+    log_event('answer_error', question=question, error=str(e))
+    return AnswerItem(
+        question=question,
+        answer=f'Error generating response: {str(e)}',
+        confidence=0.0,
+        sources=[],
+        rationale=''
+    )
+
+
+async def resolve_hit_texts(tops: List[List[Dict]]):
+    """Fill in 'text' and 'page' for hits the request's chunks did not cover.
+
+    Hits from earlier ingests are looked up by (doc_id, chunk_id) in one
+    indexed query.
+    """
+    missing = {(h['doc_id'], h['chunk_id']) for top in tops for h in top
+               if not h.get('text') and h.get('doc_id') and h.get('chunk_id')}
+    if not missing:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = await get_chunks_by_ids_async(db, missing)
+    except Exception as e:
+        log_event('chunk_resolve_error', chunks=len(missing), error=str(e))
+        return
+    for top in tops:
+        for h in top:
+            row = rows.get((h.get('doc_id'), h.get('chunk_id')))
+            if row is not None and not h.get('text'):
+                h['text'] = row.chunk_text
+                h['page'] = row.page
+
+
+async def answer_question(question: str, top: List[Dict], semaphore: asyncio.Semaphore,
+                          deadline: Optional[float] = None,
+                          stats: Optional[Dict] = None,
+                          adaptive: bool = False) -> Tuple[AnswerItem, bool]:
+    """Ask the LLM a single question over its retrieved chunks.
+
+    Returns the answer and whether it is worth caching (the LLM call
+    succeeded). The semaphore caps how many questions are in flight at once.
+    With ``adaptive`` the question goes through explain_and_answer_adaptive_async
+    and the sources list only the evidence the answer was based on.
+    """
+    async with semaphore:
+        try:
+            evidence = _build_evidence(top)
+            if adaptive:
+                parsed = await explain_and_answer_adaptive_async(question, evidence, deadline=deadline, stats=stats)
+                evidence = evidence[:parsed.get('evidence_depth', len(evidence))]
+            else:
+                parsed = await explain_and_answer_async(question, evidence, deadline=deadline, stats=stats)
+            return _to_answer_item(question, evidence, parsed), not parsed.get('error')
+        except Exception as e:
+            return _error_item(question, e), False
+
+
+async def answer_question_batch(questions: List[str], tops: List[List[Dict]], semaphore: asyncio.Semaphore,
+                                max_prompt_tokens: int,
+                                deadline: Optional[float] = None,
+                                stats: Optional[Dict] = None) -> List[Tuple[AnswerItem, bool]]:
+    """Batched counterpart of answer_question: questions sharing evidence go in one LLM call."""
+    evidences = [_build_evidence(top) for top in tops]
+    try:
+        parsed_list = await explain_and_answer_batch_async(list(zip(questions, evidences)), max_prompt_tokens,
+                                                           deadline=deadline, semaphore=semaphore, stats=stats)
+    except Exception as e:
+        return [(_error_item(q, e), False) for q in questions]
+    return [(_to_answer_item(q, ev, parsed), not parsed.get('error'))
+            for q, ev, parsed in zip(questions, evidences, parsed_list)]
+
+
+async def iter_answers(questions: List[str], chunks: Optional[List[Dict]], *,
+                       concurrency: int = DEFAULT_CONCURRENCY,
+                       deadline: Optional[float] = None,
+                       doc_id: Optional[str] = None,
+                       doc_key: Optional[str] = None,
+                       cache: Optional[AnswerCache] = answer_cache,
+                       batch_max_prompt_tokens: Optional[int] = None,
+                       stats: Optional[Dict] = None,
+                       documents: Optional[List[Dict]] = None,
+                       adaptive: bool = False) -> AsyncIterator[Tuple[int, AnswerItem]]:
+    """Yield (question index, answer) pairs as soon as each answer is ready.
+
+    Cached answers for doc_key come first. Retrieval for the rest runs once
+    for the batch, over doc_id or, given ``documents``, across all of them;
+    reasoning then fans out per question, per evidence-sharing group when
+    batch_max_prompt_tokens is set, or adaptively when ``adaptive`` is.
+    ``deadline`` is a time.monotonic() timestamp shared by every LLM call and
+    ``stats`` collects evidence token counts. A failing question yields an
+    error answer for that question only; closing the generator early cancels
+    the LLM calls still in flight.
+    """
+    caching = cache is not None and doc_key is not None
+    # Batching takes precedence over adaptive reasoning, so its answers share the plain version
+    version = prompt_version(adaptive and not batch_max_prompt_tokens)
+    if caching:
+        cached = await asyncio.to_thread(cache.get_many, doc_key, version, questions)
+        hits = sum(hit is not None for hit in cached)
+        record_cache('answer', hits, len(questions) - hits)
+    else:
+        cached = [None] * len(questions)
+    todo = []
+    for i, (q, hit) in enumerate(zip(questions, cached)):
+        if hit is not None:
+            yield i, hit.model_copy(update={'question': q})
+        else:
+            todo.append(i)
+    if not todo:
+        return
+
+    pending = [questions[i] for i in todo]
+    if documents is not None:
+        doc_id = [d['doc_id'] for d in documents]
+        chunk_maps = {d['doc_id']: {c['chunk_id']: c for c in d['chunks']} for d in documents}
+        urls = {d['doc_id']: d.get('document_url') for d in documents}
+    else:
+        chunk_maps = {doc_id: {c['chunk_id']: c for c in chunks or []}} if doc_id is not None else None
+        urls = {}
+    try:
+        with STAGE_SECONDS.time(stage='retrieve'):
+            tops = await asyncio.to_thread(query_top_k_batch, pending, TOP_K, doc_id, chunk_maps=chunk_maps)
+            await resolve_hit_texts(tops)
+        for top in tops:
+            for hit in top:
+                hit.setdefault('document_url', urls.get(hit.get('doc_id')))
+    except Exception as e:
+        for i in todo:
+            yield i, _error_item(questions[i], e)
+        return
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    if batch_max_prompt_tokens:
+        results = await answer_question_batch(pending, tops, semaphore, batch_max_prompt_tokens, deadline, stats)
+        to_cache = [(questions[i], item) for i, (item, cacheable) in zip(todo, results) if cacheable]
+        if caching and to_cache:
+            await asyncio.to_thread(cache.put_many, doc_key, version, to_cache)
+        for i, (item, _) in zip(todo, results):
+            yield i, item
+        return
+
+    tasks = {
+        asyncio.create_task(answer_question(questions[i], top, semaphore, deadline, stats, adaptive)): i
+        for i, top in zip(todo, tops)
+    }
+    running = set(tasks)
+    try:
+        while running:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = tasks[task]
+                item, cacheable = task.result()
+                if caching and cacheable:
+                    await asyncio.to_thread(cache.put_many, doc_key, version, [(questions[i], item)])
+                yield i, item
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+async def answer_questions(questions: List[str], chunks: Optional[List[Dict]], *,
+                           concurrency: int = DEFAULT_CONCURRENCY,
+                           deadline: Optional[float] = None,
+                           doc_id: Optional[str] = None,
+                           doc_key: Optional[str] = None,
+                           cache: Optional[AnswerCache] = answer_cache,
+                           batch_max_prompt_tokens: Optional[int] = None,
+                           stats: Optional[Dict] = None,
+                           documents: Optional[List[Dict]] = None,
+                           adaptive: bool = False) -> List[AnswerItem]:
+    """Answer all questions concurrently, returning answers in input order.
+
+    See iter_answers for caching, retrieval and failure handling.
+    """
+    answers: List[Optional[AnswerItem]] = [None] * len(questions)
+    async for i, item in iter_answers(questions, chunks, concurrency=concurrency, deadline=deadline,
+                                      doc_id=doc_id, doc_key=doc_key, cache=cache,
+                                      batch_max_prompt_tokens=batch_max_prompt_tokens, stats=stats,
+                                      documents=documents, adaptive=adaptive):
+        answers[i] = item
+    return answers
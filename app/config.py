@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,8 +10,37 @@ class Settings(BaseSettings):
     MAX_CHUNK_TOKENS: int
     GROQ_API_KEY: str
     GROQ_MODEL: str
+    ANSWER_CONCURRENCY: int = 8
+    RUN_DEADLINE_SECONDS: float = 60
+    BATCH_REASONING: bool = False
+    BATCH_MAX_PROMPT_TOKENS: int = 6000
+    ADAPTIVE_REASONING: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    INGEST_WORKERS: int = 2
+    DOCUMENT_WAIT_SECONDS: float = 30
+    WARM_UP_ON_STARTUP: bool = True
+    MAX_DOCUMENTS_PER_REQUEST: int = 10
+    INGEST_CONCURRENCY: int = 4
 
     class Config:
         env_file = ".env"
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+class _LazySettings:
+    """Stands in for the Settings instance, reading and validating the
+    environment on first attribute access rather than at import."""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+
+settings = _LazySettings()
@@ -0,0 +1,80 @@
+"""Context assembly between retrieval and the LLM.
+
+Retrieved chunks overlap (the chunker repeats CHUNK_OVERLAP_TOKENS between
+neighbours) and are mostly irrelevant to any one question, so sending them
+whole makes prompts large and slow. pack_evidence drops sentences already
+seen, keeps the sentences of each chunk that best match the question and
+stops once the evidence token budget is spent.
+"""
+import os
+import re
+from typing import Dict, List, Optional
+from app.utils.chunking import get_tokenizer
+
+EVIDENCE_TOKEN_BUDGET = int(os.getenv('EVIDENCE_TOKEN_BUDGET', '1500'))
+SNIPPET_MAX_TOKENS = int(os.getenv('EVIDENCE_SNIPPET_MAX_TOKENS', '400'))
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_STOPWORDS = frozenset(
+    'a an and are as at be by does do for from has have how in is it its of on or '
+    'that the this to was were what when where which who why will with under'.split()
+)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text or '') if s.strip()]
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def select_sentences(question_terms: set, sentences: List[str], counts: List[int], max_tokens: int) -> List[int]:
+    """Indexes of the most question-relevant sentences fitting max_tokens, in text order.
+
+    Sentences are ranked by how many question terms they share; ties keep
+    their original position so, with no overlap at all, the chunk is simply
+    truncated from the start.
+    """
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: (-len(question_terms & _terms(sentences[i])), i))
+    chosen, used = [], 0
+    for i in ranked:
+        if used + counts[i] <= max_tokens:
+            chosen.append(i)
+            used += counts[i]
+    return sorted(chosen)
+
+
+def pack_evidence(question: str, evidence: List[Dict], budget: int = EVIDENCE_TOKEN_BUDGET,
+                  snippet_max_tokens: int = SNIPPET_MAX_TOKENS, stats: Optional[Dict] = None) -> List[Dict]:
+    """Return evidence trimmed to fit ``budget`` tokens, most similar chunks first.
+
+    Each item is a copy with a shortened text_snippet; items left with no new
+    sentences are dropped. If ``stats`` is given, the token counts before and
+    after packing are added to its 'evidence_tokens' and 'packed_tokens' keys.
+    """
+    tokenizer = get_tokenizer()
+    question_terms = _terms(question)
+    seen = set()
+    packed, before, after = [], 0, 0
+    for e in sorted(evidence, key=lambda e: -float(e.get('similarity_score') or 0.0)):
+        sentences = split_sentences(e.get('text_snippet') or '')
+        counts = tokenizer.count_batch(sentences) if sentences else []
+        before += sum(counts)
+        fresh = [i for i, s in enumerate(sentences) if s not in seen]
+        seen.update(sentences)
+        room = min(snippet_max_tokens, budget - after)
+        if not fresh or room <= 0:
+            continue
+        keep = select_sentences(question_terms, [sentences[i] for i in fresh], [counts[i] for i in fresh], room)
+        if not keep:
+            continue
+        kept = [fresh[i] for i in keep]
+        after += sum(counts[i] for i in kept)
+        packed.append(dict(e, text_snippet=' '.join(sentences[i] for i in kept)))
+    if stats is not None:
+        stats['evidence_tokens'] = stats.get('evidence_tokens', 0) + before
+        stats['packed_tokens'] = stats.get('packed_tokens', 0) + after
+    return packed
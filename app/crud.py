@@ -1,9 +1,20 @@
+import hashlib
+import uuid
+from datetime import timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select, tuple_, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app import models, db
 from app.utils.chunking import clean_text  # Import the cleaning function
+from app.metrics import log_event
 
-def create_chunk(db: Session, document_url: str, chunk_text: str, token_count: int):
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+def create_chunk(db: Session, document_url: str, chunk_text: str, token_count: int,
+                 doc_id: str = None, chunk_id: str = None):
     try:
         # Clean the text before storing to handle NUL characters
         cleaned_text = clean_text(chunk_text)
@@ -13,7 +24,9 @@ def create_chunk(db: Session, document_url: str, chunk_text: str, token_count: i
         chunk = models.DocumentChunk(
             document_url=document_url, 
             chunk_text=cleaned_text,  # Use cleaned text
-            token_count=token_count
+            token_count=token_count,
+            doc_id=doc_id,
+            chunk_id=chunk_id
         )
         db.add(chunk)
         db.commit()
@@ -22,11 +35,224 @@ def create_chunk(db: Session, document_url: str, chunk_text: str, token_count: i
         
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"Error creating chunk: {str(e)}")
+        log_event("chunk_write_error", doc_id=doc_id, error=str(e))
+        return None
+
+BULK_INSERT_PAGE_SIZE = 1000
+
+def content_hash(text: str) -> str:
+    """md5 hex digest of cleaned chunk text, matching md5(chunk_text) in SQL."""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def chunk_ordinal(chunk: Dict) -> Optional[int]:
+    if chunk.get('ordinal') is not None:
+        return chunk['ordinal']
+    try:
+        return int(chunk['chunk_id'].rsplit('_', 1)[1])
+    except (AttributeError, IndexError, KeyError, ValueError):
         return None
 
+def _prepare_chunk_rows(document_url: str, chunks: List[Dict], doc_id: str = None,
+                        embedding_model: str = None, seen: Optional[set] = None):
+    rows = []
+    kept = []
+    seen = set() if seen is None else seen
+    for c in chunks:
+        cleaned_text = clean_text(c['text'])
+        if not cleaned_text:
+            continue
+        digest = content_hash(cleaned_text)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        rows.append({
+            'document_url': document_url,
+            'chunk_text': cleaned_text,
+            'token_count': c['token_count'],
+            'doc_id': doc_id,
+            'chunk_id': c['chunk_id'],
+            'ordinal': chunk_ordinal(c),
+            'page': c.get('page'),
+            'content_hash': digest,
+            'embedding_model': embedding_model,
+        })
+        kept.append(c)
+    return rows, kept
+
+def _with_row_id(chunk, row_id: int):
+    if isinstance(chunk, dict):
+        return {**chunk, 'id': row_id}
+    # ChunkRecords are tagged in place; copying one into a dict would copy its text out
+    chunk['id'] = row_id
+    return chunk
+
+def _upsert_chunks_statements(rows: List[Dict]):
+    table = models.DocumentChunk
+    for start in range(0, len(rows), BULK_INSERT_PAGE_SIZE):
+        stmt = pg_insert(table).values(rows[start:start + BULK_INSERT_PAGE_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.document_url, func.md5(table.chunk_text)],
+            set_={
+                'doc_id': stmt.excluded.doc_id,
+                'chunk_id': stmt.excluded.chunk_id,
+                'token_count': stmt.excluded.token_count,
+                'ordinal': stmt.excluded.ordinal,
+                'page': stmt.excluded.page,
+                'content_hash': stmt.excluded.content_hash,
+                'embedding_model': stmt.excluded.embedding_model,
+            },
+        ).returning(table.id, table.chunk_id)
+        yield stmt
+
+def create_chunks(db: Session, document_url: str, chunks: List[Dict], doc_id: str = None,
+                  embedding_model: str = None, seen: Optional[set] = None) -> List[Dict]:
+    """Clean and insert all chunks of a document in a single transaction.
+
+    Rows go in as multi-row INSERTs and are deduplicated on (document_url,
+    md5(chunk_text)): a chunk already stored for this URL keeps its row and is
+    re-tagged with the new doc_id/chunk_id and metadata. ``embedding_model``
+    records which embedder produced the chunks' vectors. Returns the persisted chunks in
+    input order, each with its row ``id`` added; empty and duplicate chunks are
+    dropped. A document written in several batches passes the same ``seen``
+    set (content hashes) to every call, so text already stored by an earlier
+    batch is dropped too instead of re-tagging that batch's row. If the
+    transaction fails it is rolled back and the error re-raised, so a caller
+    never mistakes a failed write for a batch with nothing new.
+    """
+    rows, kept = _prepare_chunk_rows(document_url, chunks, doc_id, embedding_model, seen)
+    if not rows:
+        return []
+
+    ids = {}
+    try:
+        for stmt in _upsert_chunks_statements(rows):
+            for row_id, chunk_id in db.execute(stmt):
+                ids[chunk_id] = row_id
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        log_event("chunk_write_error", document_url=document_url, doc_id=doc_id, chunks=len(rows), error=str(e))
+        raise
+
+    return [_with_row_id(c, ids[c['chunk_id']]) for c in kept if c['chunk_id'] in ids]
+
 def list_chunks(db: Session, limit: int = 100):
     return db.query(models.DocumentChunk)\
            .order_by(models.DocumentChunk.created_at.desc())\
            .limit(limit)\
            .all()
+
+def get_document_chunks(db: Session, doc_id: str):
+    return db.query(models.DocumentChunk)\
+           .filter(models.DocumentChunk.doc_id == doc_id)\
+           .order_by(models.DocumentChunk.ordinal)\
+           .all()
+
+def mark_document_complete(db: Session, doc_id: str, document_url: str, content_hash: Optional[str],
+                           chunk_count: int):
+    """Record that all chunk_count chunks of doc_id are stored."""
+    table = models.IngestedDocument
+    stmt = pg_insert(table).values(doc_id=doc_id, document_url=document_url, content_hash=content_hash,
+                                   chunk_count=chunk_count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.doc_id],
+        set_={'document_url': stmt.excluded.document_url, 'content_hash': stmt.excluded.content_hash,
+              'chunk_count': stmt.excluded.chunk_count, 'completed_at': func.now()},
+    )
+    db.execute(stmt)
+    db.commit()
+
+def get_completed_document(db: Session, doc_id: str) -> Optional[models.IngestedDocument]:
+    return db.get(models.IngestedDocument, doc_id)
+
+def delete_document(db: Session, doc_id: str) -> int:
+    """Delete doc_id's chunk rows and completion marker in one transaction."""
+    try:
+        deleted = db.query(models.DocumentChunk).filter(models.DocumentChunk.doc_id == doc_id)\
+                    .delete(synchronize_session=False)
+        db.query(models.IngestedDocument).filter(models.IngestedDocument.doc_id == doc_id)\
+          .delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+
+def _chunks_by_ids_query(ids: Iterable[Tuple[str, str]]):
+    table = models.DocumentChunk
+    return select(table).where(tuple_(table.doc_id, table.chunk_id).in_(list(ids)))
+
+def get_chunks_by_ids(db: Session, ids: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], models.DocumentChunk]:
+    """Rows for (doc_id, chunk_id) pairs, e.g. vector hits, in one indexed query."""
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    return {(r.doc_id, r.chunk_id): r for r in db.execute(_chunks_by_ids_query(ids)).scalars()}
+
+def get_indexed_hashes(db: Session, document_url: str, embedding_model: str) -> Dict[str, Tuple[str, str]]:
+    """content_hash -> (doc_id, chunk_id) for chunks of a URL embedded with embedding_model."""
+    table = models.DocumentChunk
+    rows = db.execute(
+        select(table.content_hash, table.doc_id, table.chunk_id)
+        .where(table.document_url == document_url, table.embedding_model == embedding_model)
+    )
+    return {h: (d, c) for h, d, c in rows if h and d and c}
+
+# Async counterparts for code running on the event loop
+
+async def get_chunks_by_ids_async(db: 'AsyncSession',
+                                  ids: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], models.DocumentChunk]:
+    ids = list(set(ids))
+    if not ids:
+        return {}
+    result = await db.execute(_chunks_by_ids_query(ids))
+    return {(r.doc_id, r.chunk_id): r for r in result.scalars()}
+
+# Ingest job queue (see app.jobs)
+
+async def create_ingest_job_async(db: 'AsyncSession', document_url: str) -> models.IngestJob:
+    job = models.IngestJob(document_url=document_url, status='queued', attempts=0)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+async def get_ingest_job_async(db: 'AsyncSession', job_id: uuid.UUID) -> Optional[models.IngestJob]:
+    return await db.get(models.IngestJob, job_id)
+
+async def claim_ingest_job_async(db: 'AsyncSession', stale_after: float) -> Optional[models.IngestJob]:
+    """Atomically mark the oldest claimable job running and return it.
+
+    SKIP LOCKED lets concurrent workers, in any process, each claim a different
+    row without blocking. A job still 'running' after stale_after seconds is
+    assumed orphaned by a dead worker and claimed again.
+    """
+    job = models.IngestJob
+    candidate = (
+        select(job.id)
+        .where(or_(job.status == 'queued',
+                   and_(job.status == 'running', job.started_at < func.now() - timedelta(seconds=stale_after))))
+        .order_by(job.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(job)
+        .where(job.id == candidate)
+        .values(status='running', started_at=func.now(), attempts=job.attempts + 1, error=None)
+        .returning(job)
+    )
+    claimed = result.scalars().first()
+    await db.commit()
+    return claimed
+
+async def finish_ingest_job_async(db: 'AsyncSession', job_id: uuid.UUID, doc_id: str = None,
+                                  chunk_count: int = None, error: str = None):
+    await db.execute(
+        update(models.IngestJob)
+        .where(models.IngestJob.id == job_id)
+        .values(status='failed' if error else 'done', doc_id=doc_id, chunk_count=chunk_count,
+                error=error, finished_at=func.now())
+    )
+    await db.commit()
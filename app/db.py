@@ -1,20 +1,148 @@
-from sqlalchemy import create_engine
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.exc import SQLAlchemyError
 from app.config import settings
+from app.metrics import log_event
 
-engine = create_engine(settings.DATABASE_URL, echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Engines and session factories are built on first use, not at import, so
+# importing the app needs neither the database settings nor a driver
 Base = declarative_base()
 
-# Add this helper function
-def safe_commit(db_session):
+
+def _pool_options() -> Dict:
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for asyncpg."""
+    u = make_url(url)
+    u = u.set(drivername='postgresql+asyncpg')
+    # asyncpg takes no sslmode; its equivalent is ssl
+    if 'sslmode' in u.query:
+        query = dict(u.query)
+        query['ssl'] = query.pop('sslmode')
+        u = u.set(query=query)
+    if settings.DB_STATEMENT_CACHE_SIZE >= 0:
+        u = u.update_query_dict({'prepared_statement_cache_size': str(settings.DB_STATEMENT_CACHE_SIZE)})
+    return u.render_as_string(hide_password=False)
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """The sync engine; it serves ingestion (which runs in worker threads) and Alembic."""
+    return create_engine(settings.DATABASE_URL, echo=False, future=True, **_pool_options())
+
+
+@lru_cache(maxsize=1)
+def get_async_engine() -> 'AsyncEngine':
+    """The engine used from the event loop. DB_STATEMENT_CACHE_SIZE=0 disables
+    asyncpg's prepared statement caches, which is required behind pgbouncer in
+    transaction pooling mode."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        connect_args={'statement_cache_size': max(settings.DB_STATEMENT_CACHE_SIZE, 0)},
+        **_pool_options(),
+    )
+
+
+async def dispose_async_engine():
+    """Close the async engine's pooled connections, if it was ever built."""
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+
+
+class _LazySessionFactory:
+    """Called like a sessionmaker; builds the real one on first call."""
+
+    def __init__(self, build: Callable):
+        self._build = build
+        self._factory = None
+        self._lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            with self._lock:
+                if self._factory is None:
+                    self._factory = self._build()
+        return self._factory(**kwargs)
+
+
+SessionLocal = _LazySessionFactory(
+    lambda: sessionmaker(bind=get_engine(), autoflush=False, autocommit=False, future=True))
+def _async_sessionmaker():
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+AsyncSessionLocal = _LazySessionFactory(_async_sessionmaker)
+
+
+def __getattr__(name: str):
+    # ``from app.db import engine`` still works; it builds the engine then
+    if name == 'engine':
+        return get_engine()
+    if name == 'async_engine':
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pool_status(pool) -> Dict:
+    size = pool.size()
+    checked_out = pool.checkedout()
+    overflow = max(pool.overflow(), 0)
+    capacity = size + settings.DB_MAX_OVERFLOW
+    return {
+        'size': size,
+        'checked_out': checked_out,
+        'checked_in': pool.checkedin(),
+        'overflow': overflow,
+        'utilization': round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+@contextmanager
+def advisory_lock(key: str, timeout: float = 120.0, poll_interval: float = 0.1):
+    """Hold a Postgres session-level advisory lock on ``key`` across workers.
+
+    Polls pg_try_advisory_lock on a dedicated pooled connection until it is
+    acquired or ``timeout`` passes, and yields whether it was acquired, so a
+    caller can carry on unlocked rather than fail when the lock is stuck.
+    """
+    lock_id = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+    conn = get_engine().connect()
+    acquired = False
     try:
-        db_session.commit()
-    except SQLAlchemyError as e:
-        db_session.rollback()
-        if 'NUL' in str(e) or 'null character' in str(e):
-            # Log the error and continue
-            print(f"Warning: Skipping commit due to NUL character: {str(e)}")
-        else:
-            raise
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {'k': lock_id}).scalar())
+            conn.commit()
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        yield acquired
+    finally:
+        try:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': lock_id})
+                conn.commit()
+        except Exception as e:
+            # Dropping the connection is what releases a session lock for sure
+            log_event("advisory_unlock_error", key=key, error=str(e))
+            conn.invalidate()
+        finally:
+            conn.close()
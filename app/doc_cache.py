@@ -0,0 +1,161 @@
+"""Content-addressed cache of ingested documents.
+
+A document is identified by its URL plus a hash of its bytes; the doc_id is derived
+from that key, so the same document always gets the same doc_id (and the same
+vector IDs). Entries live in an in-memory LRU tier, backed by a persistent tier
+that rebuilds chunks from the ``document_chunks`` table. ETag/Last-Modified
+validators map to a doc_id so repeated requests can skip the download too.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.retriever import vector_id
+from app.metrics import log_event
+
+DOC_CACHE_SIZE = int(os.getenv('DOC_CACHE_SIZE', '32'))
+
+
+def validator_key(url: str, validators: Dict[str, str]) -> Optional[str]:
+    if not validators:
+        return None
+    return f"{url}|etag={validators.get('etag', '')}|last_modified={validators.get('last_modified', '')}"
+
+
+def stable_doc_id(url: str, digest: str) -> str:
+    return hashlib.sha256(f"{url}|{digest}".encode('utf-8')).hexdigest()[:16]
+
+
+def make_entry(doc_id: str, document_url: str, digest: Optional[str], chunks) -> Dict:
+    return {
+        'doc_id': doc_id,
+        'document_url': document_url,
+        'content_hash': digest,
+        'chunks': chunks,
+        'vector_ids': [vector_id(doc_id, c['chunk_id']) for c in chunks],
+    }
+
+
+class LRUDocumentCache:
+    """Thread-safe in-memory LRU of document entries keyed by doc_id."""
+
+    def __init__(self, max_entries: int = DOC_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None:
+                self._entries.move_to_end(doc_id)
+            return entry
+
+    def put(self, entry: Dict):
+        with self._lock:
+            self._entries[entry['doc_id']] = entry
+            self._entries.move_to_end(entry['doc_id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PersistentDocumentCache:
+    """Rebuilds document entries from the rows ingestion wrote to document_chunks.
+
+    Rows are committed batch by batch during an ingest, so a document is only
+    served once its ingested_documents marker exists and its row count still
+    matches the marker's; anything else is a partial or superseded ingest.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        from app.crud import get_completed_document, get_document_chunks
+        db = self.session_factory()
+        try:
+            marker = get_completed_document(db, doc_id)
+            rows = get_document_chunks(db, doc_id) if marker is not None else []
+        except Exception as e:
+            log_event('doc_cache_read_error', doc_id=doc_id, error=str(e))
+            return None
+        finally:
+            db.close()
+        if not rows or len(rows) != marker.chunk_count:
+            return None
+        chunks = [
+            {'text': r.chunk_text, 'chunk_id': r.chunk_id, 'token_count': r.token_count,
+             'ordinal': r.ordinal, 'page': r.page}
+            for r in rows
+        ]
+        return make_entry(doc_id, marker.document_url, marker.content_hash, chunks)
+
+    def mark_complete(self, entry: Dict):
+        from app.crud import mark_document_complete
+        db = self.session_factory()
+        try:
+            mark_document_complete(db, entry['doc_id'], entry['document_url'], entry.get('content_hash'),
+                                   len(entry['chunks']))
+        finally:
+            db.close()
+
+    def discard(self, doc_id: str):
+        """Delete whatever a failed ingest of doc_id left behind."""
+        from app.crud import delete_document
+        db = self.session_factory()
+        try:
+            deleted = delete_document(db, doc_id)
+            if deleted:
+                log_event('ingest_discarded', doc_id=doc_id, rows=deleted)
+        except Exception as e:
+            log_event('ingest_discard_error', doc_id=doc_id, error=str(e))
+        finally:
+            db.close()
+
+
+class DocumentCache:
+    """Two-tier document cache plus a validator -> doc_id alias map."""
+
+    def __init__(self, memory: LRUDocumentCache, persistent: Optional[PersistentDocumentCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self._aliases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        entry = self.memory.get(doc_id)
+        if entry is None and self.persistent is not None:
+            entry = self.persistent.get(doc_id)
+            if entry is not None:
+                self.memory.put(entry)
+        return entry
+
+    def get_by_validators(self, key: Optional[str]) -> Optional[Dict]:
+        if key is None:
+            return None
+        with self._lock:
+            doc_id = self._aliases.get(key)
+        return self.get(doc_id) if doc_id else None
+
+    def put(self, entry: Dict, validators_key: Optional[str] = None):
+        """Cache a completely ingested document, marking it complete in the persistent tier."""
+        if self.persistent is not None:
+            self.persistent.mark_complete(entry)
+        self.memory.put(entry)
+        if validators_key is not None:
+            self.alias(validators_key, entry['doc_id'])
+
+    def discard(self, doc_id: str):
+        if self.persistent is not None:
+            self.persistent.discard(doc_id)
+
+    def alias(self, key: str, doc_id: str):
+        with self._lock:
+            self._aliases[key] = doc_id
+            self._aliases.move_to_end(key)
+            while len(self._aliases) > self.memory.max_entries * 4:
+                self._aliases.popitem(last=False)
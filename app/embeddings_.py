@@ -1,3 +1,198 @@
-# Placeholder embedding stub - replace with real embeddings (OpenAI or local)
+"""Text embeddings with a pluggable backend and a persistent cache.
+
+Backends:
+- ``local``: a CPU-only sentence-transformers model (optional dependency)
+- ``hashing``: deterministic feature hashing over word unigrams and bigrams,
+  needs nothing but NumPy and works offline
+- ``auto`` (default): ``local`` if it can be loaded, otherwise ``hashing``
+
+Vectors are cached in SQLite keyed by (model name, text hash), so a chunk is
+never embedded twice across requests or restarts.
+"""
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.metrics import log_event
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'auto')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '384'))  # hashing backend only
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))  # 0 keeps the library default
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '.cache/embeddings.sqlite3')  # empty disables
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams, log-scaled and L2-normalised."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text: str):
+        words = _TOKEN_RE.findall(text.lower())
+        grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        return [zlib.crc32(g.encode('utf-8')) for g in grams]
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for i, text in enumerate(texts):
+            h = self._features(text)
+            hashes.extend(h)
+            rows.extend([i] * len(h))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            cols = (hashes % self.dim).astype(np.intp)
+            # The top bit picks the sign so collisions tend to cancel out
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(out, (np.asarray(rows, dtype=np.intp), cols), signs)
+            np.copyto(out, np.sign(out) * np.log1p(np.abs(out)))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class LocalModelEmbedder:
+    """CPU-only sentence-transformers model."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, threads: int = EMBEDDING_THREADS,
+                 batch_size: int = EMBEDDING_BATCH_SIZE):
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+        self.batch_size = batch_size
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+
+class EmbeddingCache:
+    """SQLite-backed cache of vectors keyed by (model, sha1(text))."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings '
+            '(model TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, key))'
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+    def get_many(self, model: str, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})',
+                    [model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[bytes, np.ndarray]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)',
+                [(model, key, np.ascontiguousarray(vec, dtype=np.float32).tobytes()) for key, vec in items.items()]
+            )
+
+
+_embedder = None
+_cache = None
+_init_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _init_lock:
+            if _embedder is None:
+                if EMBEDDING_BACKEND in ('auto', 'local'):
+                    try:
+                        _embedder = LocalModelEmbedder()
+                    except Exception as e:
+                        if EMBEDDING_BACKEND == 'local':
+                            raise
+                        log_event('embedder_fallback', backend='hashing', error=str(e))
+                if _embedder is None:
+                    _embedder = HashingEmbedder()
+    return _embedder
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    if _cache is None and EMBEDDING_CACHE_PATH:
+        with _init_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+    return _cache
+
+
+def get_embeddings(texts: Sequence[str], embedder=None, cache: Optional[EmbeddingCache] = None,
+                   batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """Embed texts as a C-contiguous float32 matrix of shape (len(texts), dim).
+
+    Cached vectors are reused; the rest are encoded in batches of
+    ``batch_size`` (each distinct text once) and written back to the cache.
+    """
+    embedder = embedder or get_embedder()
+    cache = cache if cache is not None else get_cache()
+    out = np.empty((len(texts), embedder.dim), dtype=np.float32)
+    if not texts:
+        return out
+
+    keys = [EmbeddingCache.key(t) for t in texts]
+    cached = cache.get_many(embedder.name, list(set(keys))) if cache is not None else {}
+
+    missing = {}
+    for i, key in enumerate(keys):
+        vec = cached.get(key)
+        if vec is not None:
+            out[i] = vec
+        else:
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        pending = list(missing.items())
+        computed = {}
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = embedder.encode([texts[rows[0]] for _, rows in batch])
+            for (key, rows), vec in zip(batch, vectors):
+                out[rows] = vec
+                computed[key] = vec
+        if cache is not None:
+            cache.put_many(embedder.name, computed)
+    return out
+
+
 def get_embedding(text: str):
-    return [abs(hash(text)) % 1000] * 1536
+    return get_embeddings([text])[0].tolist()
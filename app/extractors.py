@@ -1,8 +1,322 @@
-import requests, io
+"""Document download and page-aware text extraction.
+
+Downloads are streamed into a spool that stays in memory for small files and
+rolls over to a temporary file for large ones, and are refused past
+MAX_DOCUMENT_MB. The document type is taken
+from magic bytes, falling back to Content-Type and the URL, and each
+extractor yields ``{'page': n, 'text': ...}`` dicts lazily. Large PDFs can
+be extracted in a process pool.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, Iterator, Optional
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = int(os.getenv('EXTRACT_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '100'))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '0'))  # 0 uses os.cpu_count()
+MAX_DOCUMENT_BYTES = int(float(os.getenv('MAX_DOCUMENT_MB', '0')) * 1024 * 1024)  # 0 disables the limit
+
+_CHARSET_RE = re.compile(r'charset=([\w-]+)', re.I)
+
+
+class DocumentTooLarge(ValueError):
+    """Raised when a document is bigger than the download size limit."""
+
+
+class DownloadError(IOError):
+    """Raised when a document URL can't be fetched (error status, connection failure, timeout)."""
+
+
+class Download:
+    """A downloaded document spooled to memory or, past max_memory, to disk."""
+
+    def __init__(self, url: str, content_type: str = '', headers: Optional[Dict[str, str]] = None,
+                 max_memory: int = SPOOL_MAX_MEMORY):
+        self.url = url
+        self.content_type = content_type.lower()
+        self.headers = headers or {}
+        self.max_memory = max_memory
+        self.size = 0
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self._sha256.update(data)
+        self.size += len(data)
+        if self._file is None and self.size > self.max_memory:
+            self.spill()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer.write(data)
+
+    def spill(self) -> str:
+        """Move the download to a temporary file, if it isn't in one yet, and
+        return its path, e.g. for worker processes that open it by name."""
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(prefix='hackrx-', delete=False)
+            self.path = self._file.name
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        self._file.flush()
+        return self.path
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+        return self
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        validators = {}
+        if self.headers.get('ETag'):
+            validators['etag'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            validators['last_modified'] = self.headers['Last-Modified']
+        return validators
+
+    def open(self):
+        if self.path:
+            return open(self.path, 'rb')
+        return io.BytesIO(self._buffer.getbuffer())
+
+    def getvalue(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def head(self, n: int = 512) -> bytes:
+        with self.open() as f:
+            return f.read(n)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._buffer = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def download(url: str, timeout: int = 20, max_memory: Optional[int] = None,
+             max_bytes: Optional[int] = None) -> Download:
+    """Stream url into a Download, spilling to disk past max_memory bytes.
+
+    Raises DocumentTooLarge as soon as the declared Content-Length or the bytes
+    received exceed max_bytes (default MAX_DOCUMENT_BYTES; 0 means no limit),
+    and DownloadError if the request fails.
+    """
+    import requests
+    max_bytes = MAX_DOCUMENT_BYTES if max_bytes is None else max_bytes
+    try:
+        with requests.get(url, timeout=timeout, stream=True) as r:
+            r.raise_for_status()
+            declared = r.headers.get('Content-Length')
+            if max_bytes and declared and declared.isdigit() and int(declared) > max_bytes:
+                raise DocumentTooLarge(f'Document is {int(declared)} bytes; the limit is {max_bytes}')
+            blob = Download(url, r.headers.get('Content-Type', ''), dict(r.headers),
+                            max_memory=SPOOL_MAX_MEMORY if max_memory is None else max_memory)
+            try:
+                for data in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    blob.write(data)
+                    if max_bytes and blob.size > max_bytes:
+                        raise DocumentTooLarge(f'Document exceeds the limit of {max_bytes} bytes')
+            except BaseException:
+                # A body spilled to disk would otherwise stay there for good
+                blob.close()
+                raise
+    except requests.RequestException as e:
+        raise DownloadError(f'Could not download {url}: {str(e) or type(e).__name__}') from e
+    return blob.finish()
+
+
+def sniff_kind(blob: Download) -> str:
+    """Pick an extractor from magic bytes, then Content-Type, then the URL."""
+    head = blob.head()
+    url = blob.url.lower().split('?', 1)[0]
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        with blob.open() as f:
+            try:
+                if 'word/document.xml' in zipfile.ZipFile(f).namelist():
+                    return 'docx'
+            except zipfile.BadZipFile:
+                pass
+    if 'pdf' in blob.content_type:
+        return 'pdf'
+    if 'html' in blob.content_type:
+        return 'html'
+    if not blob.content_type.startswith('text/'):
+        if url.endswith('.pdf'):
+            return 'pdf'
+        if url.endswith(('.html', '.htm')):
+            return 'html'
+    if head.lstrip().lower().startswith((b'<!doctype html', b'<html')):
+        return 'html'
+    return 'text'
+
+
+def _pdf_page_range(path: str, start: int, stop: int):
+    import pymupdf
+    with pymupdf.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(blob: Download, workers: int = PDF_WORKERS,
+                   parallel_min_pages: int = PDF_PARALLEL_MIN_PAGES) -> Iterator[Dict]:
+    import pymupdf
+    doc = pymupdf.open(blob.path) if blob.path else pymupdf.open(stream=blob.getvalue(), filetype='pdf')
+    with doc:
+        page_count = doc.page_count
+        if page_count < parallel_min_pages:
+            for i in range(page_count):
+                yield {'page': i + 1, 'text': doc[i].get_text()}
+            return
+    # Workers open the PDF by path, so a download still held in memory is spilled first
+    yield from _iter_pdf_pages_parallel(blob.spill(), page_count, workers or os.cpu_count() or 1)
+
+
+def _iter_pdf_pages_parallel(path: str, page_count: int, workers: int) -> Iterator[Dict]:
+    # Small ranges keep pages flowing to the caller in order while workers stay busy
+    step = max(1, min(16, page_count // (workers * 4) or 1))
+    ranges = [(s, min(s + step, page_count)) for s in range(0, page_count, step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_pdf_page_range, path, s, e) for s, e in ranges]
+        for (start, _), future in zip(ranges, futures):
+            for offset, text in enumerate(future.result()):
+                yield {'page': start + offset + 1, 'text': text}
+
+
+def iter_docx_pages(blob: Download) -> Iterator[Dict]:
+    """Paragraph and table text, split into pages at explicit page breaks."""
+    import docx
+    with blob.open() as f:
+        document = docx.Document(f)
+    page, lines = 1, []
+    body = document.element.body
+    for child in body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            xml = child.xml
+            if lines and ('w:type="page"' in xml or 'lastRenderedPageBreak' in xml):
+                yield {'page': page, 'text': '\n'.join(lines)}
+                page, lines = page + 1, []
+            text = ''.join(t.text or '' for t in child.iter() if t.tag.endswith('}t'))
+            if text:
+                lines.append(text)
+        elif tag == 'tbl':
+            for row in child.iter():
+                if row.tag.endswith('}tr'):
+                    cells = [''.join(t.text or '' for t in cell.iter() if t.tag.endswith('}t'))
+                             for cell in row if cell.tag.endswith('}tc')]
+                    lines.append(' | '.join(cells))
+    if lines:
+        yield {'page': page, 'text': '\n'.join(lines)}
+
+
+class _HTMLText(HTMLParser):
+    _SKIP = {'script', 'style', 'noscript', 'head'}
+    _BLOCK = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BLOCK:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def _text_encoding(blob: Download) -> str:
+    m = _CHARSET_RE.search(blob.content_type)
+    return m.group(1) if m else 'utf-8'
+
+
+def iter_html_pages(blob: Download) -> Iterator[Dict]:
+    parser = _HTMLText()
+    with blob.open() as f:
+        reader = io.TextIOWrapper(f, encoding=_text_encoding(blob), errors='replace')
+        for block in iter(lambda: reader.read(DOWNLOAD_CHUNK_SIZE), ''):
+            parser.feed(block)
+    parser.close()
+    yield {'page': 1, 'text': ''.join(parser.parts)}
+
+
+def iter_text_pages(blob: Download) -> Iterator[Dict]:
+    """Plain text, one page per form feed, read incrementally."""
+    page, pending = 1, ''
+    with blob.open() as f:
+        reader = io.TextIOWrapper(f, encoding=_text_encoding(blob), errors='replace')
+        for block in iter(lambda: reader.read(DOWNLOAD_CHUNK_SIZE), ''):
+            *done, pending = (pending + block).split('\f')
+            for text in done:
+                yield {'page': page, 'text': text}
+                page += 1
+    if pending:
+        yield {'page': page, 'text': pending}
+
+
+EXTRACTORS = {
+    'pdf': iter_pdf_pages,
+    'docx': iter_docx_pages,
+    'html': iter_html_pages,
+    'text': iter_text_pages,
+}
+
+
+def iter_pages(blob: Download) -> Iterator[Dict]:
+    """Lazily yield {'page': n, 'text': ...} for a downloaded document."""
+    return EXTRACTORS[sniff_kind(blob)](blob)
+
+
 def fetch_blob_text(url: str):
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    content_type = r.headers.get('Content-Type','').lower()
-    text = r.text
-    pages = [{'page': None, 'text': text}]
+    with download(url) as blob:
+        pages = list(iter_pages(blob))
+    text = "\n".join(p['text'] for p in pages)
     return text, pages
+
+
+def probe_validators(url: str):
+    """Return the ETag/Last-Modified validators for url, or {} if unavailable."""
+    import requests
+    try:
+        r = requests.head(url, timeout=5, allow_redirects=True)
+        r.raise_for_status()
+    except requests.RequestException:
+        return {}
+    validators = {}
+    if r.headers.get('ETag'):
+        validators['etag'] = r.headers['ETag']
+    if r.headers.get('Last-Modified'):
+        validators['last_modified'] = r.headers['Last-Modified']
+    return validators
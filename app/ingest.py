@@ -0,0 +1,243 @@
+import os
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional
+import numpy as np
+from app.extractors import DocumentTooLarge, DownloadError, download, iter_pages, probe_validators
+from app.utils.chunking import ChunkRecord, TextBuffer, iter_chunks, clean_text, text_released
+from app.utils.memory import MemoryBudget
+from app.retriever import upsert_chunks, upsert_embeddings, flush_vectors, has_vectors, fetch_vectors
+from app.lexical_index import lexical_index
+from app.embeddings_ import get_embeddings, get_embedder
+from app.pipeline import IngestPipeline
+from app.db import SessionLocal, advisory_lock
+from app.utils.single_flight import SingleFlight
+from app.crud import create_chunks, content_hash, get_indexed_hashes
+from app.metrics import STAGE_SECONDS, log_event, record_cache
+from app.doc_cache import (
+    DocumentCache, LRUDocumentCache, PersistentDocumentCache,
+    make_entry, stable_doc_id, validator_key,
+)
+
+INGEST_ADVISORY_LOCK = os.getenv('INGEST_ADVISORY_LOCK', '1') == '1'
+INGEST_LOCK_TIMEOUT = float(os.getenv('INGEST_LOCK_TIMEOUT', '120'))
+# Low-memory mode: chunks are offsets into one buffer per document, and the
+# text is dropped once it is persisted and indexed (answers read it back from
+# the database)
+INGEST_LOW_MEMORY = os.getenv('INGEST_LOW_MEMORY', '0') == '1'
+INGEST_MEMORY_BUDGET_BYTES = int(float(os.getenv('INGEST_MEMORY_BUDGET_MB', '0')) * 1024 * 1024)  # 0 disables
+INGEST_MEMORY_WAIT = float(os.getenv('INGEST_MEMORY_WAIT', '120'))
+
+class IngestError(RuntimeError):
+    """Raised when a document could not be ingested; nothing of it is kept."""
+
+
+document_cache = DocumentCache(LRUDocumentCache(), PersistentDocumentCache(SessionLocal))
+_inflight = SingleFlight()
+# Total size of the documents this process is ingesting at once
+ingest_budget = MemoryBudget(INGEST_MEMORY_BUDGET_BYTES)
+
+
+def _persist_chunks(doc_url: str, doc_id: str, chunks, embedding_model: str = None, seen: Optional[set] = None):
+    db = SessionLocal()
+    try:
+        return create_chunks(db, document_url=doc_url, chunks=chunks, doc_id=doc_id,
+                             embedding_model=embedding_model, seen=seen)
+    finally:
+        db.close()
+
+
+def _indexed_hashes(doc_url: str, embedding_model: str) -> Dict:
+    db = SessionLocal()
+    try:
+        return get_indexed_hashes(db, doc_url, embedding_model)
+    except Exception as e:
+        log_event('indexed_chunks_error', document_url=doc_url, error=str(e))
+        return {}
+    finally:
+        db.close()
+
+
+def _incremental_embed(previous: Dict, counts: Dict):
+    """embed(texts) that reuses the stored vectors of chunks already indexed for this URL.
+
+    ``previous`` maps content hash -> (doc_id, chunk_id) of an earlier ingest
+    with the same embedding model; only new or changed texts are embedded.
+    """
+    def embed(texts):
+        keys = [previous.get(content_hash(clean_text(t))) for t in texts]
+        reused = fetch_vectors([k for k in keys if k is not None]) if previous else {}
+        rows = [reused.get(k) if k is not None else None for k in keys]
+        missing = [i for i, v in enumerate(rows) if v is None]
+        counts['reused'] += len(texts) - len(missing)
+        if missing:
+            for i, vec in zip(missing, get_embeddings([texts[i] for i in missing])):
+                rows[i] = vec
+        return np.ascontiguousarray(np.vstack(rows), dtype=np.float32)
+    return embed
+
+
+def _run_pipeline(doc_url: str, doc_id: str, pages, low_memory: bool = None):
+    low_memory = INGEST_LOW_MEMORY if low_memory is None else low_memory
+    buffer = TextBuffer() if low_memory else None
+    sink_seconds = {'persist': 0.0, 'upsert': 0.0}
+    embedding_model = get_embedder().name
+    previous = _indexed_hashes(doc_url, embedding_model)
+    counts = {'reused': 0}
+    # Content hashes stored so far: a chunk repeating text from an earlier batch
+    # is dropped, since ON CONFLICT would move that batch's row to it
+    stored_hashes = set()
+
+    def sink(batch, vectors):
+        start = time.perf_counter()
+        kept = _persist_chunks(doc_url, doc_id, batch, embedding_model, stored_hashes)
+        persisted = time.perf_counter()
+        sink_seconds['persist'] += persisted - start
+        if kept:
+            rows = {c['chunk_id']: i for i, c in enumerate(batch)}
+            upsert_embeddings(doc_id, kept, vectors[[rows[c['chunk_id']] for c in kept]], flush=False)
+            sink_seconds['upsert'] += time.perf_counter() - persisted
+        return kept
+
+    pipeline = IngestPipeline(lambda pages: iter_chunks(pages, buffer=buffer), _incremental_embed(previous, counts),
+                              sink)
+    try:
+        chunks = pipeline.run(pages)
+        start = time.perf_counter()
+        flush_vectors(doc_id)
+        sink_seconds['upsert'] += time.perf_counter() - start
+    finally:
+        report = pipeline.report()
+        for stage in ('extract', 'chunk', 'embed'):
+            STAGE_SECONDS.observe(report['stages'][stage]['busy_seconds'], stage=stage)
+        for stage, seconds in sink_seconds.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+    if chunks:
+        # The lexical index needs document-wide term statistics, so it is built once all chunks are in
+        with STAGE_SECONDS.time(stage='lexical'):
+            lexical_index.build(doc_id, chunks)
+    if buffer is not None:
+        buffer.release()
+    log_event('ingest', document_url=doc_url, doc_id=doc_id, chunks=len(chunks),
+              reused_vectors=counts['reused'], text_chars=len(buffer) if buffer is not None else None, **report)
+    return chunks
+
+
+def _ensure_indexed(entry: Dict, cache: DocumentCache = document_cache) -> Dict:
+    # A persistent-tier hit may predate an in-memory vector index restart;
+    # re-upserting is cheap because the embeddings are cached
+    doc_id, chunks = entry['doc_id'], entry['chunks']
+    missing_vectors = bool(chunks) and not has_vectors(doc_id)
+    missing_lexical = bool(chunks) and lexical_index.get(doc_id) is None
+    if (missing_vectors or missing_lexical) and text_released(chunks):
+        stored = cache.persistent.get(doc_id) if cache.persistent is not None else None
+        chunks = stored['chunks'] if stored else []
+    if missing_vectors and chunks:
+        upsert_chunks(doc_id, chunks)
+    if missing_lexical and chunks:
+        lexical_index.build(doc_id, chunks)
+    if INGEST_LOW_MEMORY and entry['chunks'] and not text_released(entry['chunks']):
+        # Entries rebuilt from the database keep only what retrieval needs, too
+        entry['chunks'] = [ChunkRecord.without_text(c) for c in entry['chunks']]
+    return entry
+
+
+def load_document(doc_id: str, cache: DocumentCache = document_cache) -> Optional[Dict]:
+    """Entry for an already-ingested doc_id, indexed and ready for retrieval, or None."""
+    entry = cache.get(doc_id)
+    record_cache('document', entry is not None, entry is None)
+    return _ensure_indexed(entry, cache) if entry is not None else None
+
+
+def _ingest_lock(doc_id: str):
+    if not INGEST_ADVISORY_LOCK:
+        return nullcontext(True)
+    return advisory_lock(f'ingest:{doc_id}', timeout=INGEST_LOCK_TIMEOUT)
+
+
+def ingest_document(doc_url: str, cache: DocumentCache = document_cache) -> Dict:
+    """Fetch, chunk, persist and upsert a document unless it is already cached.
+
+    Concurrent calls for the same URL in this process share one ingest; across
+    workers, ingests of the same content are serialised by a Postgres advisory
+    lock on the doc_id, and whoever waited picks the finished document up from
+    the database instead of ingesting it again.
+
+    Extraction, chunking, embedding and persistence/upsert overlap through the
+    bounded-queue pipeline in app.pipeline. When the URL was ingested before
+    with different content, chunks whose text is unchanged reuse their stored
+    vectors and only new or changed chunks are embedded.
+
+    If the download or the pipeline fails, IngestError is raised; rows the
+    pipeline already committed are deleted first. Documents over MAX_DOCUMENT_MB are refused with DocumentTooLarge, and
+    the pipeline runs only once the document's size fits in this process's
+    INGEST_MEMORY_BUDGET_MB (DocumentTooLarge if it is bigger than the whole
+    budget, MemoryLimitExceeded if it doesn't fit within INGEST_MEMORY_WAIT
+    seconds). In INGEST_LOW_MEMORY mode the returned chunks
+    are ChunkRecords whose text has been released; retrieval reads it back
+    from the database.
+
+    Returns the cache entry (doc_id, chunks, vector_ids). A URL whose
+    ETag/Last-Modified matches a cached entry skips the download entirely; any
+    other repeat skips extraction, chunking, persistence and upsert once the
+    downloaded bytes are hashed.
+    """
+    entry, shared = _inflight.do(doc_url, lambda: _ingest_document(doc_url, cache))
+    if shared:
+        record_cache('ingest_inflight', 1, 0)
+    return entry
+
+
+def _ingest_document(doc_url: str, cache: DocumentCache) -> Dict:
+    vkey = validator_key(doc_url, probe_validators(doc_url))
+    entry = cache.get_by_validators(vkey)
+    if entry is not None:
+        record_cache('document', 1, 0)
+        return _ensure_indexed(entry, cache)
+
+    with STAGE_SECONDS.time(stage='fetch'):
+        try:
+            blob = download(doc_url)
+        except DownloadError as e:
+            log_event('ingest_error', document_url=doc_url, error=str(e))
+            raise IngestError(str(e)) from e
+    with blob:
+        if ingest_budget.enabled and blob.size > ingest_budget.capacity:
+            # It could never fit, so waiting (or asking the client to retry) won't help
+            raise DocumentTooLarge(f'Document is {blob.size} bytes; the ingest memory budget is '
+                                   f'{ingest_budget.capacity} bytes')
+        digest = blob.sha256
+        doc_id = stable_doc_id(doc_url, digest)
+        # The GET response's own validators let the next request skip the download
+        vkey = vkey or validator_key(doc_url, blob.validators)
+
+        entry = cache.memory.get(doc_id)
+        if entry is None:
+            # The persistent tier is only read under the lock: another worker
+            # may be halfway through writing this document's rows
+            with _ingest_lock(doc_id) as locked:
+                if not locked:
+                    log_event('ingest_lock_timeout', document_url=doc_url, doc_id=doc_id)
+                entry = cache.get(doc_id)
+                record_cache('document', entry is not None, entry is None)
+                if entry is None:
+                    with ingest_budget.reserve(blob.size, timeout=INGEST_MEMORY_WAIT):
+                        try:
+                            chunks = _run_pipeline(doc_url, doc_id, iter_pages(blob))
+                        except Exception as e:
+                            log_event('ingest_error', document_url=doc_url, doc_id=doc_id, error=str(e))
+                            # Batches already committed would otherwise look like the whole document
+                            cache.discard(doc_id)
+                            raise IngestError(f'Could not ingest {doc_url}: {str(e) or type(e).__name__}') from e
+                    entry = make_entry(doc_id, doc_url, digest, chunks)
+                    if chunks:
+                        # Only complete ingests get a completion marker and are cached,
+                        # so a document with no text is tried again next time
+                        cache.put(entry, vkey)
+                    return entry
+        else:
+            record_cache('document', 1, 0)
+
+    if vkey is not None:
+        cache.alias(vkey, doc_id)
+    return _ensure_indexed(entry, cache)
@@ -0,0 +1,145 @@
+"""Background ingestion: a Postgres-backed job queue drained by asyncio workers.
+
+``enqueue`` inserts a queued row into ``ingest_jobs`` and returns its id as
+the document handle. Workers claim the oldest queued job with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so workers in any number of processes
+can share the table, and run ``ingest_document`` in a thread; extraction and
+embedding inside it already run on the ingest pipeline's own threads. A job
+left 'running' by a worker that died is claimed again after
+INGEST_JOB_STALE_SECONDS, up to INGEST_JOB_MAX_ATTEMPTS times.
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+from app import crud
+from app.db import AsyncSessionLocal
+from app.ingest import ingest_document
+from app.metrics import STAGE_SECONDS, log_event
+
+INGEST_JOB_POLL_SECONDS = float(os.getenv('INGEST_JOB_POLL_SECONDS', '1.0'))
+INGEST_JOB_STALE_SECONDS = float(os.getenv('INGEST_JOB_STALE_SECONDS', '600'))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv('INGEST_JOB_MAX_ATTEMPTS', '3'))
+
+FINISHED = ('done', 'failed')
+
+
+def job_status(job) -> Dict:
+    return {
+        'document_id': str(job.id),
+        'document_url': job.document_url,
+        'status': job.status,
+        'doc_id': job.doc_id,
+        'chunks': job.chunk_count,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def _parse_handle(handle: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(handle)
+    except (TypeError, ValueError):
+        return None
+
+
+async def get_job(handle: str) -> Optional[Dict]:
+    job_id = _parse_handle(handle)
+    if job_id is None:
+        return None
+    async with AsyncSessionLocal() as db:
+        job = await crud.get_ingest_job_async(db, job_id)
+        return job_status(job) if job is not None else None
+
+
+async def wait_for_job(handle: str, timeout: float, poll_interval: float = 0.25) -> Optional[Dict]:
+    """Poll a job until it is done or failed, or until timeout; returns its last status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await get_job(handle)
+        if job is None or job['status'] in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(poll_interval)
+
+
+class IngestWorkerPool:
+    """asyncio worker tasks draining the ingest_jobs table."""
+
+    def __init__(self, poll_interval: float = INGEST_JOB_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self, workers: int):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f'ingest-worker-{n}') for n in range(workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers now instead of at their next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run_once(self) -> bool:
+        """Claim and process one job; returns False when the queue is empty."""
+        async with AsyncSessionLocal() as db:
+            job = await crud.claim_ingest_job_async(db, INGEST_JOB_STALE_SECONDS)
+        if job is None:
+            return False
+        if job.attempts > INGEST_JOB_MAX_ATTEMPTS:
+            await self._finish(job.id, error=f'Gave up after {job.attempts - 1} attempts')
+            return True
+
+        started = time.perf_counter()
+        try:
+            doc = await asyncio.to_thread(ingest_document, job.document_url)
+        except Exception as e:
+            # ingest_document raises on every failure (IngestError for a failed pipeline,
+            # whose partial rows it already discarded); a document without text just has no chunks
+            log_event('ingest_job', document_id=str(job.id), document_url=job.document_url, status='failed',
+                      error=str(e))
+            await self._finish(job.id, error=str(e) or type(e).__name__)
+            return True
+
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage='ingest_job')
+        await self._finish(job.id, doc_id=doc['doc_id'], chunk_count=len(doc['chunks']))
+        log_event('ingest_job', document_id=str(job.id), document_url=job.document_url, doc_id=doc['doc_id'],
+                  chunks=len(doc['chunks']), seconds=round(elapsed, 4))
+        return True
+
+    async def _finish(self, job_id, **fields):
+        async with AsyncSessionLocal() as db:
+            await crud.finish_ingest_job_async(db, job_id, **fields)
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                log_event('ingest_job_error', error=str(e))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+worker_pool = IngestWorkerPool()
+
+
+async def enqueue(document_url: str) -> Dict:
+    async with AsyncSessionLocal() as db:
+        job = await crud.create_ingest_job_async(db, document_url)
+    worker_pool.notify()
+    return job_status(job)
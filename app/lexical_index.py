@@ -0,0 +1,161 @@
+"""In-memory BM25 index per document, for hybrid lexical + vector retrieval.
+
+Postings are stored CSR-style in flat numpy arrays: for term t, the chunks
+containing it are ``rows[offsets[t]:offsets[t + 1]]`` and their precomputed
+BM25 term weights sit at the same positions in ``weights``. Scoring a batch
+of queries is then a handful of slice-and-add operations over the document's
+chunks instead of a Python loop over postings.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+LEXICAL_INDEX_SIZE = int(os.getenv('LEXICAL_INDEX_SIZE', '256'))  # documents kept in memory
+BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+BM25_B = float(os.getenv('BM25_B', '0.75'))
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, ids: Sequence[str], texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.ids = list(ids)
+        self.vocab: Dict[str, int] = {}
+        n = len(self.ids)
+        lengths = np.zeros(n, dtype=np.float32)
+        # Each chunk's own (term, tf) postings, as int32 arrays: memory grows with
+        # distinct terms per chunk rather than with every token of the document
+        terms_by_row, tf_by_row = [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            ids = np.fromiter((self.vocab.setdefault(t, len(self.vocab)) for t in tokens),
+                              dtype=np.int32, count=len(tokens))
+            terms, counts = np.unique(ids, return_counts=True)
+            terms_by_row.append(terms)
+            tf_by_row.append(counts.astype(np.float32))
+        sizes_by_row = [len(t) for t in terms_by_row]
+        posting_terms = np.concatenate(terms_by_row) if n else np.zeros(0, dtype=np.int32)
+        rows = np.repeat(np.arange(n, dtype=np.int32), sizes_by_row)
+        tf = np.concatenate(tf_by_row) if n else np.zeros(0, dtype=np.float32)
+        del terms_by_row, tf_by_row
+
+        # A stable sort by term keeps rows ascending within a term: CSR posting order
+        order = np.argsort(posting_terms, kind='stable')
+        posting_terms, self.rows, tf = posting_terms[order], rows[order], tf[order]
+        del order, rows
+        sizes = np.bincount(posting_terms, minlength=len(self.vocab))
+        self.offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+
+        avgdl = float(lengths.mean()) if n and lengths.mean() > 0 else 1.0
+        idf = np.log1p((n - sizes + 0.5) / (sizes + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / avgdl)
+        self.weights = (idf[posting_terms] * tf * (k1 + 1) / (tf + norm[self.rows])).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is not None:
+                lo, hi = self.offsets[t], self.offsets[t + 1]
+                # Rows are unique within a posting list, so fancy-index += is safe
+                out[self.rows[lo:hi]] += self.weights[lo:hi]
+        return out
+
+    def search_batch(self, queries: Sequence[str], k: int) -> List[List[Tuple[str, float]]]:
+        results = []
+        for query in queries:
+            scores = self.scores(query)
+            top = np.flatnonzero(scores)
+            if len(top) > k:
+                top = top[np.argpartition(-scores[top], k - 1)[:k]]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append([(self.ids[i], float(scores[i])) for i in top])
+        return results
+
+
+class LexicalIndex:
+    """BM25 indexes keyed by doc_id, least-recently-used evicted past max_docs."""
+
+    def __init__(self, max_docs: int = LEXICAL_INDEX_SIZE):
+        self.max_docs = max_docs
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, doc_id: str, chunks: Iterable[Dict]) -> BM25Index:
+        chunks = list(chunks)
+        # Texts are read one at a time, so chunks backed by a shared buffer aren't all copied out at once
+        index = BM25Index([c['chunk_id'] for c in chunks], (c['text'] for c in chunks))
+        with self._lock:
+            self._indexes[doc_id] = index
+            self._indexes.move_to_end(doc_id)
+            while len(self._indexes) > self.max_docs:
+                self._indexes.popitem(last=False)
+        return index
+
+    def get(self, doc_id: str) -> Optional[BM25Index]:
+        with self._lock:
+            index = self._indexes.get(doc_id)
+            if index is not None:
+                self._indexes.move_to_end(doc_id)
+            return index
+
+    def get_or_build(self, doc_id: str, chunks: Optional[Iterable[Dict]]) -> Optional[BM25Index]:
+        index = self.get(doc_id)
+        if index is None and chunks:
+            index = self.build(doc_id, chunks)
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def rerank(question: str, hits: List[Dict], index: Optional[BM25Index] = None) -> List[Dict]:
+    """Cheap local reranker: idf-weighted query term coverage plus exact phrase bonus.
+
+    Rewards chunks that contain all of a question's rare terms (e.g. "grace
+    period", "AYUSH") over ones matching only some of them; ties keep the
+    fused order.
+    """
+    terms = list(dict.fromkeys(tokenize(question)))
+    if not terms or not hits:
+        return hits
+    if index is not None and len(index):
+        n = len(index)
+        sizes = {t: index.offsets[index.vocab[t] + 1] - index.offsets[index.vocab[t]] for t in terms if t in index.vocab}
+        idf = {t: float(np.log1p((n - sizes.get(t, 0) + 0.5) / (sizes.get(t, 0) + 0.5))) for t in terms}
+    else:
+        idf = {t: 1.0 for t in terms}
+    total = sum(idf.values()) or 1.0
+    bigrams = [f'{a} {b}' for a, b in zip(terms, terms[1:])]
+
+    def score(hit):
+        text = ' '.join(tokenize(hit.get('text') or ''))
+        words = set(text.split())
+        coverage = sum(idf[t] for t in terms if t in words) / total
+        phrases = sum(1 for p in bigrams if p in text) / len(bigrams) if bigrams else 0.0
+        return coverage + 0.5 * phrases
+
+    scored = [(score(h), i, h) for i, h in enumerate(hits)]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [h for _, _, h in scored]
+
+
+lexical_index = LexicalIndex()
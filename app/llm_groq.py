@@ -1,23 +1,45 @@
 import os
-from typing import Dict, Any, Optional
+import asyncio
+import random
+import time
+import weakref
+from typing import TYPE_CHECKING, Dict, Any, Optional
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-try:
-    from groq import Groq
-except Exception:
-    raise ImportError('Please install groq: pip install groq')
+from app.utils.rate_limit import RateLimiter, DeadlineExceeded
+from app.metrics import STAGE_SECONDS, LLM_REQUESTS, record_llm_usage
+
+if TYPE_CHECKING:
+    from groq import Groq, AsyncGroq
 
 # Configuration
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-if not GROQ_API_KEY:
-    raise EnvironmentError('Set GROQ_API_KEY')
 
 DEFAULT_MODEL = os.getenv('GROQ_MODEL', 'llama3-70b-8192')
 DEFAULT_MAX_TOKENS = int(os.getenv('GROQ_MAX_TOKENS', '1024'))  # Increased for detailed responses
 DEFAULT_TEMPERATURE = float(os.getenv('GROQ_TEMPERATURE', '0.1'))
 DEFAULT_TOP_P = float(os.getenv('GROQ_TOP_P', '0.9'))
 
-client = Groq(api_key=GROQ_API_KEY)
+# Async client settings
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL') or None  # None uses the SDK default
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', '20'))
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv('GROQ_REQUESTS_PER_MINUTE', '0'))  # 0 disables the limit
+GROQ_TOKENS_PER_MINUTE = float(os.getenv('GROQ_TOKENS_PER_MINUTE', '0'))
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '4'))
+GROQ_BACKOFF_BASE = float(os.getenv('GROQ_BACKOFF_BASE', '0.5'))
+GROQ_BACKOFF_MAX = float(os.getenv('GROQ_BACKOFF_MAX', '8'))
+GROQ_REQUEST_DEADLINE = float(os.getenv('GROQ_REQUEST_DEADLINE', '60'))
+
+# The groq SDK (and httpx under it) is imported and the clients are built on
+# first use, so importing the app doesn't pay for them
+_client: Optional['Groq'] = None
+
+limiter = RateLimiter(GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE)
+
+# One pooled AsyncGroq client per event loop; httpx connections can't be shared across loops.
+# Keyed weakly on the loop itself so a closed loop's entry goes away with it
+_async_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGroq]' = weakref.WeakKeyDictionary()
 
 SYSTEM_PROMPT = """You are an advanced insurance policy analyzer with expertise in providing detailed, accurate, and comprehensive responses about insurance policies. Your responses must follow these exact guidelines:
 
@@ -71,13 +93,81 @@ RESPONSE STRUCTURE:
 
 Remember: Your response must be as detailed and specific as the policy document allows. Never provide partial information when complete details are available."""
 
+def _sdk():
+    try:
+        import groq
+    except Exception:
+        raise ImportError('Please install groq: pip install groq')
+    return groq
+
+def _api_key() -> str:
+    if not GROQ_API_KEY:
+        raise EnvironmentError('Set GROQ_API_KEY')
+    return GROQ_API_KEY
+
+def get_client() -> 'Groq':
+    global _client
+    if _client is None:
+        _client = _sdk().Groq(api_key=_api_key())
+    return _client
+
+def _build_messages(prompt: str, system_prompt: str, user_context: Optional[Dict[str, str]]):
+    # Add context to system prompt if available
+    if user_context:
+        context_prompt = f"\nContext:\n- Current Time: {user_context.get('current_time', 'Not specified')}\n- User: {user_context.get('user_login', 'Anonymous')}\n"
+        enhanced_prompt = system_prompt + context_prompt
+    else:
+        enhanced_prompt = system_prompt
+
+    return [
+        {'role': 'system', 'content': enhanced_prompt},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def _build_result(resp, max_tokens: int, temperature: float, top_p: float,
+                  user_context: Optional[Dict[str, str]], model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    record_llm_usage(getattr(resp, 'usage', None))
+    if resp.choices:
+        choice = resp.choices[0]
+        metadata = {
+            'model': model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'top_p': top_p,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'context': user_context,
+            'finish_reason': choice.get('finish_reason') if isinstance(choice, dict) else getattr(choice, 'finish_reason', None)
+        }
+        if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
+            return {'answer': choice.message.content, 'raw': resp, 'metadata': metadata}
+        elif isinstance(choice, dict):
+            return {
+                'answer': choice.get('message', {}).get('content') or choice.get('text'),
+                'raw': resp,
+                'metadata': metadata
+            }
+
+    return {
+        'answer': 'Unable to generate response',
+        'raw': resp,
+        'error': 'Invalid response format'
+    }
+
+def _error_result(e) -> Dict[str, Any]:
+    return {
+        'answer': f'Error generating response: {str(e)}',
+        'raw': None,
+        'error': str(e)
+    }
+
 def run_llm(
     prompt: str,
     max_tokens: int = DEFAULT_MAX_TOKENS,
     temperature: float = DEFAULT_TEMPERATURE,
     top_p: float = DEFAULT_TOP_P,
     system_prompt: str = SYSTEM_PROMPT,
-    user_context: Dict[str, str] = None
+    user_context: Dict[str, str] = None,
+    model: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Enhanced LLM runner with context awareness and detailed response structure.
@@ -89,66 +179,168 @@ def run_llm(
         top_p (float): Nucleus sampling (0.9 for balanced responses)
         system_prompt (str): System behavior definition
         user_context (dict): User and time context
+        model (str): Groq model to call (default: GROQ_MODEL)
     """
-    # Add context to system prompt if available
-    if user_context:
-        context_prompt = f"\nContext:\n- Current Time: {user_context.get('current_time', 'Not specified')}\n- User: {user_context.get('user_login', 'Anonymous')}\n"
-        enhanced_prompt = system_prompt + context_prompt
-    else:
-        enhanced_prompt = system_prompt
-
-    messages = [
-        {'role': 'system', 'content': enhanced_prompt},
-        {'role': 'user', 'content': prompt}
-    ]
+    messages = _build_messages(prompt, system_prompt, user_context)
+    model = model or DEFAULT_MODEL
     
     try:
-        resp = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p
-        )
-        
-        if resp.choices:
-            choice = resp.choices[0]
-            if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
-                return {
-                    'answer': choice.message.content,
-                    'raw': resp,
-                    'metadata': {
-                        'model': DEFAULT_MODEL,
-                        'max_tokens': max_tokens,
-                        'temperature': temperature,
-                        'top_p': top_p,
-                        'timestamp': datetime.now(timezone.utc).isoformat(),
-                        'context': user_context
-                    }
-                }
-            elif isinstance(choice, dict):
-                return {
-                    'answer': choice.get('message', {}).get('content') or choice.get('text'),
-                    'raw': resp,
-                    'metadata': {
-                        'model': DEFAULT_MODEL,
-                        'max_tokens': max_tokens,
-                        'temperature': temperature,
-                        'top_p': top_p,
-                        'timestamp': datetime.now(timezone.utc).isoformat(),
-                        'context': user_context
-                    }
-                }
-        
-        return {
-            'answer': 'Unable to generate response',
-            'raw': resp,
-            'error': 'Invalid response format'
-        }
+        with STAGE_SECONDS.time(stage='llm'):
+            resp = get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p
+            )
+        LLM_REQUESTS.inc(outcome='ok')
+        return _build_result(resp, max_tokens, temperature, top_p, user_context, model)
         
     except Exception as e:
-        return {
-            'answer': f'Error generating response: {str(e)}',
-            'raw': None,
-            'error': str(e)
-        }
+        LLM_REQUESTS.inc(outcome='error')
+        return _error_result(e)
+
+def get_async_client() -> 'AsyncGroq':
+    """Shared AsyncGroq client with a pooled HTTP transport for the running loop.
+
+    SDK retries are disabled because run_llm_async does its own rate-limit-aware
+    retrying.
+    """
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        import httpx
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(GROQ_REQUEST_DEADLINE, connect=5.0)
+        )
+        async_client = _sdk().AsyncGroq(
+            api_key=_api_key(),
+            base_url=GROQ_BASE_URL,
+            max_retries=0,
+            http_client=http_client
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+async def warm_up_async_client():
+    """Import the SDK off the event loop and build this loop's client ahead of the first call."""
+    await asyncio.to_thread(_sdk)
+    get_async_client()
+
+async def close_async_client():
+    async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if async_client is not None:
+        await async_client.close()
+
+def _estimate_tokens(messages, max_tokens: int) -> int:
+    # Roughly four characters per token; close enough for budgeting
+    return sum(len(m['content']) for m in messages) // 4 + max_tokens
+
+def _retry_after(e) -> Optional[float]:
+    response = getattr(e, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(e) -> bool:
+    groq = _sdk()
+    if isinstance(e, (groq.APITimeoutError, groq.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(e, groq.APIStatusError):
+        return e.status_code in (408, 409, 429) or e.status_code >= 500
+    return False
+
+def _backoff_delay(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        # Honor the server's hint, with a little jitter so waiters don't stampede back
+        return retry_after + random.uniform(0, GROQ_BACKOFF_BASE)
+    # Full jitter exponential backoff
+    return random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt)))
+
+async def run_llm_async(
+    prompt: str,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    temperature: float = DEFAULT_TEMPERATURE,
+    top_p: float = DEFAULT_TOP_P,
+    system_prompt: str = SYSTEM_PROMPT,
+    user_context: Dict[str, str] = None,
+    deadline: Optional[float] = None,
+    model: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Async counterpart of run_llm using the shared pooled client.
+
+    Requests pass through the requests/min and tokens/min limiter, and 429s,
+    5xx responses, timeouts and connection errors are retried with jittered
+    exponential backoff that honors Retry-After.
+
+    Parameters:
+        deadline (float): time.monotonic() timestamp after which the call gives
+            up and returns an error result (default: now + GROQ_REQUEST_DEADLINE)
+        model (str): Groq model to call (default: GROQ_MODEL)
+    """
+    messages = _build_messages(prompt, system_prompt, user_context)
+    model = model or DEFAULT_MODEL
+    if deadline is None:
+        deadline = time.monotonic() + GROQ_REQUEST_DEADLINE
+    estimated_tokens = _estimate_tokens(messages, max_tokens)
+    try:
+        async_client = get_async_client()
+    except EnvironmentError as e:
+        LLM_REQUESTS.inc(outcome='error')
+        return _error_result(e)
+
+    attempt = 0
+    while True:
+        try:
+            reserved_tokens = await limiter.acquire(estimated_tokens, deadline=deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded('request deadline exceeded')
+            with STAGE_SECONDS.time(stage='llm'):
+                resp = await asyncio.wait_for(
+                    async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        timeout=remaining
+                    ),
+                    timeout=remaining
+                )
+            LLM_REQUESTS.inc(outcome='ok')
+            usage = getattr(resp, 'usage', None)
+            if usage is not None and getattr(usage, 'total_tokens', None):
+                limiter.record_usage(reserved_tokens, usage.total_tokens)
+            return _build_result(resp, max_tokens, temperature, top_p, user_context, model)
+
+        except DeadlineExceeded as e:
+            LLM_REQUESTS.inc(outcome='error')
+            return _error_result(e)
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= GROQ_MAX_RETRIES:
+                LLM_REQUESTS.inc(outcome='error')
+                return _error_result(e)
+            retry_after = _retry_after(e)
+            if retry_after is not None and getattr(e, 'status_code', None) == 429:
+                limiter.pause(retry_after)
+            delay = _backoff_delay(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                LLM_REQUESTS.inc(outcome='error')
+                return _error_result(DeadlineExceeded(f'request deadline exceeded after {attempt + 1} attempts: {e}'))
+            LLM_REQUESTS.inc(outcome='retry')
+            await asyncio.sleep(delay)
+            attempt += 1
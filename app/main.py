@@ -1,45 +1,117 @@
 import os
-import uuid
+import json
+import hashlib
+import time
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI, Depends, HTTPException, Header, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from app.schema import RunRequest, RunResponse, AnswerItem, EvidenceItem
-from app.extractors import fetch_blob_text
-from app.utils.chunking import chunk_text_token_aware
-from app.retriever import upsert_chunks, query_top_k
-from app.reasoner import explain_and_answer
-from app.db import SessionLocal, engine, Base
-from app import models
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from app.schema import RunRequest, RunResponse, DocumentRequest, DocumentStatus
+from app.ingest import IngestError, ingest_document, load_document
+from app.extractors import DocumentTooLarge
+from app.utils.memory import MemoryLimitExceeded
+from app.jobs import enqueue, get_job, wait_for_job, worker_pool
+from app.answering import answer_questions, iter_answers
+from sqlalchemy import text
+from app.db import get_engine, get_async_engine, dispose_async_engine, pool_status
 from app.config import settings
+from app.embeddings_ import get_embedder
+from app.llm_groq import warm_up_async_client, close_async_client
+from app.metrics import (
+    registry, REQUEST_SECONDS, EVIDENCE_TOKENS,
+    new_trace_id, set_trace_id, reset_trace_id, log_event,
+)
+
+# The schema is managed by Alembic (`alembic upgrade head`), not created at boot
 
-Base.metadata.create_all(bind=engine)
+async def _warm_up():
+    """Open a pooled DB connection, build the Groq client and load the embedder
+    in the background, so the first request doesn't pay for them and booting
+    doesn't wait for them."""
+    started = time.perf_counter()
+    timings = {}
+    for name, step in (("database", _ping_database), ("groq", warm_up_async_client),
+                       ("embedder", lambda: asyncio.to_thread(get_embedder))):
+        step_started = time.perf_counter()
+        try:
+            await step()
+            timings[name] = round(time.perf_counter() - step_started, 4)
+        except Exception as e:
+            timings[name] = f"error: {str(e) or type(e).__name__}"
+    log_event("warm_up", seconds=round(time.perf_counter() - started, 4), **timings)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up = asyncio.create_task(_warm_up()) if settings.WARM_UP_ON_STARTUP else None
+    if settings.INGEST_WORKERS > 0:
+        worker_pool.start(settings.INGEST_WORKERS)
+    try:
+        yield
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+            await asyncio.gather(warm_up, return_exceptions=True)
+        await worker_pool.stop()
+        await close_async_client()
+        await dispose_async_engine()
 
-app = FastAPI(title='HackRx Retrieval API (Groq + Postgres)')
+app = FastAPI(title='HackRx Retrieval API (Groq + Postgres)', lifespan=lifespan)
 
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
 
+def _db_pool_stats():
+    for name, pool in (('sync', get_engine().pool), ('async', get_async_engine().pool)):
+        for state, value in pool_status(pool).items():
+            yield {'engine': name, 'state': state}, value
+
+registry.gauge('hackrx_db_pool_connections', 'SQLAlchemy connection pool state.', ['engine', 'state'],
+               callback=_db_pool_stats)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace_id = request.headers.get("x-request-id") or new_trace_id()
+    token = set_trace_id(trace_id)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Trace-Id"] = trace_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = getattr(route, "path", request.url.path)
+        REQUEST_SECONDS.observe(elapsed, method=request.method, path=path, status=status_code)
+        log_event("request", method=request.method, path=path, status=status_code,
+                  seconds=round(elapsed, 4))
+        reset_trace_id(token)
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    print("Validation error details:", exc.errors())
+    # Errors from model validators carry the exception object in ctx
+    errors = jsonable_encoder(exc.errors())
+    log_event("validation_error", errors=errors)
     return JSONResponse(
         status_code=422,
-        content={"detail": exc.errors()}
+        content={"detail": errors}
     )
 
 
 async def verify_token(request: Request, authorization: str = Header(default=None)):
-    # Print headers for debugging
-    print("All headers:", dict(request.headers))
-    print("Authorization header:", authorization)
-    
     if not authorization:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -51,8 +123,6 @@ async def verify_token(request: Request, authorization: str = Header(default=Non
             detail='Invalid Authorization header format. Expected: Bearer <token>'
         )
     token = authorization.split(' ', 1)[1].strip()
-    print("Extracted token:", token)
-    print("Expected token:", settings.HACKRX_TEAM_TOKEN)
     
     if token != settings.HACKRX_TEAM_TOKEN:
         raise HTTPException(
@@ -61,17 +131,21 @@ async def verify_token(request: Request, authorization: str = Header(default=Non
         )
     return True
     
+HEALTH_TIMEOUT_SECONDS = 2.0
+
+async def _ping_database():
+    async with get_async_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
 @app.get("/health")
 async def health_check():
+    pools = {"sync": pool_status(get_engine().pool), "async": pool_status(get_async_engine().pool)}
     try:
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        await asyncio.wait_for(_ping_database(), HEALTH_TIMEOUT_SECONDS)
+        return {"status": "healthy", "database": "connected", "pool": pools}
     except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
-    finally:
-        db.close()
-        
+        return {"status": "unhealthy", "error": str(e) or type(e).__name__, "pool": pools}
+
 @app.options("/hackrx/run")
 async def hackrx_run_options():
     return {
@@ -80,93 +154,186 @@ async def hackrx_run_options():
         "access-control-allow-headers": "Authorization,Content-Type"
     }
 
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def _record_context_stats(stats: dict):
+    EVIDENCE_TOKENS.inc(stats['evidence_tokens'], kind='retrieved')
+    EVIDENCE_TOKENS.inc(stats['packed_tokens'], kind='packed')
+    log_event("evidence_tokens", retrieved=stats['evidence_tokens'], packed=stats['packed_tokens'],
+              saved=stats['evidence_tokens'] - stats['packed_tokens'])
+
+
+async def _ingest(url: str) -> dict:
+    try:
+        return await asyncio.to_thread(ingest_document, url)
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except MemoryLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+async def _document_from_handle(handle: str) -> dict:
+    """A pre-warmed document, waiting for its ingest job if it is still running."""
+    job = await wait_for_job(handle, settings.DOCUMENT_WAIT_SECONDS)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f'Unknown document_id {handle}')
+    if job['status'] == 'failed':
+        raise HTTPException(status_code=422, detail=f"Document ingestion failed: {job['error']}")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail='Document is still being ingested')
+    doc = await asyncio.to_thread(load_document, job['doc_id'])
+    if doc is None:
+        # The chunks were removed since the job ran; ingest again inline
+        doc = await _ingest(job['document_url'])
+    return doc
+
+async def _run_documents(req: RunRequest) -> list:
+    """The documents a run answers from, pre-warmed handles first, then URLs.
+
+    URLs are ingested concurrently, at most INGEST_CONCURRENCY at a time, so a
+    multi-document request takes about as long as its largest document.
+    """
+    handles, urls = req.document_handles(), req.document_urls()
+    if len(handles) + len(urls) > settings.MAX_DOCUMENTS_PER_REQUEST:
+        raise HTTPException(status_code=422,
+                            detail=f'At most {settings.MAX_DOCUMENTS_PER_REQUEST} documents per request')
+    semaphore = asyncio.Semaphore(max(1, settings.INGEST_CONCURRENCY))
+
+    async def ingest(url):
+        async with semaphore:
+            return await _ingest(url)
+
+    docs = await asyncio.gather(*(_document_from_handle(h) for h in handles), *(ingest(u) for u in urls))
+    # A document listed twice (as a URL and as its handle, or the same URL
+    # repeated) has one doc_id; search it once. doc_id includes the URL, so
+    # different URLs serving the same bytes stay separate documents.
+    return list({d['doc_id']: d for d in docs}.values())
+
+def _documents_key(docs: list) -> Optional[str]:
+    """Answer-cache key for a set of documents: the sorted content hashes of
+    their bytes, so it doesn't depend on URL or order. None (no answer
+    caching) if a document has no recorded hash."""
+    hashes = [d.get('content_hash') for d in docs]
+    if not hashes or not all(hashes):
+        return None
+    keys = sorted(set(hashes))
+    if len(keys) == 1:
+        return keys[0]
+    return hashlib.sha256('|'.join(keys).encode('utf-8')).hexdigest()
+
+@app.post("/documents", response_model=DocumentStatus, status_code=202)
+async def create_document(request: Request, req: DocumentRequest):
+    """Queue a document for background ingestion and return its handle.
+
+    Pass the returned ``document_id`` to /hackrx/run instead of ``documents``
+    to skip ingestion in the request path.
+    """
+    await verify_token(request, request.headers.get("authorization"))
+    return await enqueue(req.url)
+
+@app.get("/documents/{document_id}", response_model=DocumentStatus)
+async def document_status(request: Request, document_id: str):
+    await verify_token(request, request.headers.get("authorization"))
+    job = await get_job(document_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Unknown document_id')
+    return job
+
 @app.post("/hackrx/run", response_model=RunResponse)
 async def hackrx_run(request: Request, req: RunRequest):
     try:
-        # Debug logging
-        print("Headers received:", dict(request.headers))
-        raw_body = await request.body()
-        print("Raw body received:", raw_body.decode())
-        
         # First verify token
         await verify_token(request, request.headers.get("authorization"))
         
-        doc_url = req.documents
-        raw_text, pages = fetch_blob_text(doc_url)
-        full_text = "\n".join([p.get('text','') for p in pages])
-        doc_id = str(uuid.uuid4())[:8]
-        chunks = chunk_text_token_aware(full_text)
+        docs = await _run_documents(req)
         
-        # persist chunks to DB
-        db = SessionLocal()
-        try:
-            from app.crud import create_chunk
-            successful_chunks = []
-            try:
-                for c in chunks:
-                    create_chunk(db, document_url=doc_url, chunk_text=c['text'], token_count=c['token_count'])
-                    if chunk:
-                        successful_chunks.append(c)
-                chunks = successful_chunks
-            except Exception as e:
-                print(f"Error in chunk creation batch: {str(e)}")
-                
-        finally:
-            db.close()
-        
-        try:
-            if successful_chunks:
-                upsert_chunks(doc_id, chunks)
-        except Exception as e:
-            print(f"Error upserting chunks: {str(e)}")
-        
-        detailed_answers = []
-        simple_answers = []
-        
-        for q in req.questions:
-            top = query_top_k(q, k=5)
-            evidence = []
-            for t in top:
-                matching = next((c for c in chunks if c['chunk_id'] == t.get('chunk_id')), None)
-                snippet = matching['text'] if matching else ''
-                evidence.append({
-                    'doc_id': t.get('doc_id'),
-                    'chunk_id': t.get('chunk_id'),
-                    'text_snippet': snippet,
-                    'similarity_score': float(t.get('score',0.0))
-                })
-            
-            parsed = explain_and_answer(q, evidence)
-            
-            sources = []
-            for e in evidence:
-                sources.append(
-                    EvidenceItem(
-                        doc_id=e.get('doc_id'),
-                        page=None,
-                        chunk_id=e.get('chunk_id'),
-                        text_snippet=e.get('text_snippet')[:1000],
-                        similarity_score=e.get('similarity_score'),
-                        extracted_facts=parsed.get('facts') if parsed.get('facts') else None
-                    )
-                )
-            
-            answer_item = AnswerItem(
-                question=q,
-                answer=parsed.get('answer', 'Not found'),
-                confidence=float(parsed.get('confidence', 0.0)),
-                sources=sources,
-                rationale=parsed.get('rationale', '')
-            )
-            detailed_answers.append(answer_item)
-            simple_answers.append(parsed.get('answer', 'Not found'))
+        deadline = time.monotonic() + settings.RUN_DEADLINE_SECONDS
+        context_stats = {}
+        detailed_answers = await answer_questions(req.questions, None,
+                                                  concurrency=settings.ANSWER_CONCURRENCY,
+                                                  deadline=deadline,
+                                                  doc_key=_documents_key(docs),
+                                                  documents=docs,
+                                                  batch_max_prompt_tokens=settings.BATCH_MAX_PROMPT_TOKENS
+                                                  if settings.BATCH_REASONING else None,
+                                                  stats=context_stats,
+                                                  adaptive=settings.ADAPTIVE_REASONING)
+        if context_stats:
+            _record_context_stats(context_stats)
+        simple_answers = [a.answer for a in detailed_answers]
         
         return RunResponse(answers=simple_answers)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        log_event("run_error", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
+def _ndjson(event: dict) -> str:
+    return json.dumps(event) + "\n"
+
+@app.post("/hackrx/run/stream")
+async def hackrx_run_stream(request: Request, req: RunRequest, sources: bool = True):
+    """Stream newline-delimited JSON events while the request is processed.
+
+    Emits ingest started/done events, then one ``answer`` event per question
+    as soon as it is ready (``index`` is its position in the request), then a
+    final ``done`` event. If the client disconnects, the outstanding LLM calls
+    are cancelled.
+    """
+    await verify_token(request, request.headers.get("authorization"))
+
+    async def events():
+        started = time.monotonic()
+        yield _ndjson({"event": "ingest", "status": "started", "document": req.documents,
+                       "document_id": req.document_id})
+        try:
+            docs = await _run_documents(req)
+        except HTTPException as e:
+            yield _ndjson({"event": "error", "detail": e.detail})
+            return
+        except Exception as e:
+            log_event("ingest_error", document_url=req.documents, error=str(e))
+            yield _ndjson({"event": "error", "detail": str(e)})
+            return
+        done = {"event": "ingest", "status": "done",
+                "documents": [{"doc_id": d['doc_id'], "document_url": d.get('document_url'),
+                               "chunks": len(d['chunks'])} for d in docs],
+                "chunks": sum(len(d['chunks']) for d in docs),
+                "seconds": round(time.monotonic() - started, 3)}
+        if len(docs) == 1:
+            done["doc_id"] = docs[0]['doc_id']
+        yield _ndjson(done)
+
+        deadline = time.monotonic() + settings.RUN_DEADLINE_SECONDS
+        answered = 0
+        context_stats = {}
+        answers = iter_answers(req.questions, None,
+                               concurrency=settings.ANSWER_CONCURRENCY,
+                               deadline=deadline,
+                               doc_key=_documents_key(docs),
+                               documents=docs,
+                               batch_max_prompt_tokens=settings.BATCH_MAX_PROMPT_TOKENS
+                               if settings.BATCH_REASONING else None,
+                               stats=context_stats,
+                               adaptive=settings.ADAPTIVE_REASONING)
+        async with aclosing(answers):
+            async for i, item in answers:
+                answered += 1
+                event = {"event": "answer", "index": i}
+                event.update(item.model_dump(exclude=None if sources else {'sources'}))
+                yield _ndjson(event)
+        if context_stats:
+            _record_context_stats(context_stats)
+        yield _ndjson({"event": "done", "answered": answered, "seconds": round(time.monotonic() - started, 3)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 # At the very end of the file, outside all functions
 if __name__ == "__main__":
     import uvicorn
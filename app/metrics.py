@@ -0,0 +1,234 @@
+"""In-process metrics in the Prometheus text format, plus trace-aware JSON logs.
+
+Metrics are plain counters and histograms guarded by a lock, cheap enough to
+record on every request; /metrics renders them on demand. Gauges take a
+callback so values such as DB pool usage are read at scrape time.
+
+log_event writes one JSON object per line and stamps it with the trace ID of
+the current request, which contextvars carry into tasks and to_thread workers.
+"""
+import bisect
+import contextvars
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace_id: contextvars.ContextVar = contextvars.ContextVar('trace_id', default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_trace_id(trace_id: Optional[str]):
+    return _trace_id.set(trace_id)
+
+
+def reset_trace_id(token):
+    _trace_id.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def log_event(event: str, **fields):
+    record = {'ts': round(time.time(), 3), 'event': event, 'trace_id': current_trace_id()}
+    record.update(fields)
+    sys.stdout.write(json.dumps(record, default=str) + '\n')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def snapshot(self) -> Dict[Tuple, Dict]:
+        """Count and sum per label set, keyed by label values."""
+        with self._lock:
+            return {k: {'count': sum(counts), 'sum': total} for k, (counts, total) in self._values.items()}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Iterable[Tuple[Dict, float]]]] = None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                items = [(self._key(labels), v) for labels, v in self.callback()]
+            except Exception as e:
+                log_event('metric_collect_error', metric=self.name, error=str(e))
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'hackrx_stage_seconds', 'Time spent per pipeline stage (fetch, extract, chunk, persist, embed, upsert, lexical, retrieve, llm, ingest_job).',
+    ['stage'])
+REQUEST_SECONDS = registry.histogram(
+    'hackrx_http_request_seconds', 'HTTP request latency.', ['method', 'path', 'status'])
+LLM_REQUESTS = registry.counter(
+    'hackrx_llm_requests_total', 'LLM calls by outcome (ok, error, retry).', ['outcome'])
+LLM_TOKENS = registry.counter(
+    'hackrx_llm_tokens_total', 'Tokens reported by the LLM provider.', ['kind'])
+CACHE_LOOKUPS = registry.counter(
+    'hackrx_cache_lookups_total', 'Cache lookups by cache and result (hit, miss).', ['cache', 'result'])
+EVIDENCE_TOKENS = registry.counter(
+    'hackrx_evidence_tokens_total', 'Evidence tokens before (retrieved) and after (packed) prompt packing.', ['kind'])
+ADAPTIVE_ANSWERS = registry.counter(
+    'hackrx_adaptive_answers_total', 'Adaptive reasoning answers by outcome (first_pass, escalated).', ['outcome'])
+
+
+def record_cache(cache: str, hits: int, misses: int):
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+
+
+def record_llm_usage(usage):
+    """Count prompt/completion tokens from a chat completion's usage block."""
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        n = getattr(usage, kind, None)
+        if n is None and isinstance(usage, dict):
+            n = usage.get(kind)
+        if n:
+            LLM_TOKENS.inc(n, kind=kind[:-len('_tokens')])
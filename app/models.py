@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, DateTime, LargeBinary, Text, func
+from sqlalchemy import Column, String, Integer, DateTime, LargeBinary, Text, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 from app.db import Base
 
@@ -7,6 +7,53 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     document_url = Column(String, nullable=False, index=True)
+    doc_id = Column(String, nullable=True)
+    chunk_id = Column(String, nullable=True)
+    ordinal = Column(Integer, nullable=True)
+    page = Column(Integer, nullable=True)
     chunk_text = Column(Text, nullable=False)
+    content_hash = Column(String(32), nullable=True)  # md5 of chunk_text, as in the dedupe index
+    embedding_model = Column(String, nullable=True)
     token_count = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Dedupe key for bulk ingest: the same chunk text is stored once per document URL
+        Index('uq_document_chunks_url_text_md5', document_url, func.md5(chunk_text), unique=True),
+        # Resolves vector hits (doc_id, chunk_id) back to rows
+        Index('ix_document_chunks_doc_id_chunk_id', doc_id, chunk_id),
+    )
+
+
+class IngestedDocument(Base):
+    """Completion marker: written once all of a document's chunks are stored.
+
+    document_chunks rows are committed batch by batch while a document is
+    ingested, so rows alone don't mean the document is complete.
+    """
+    __tablename__ = "ingested_documents"
+    doc_id = Column(String, primary_key=True)
+    document_url = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # sha256 of the downloaded bytes
+    chunk_count = Column(Integer, nullable=False)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class IngestJob(Base):
+    """A queued background ingest of one document URL (see app.jobs)."""
+    __tablename__ = "ingest_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_url = Column(String, nullable=False)
+    status = Column(String(16), nullable=False, default='queued')  # queued | running | done | failed
+    doc_id = Column(String, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Workers claim the oldest queued job
+        Index('ix_ingest_jobs_status_created_at', status, created_at),
+    )
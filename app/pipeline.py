@@ -0,0 +1,186 @@
+"""Streaming ingestion pipeline.
+
+Extraction, chunking, embedding and persistence run as separate stages on
+their own threads, connected by bounded queues. A stage blocks when its
+downstream queue is full, so memory in flight is bounded by the queue sizes
+rather than the document size, and the first chunks are searchable while
+later pages are still being extracted.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List
+
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '8'))
+INGEST_EMBED_BATCH = int(os.getenv('INGEST_EMBED_BATCH', '64'))
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def as_dict(self, wall_seconds: float) -> Dict:
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 4),
+            'items_per_second': round(self.items / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        }
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class IngestPipeline:
+    """Runs pages -> chunks -> embedded batches -> sink with bounded queues.
+
+    ``chunker(pages)`` turns an iterator of pages into an iterator of chunks
+    (e.g. app.utils.chunking.iter_chunks), ``embed(texts)`` returns
+    one vector per text and ``sink(chunks, vectors)`` persists and indexes a
+    batch, returning the chunks it kept. The sink runs on the calling thread.
+    """
+
+    def __init__(self, chunker: Callable, embed: Callable, sink: Callable,
+                 queue_size: int = INGEST_QUEUE_SIZE, embed_batch: int = INGEST_EMBED_BATCH):
+        self.chunker = chunker
+        self.embed = embed
+        self.sink = sink
+        self.queue_size = queue_size
+        self.embed_batch = embed_batch
+        self.stats = {name: StageStats(name) for name in ('extract', 'chunk', 'embed', 'sink')}
+        self.first_chunk_seconds = None
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q: queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise _Cancelled()
+
+    def _run_stage(self, fn, *args):
+        try:
+            fn(*args)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _extract(self, pages: Iterable[Dict], out: queue.Queue):
+        stats = self.stats['extract']
+        it = iter(pages)
+        while True:
+            start = time.perf_counter()
+            page = next(it, _DONE)
+            stats.busy_seconds += time.perf_counter() - start
+            if page is _DONE:
+                break
+            stats.items += 1
+            self._put(out, page)
+        self._put(out, _DONE)
+
+    def _iter_queue(self, inp: queue.Queue, waited: List[float]):
+        while True:
+            start = time.perf_counter()
+            item = self._get(inp)
+            waited[0] += time.perf_counter() - start
+            if item is _DONE:
+                return
+            yield item
+
+    def _chunk(self, inp: queue.Queue, out: queue.Queue):
+        stats = self.stats['chunk']
+        waited = [0.0]
+        start = time.perf_counter()
+        for c in self.chunker(self._iter_queue(inp, waited)):
+            stats.items += 1
+            put_start = time.perf_counter()
+            self._put(out, c)
+            waited[0] += time.perf_counter() - put_start
+        stats.busy_seconds += time.perf_counter() - start - waited[0]
+        self._put(out, _DONE)
+
+    def _embed(self, inp: queue.Queue, out: queue.Queue):
+        stats = self.stats['embed']
+        batch = []
+        done = False
+        while not done:
+            item = self._get(inp)
+            if item is _DONE:
+                done = True
+            else:
+                batch.append(item)
+            if batch and (done or len(batch) >= self.embed_batch):
+                start = time.perf_counter()
+                vectors = self.embed([c['text'] for c in batch])
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += len(batch)
+                self._put(out, (batch, vectors))
+                batch = []
+        self._put(out, _DONE)
+
+    def run(self, pages: Iterable[Dict]) -> List[Dict]:
+        """Ingest pages and return the chunks the sink kept, in order."""
+        started = time.perf_counter()
+        page_q = queue.Queue(self.queue_size)
+        chunk_q = queue.Queue(self.queue_size * self.embed_batch)
+        embed_q = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._run_stage, args=(self._extract, pages, page_q), daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._chunk, page_q, chunk_q), daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._embed, chunk_q, embed_q), daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        kept = []
+        stats = self.stats['sink']
+        try:
+            while True:
+                item = self._get(embed_q)
+                if item is _DONE:
+                    break
+                batch, vectors = item
+                start = time.perf_counter()
+                kept.extend(self.sink(batch, vectors))
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += len(batch)
+                if self.first_chunk_seconds is None and kept:
+                    self.first_chunk_seconds = time.perf_counter() - started
+        except _Cancelled:
+            pass
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            for t in threads:
+                t.join()
+            self.wall_seconds = time.perf_counter() - started
+        if self._errors:
+            raise self._errors[0]
+        return kept
+
+    def report(self) -> Dict:
+        wall = getattr(self, 'wall_seconds', 0.0)
+        return {
+            'wall_seconds': round(wall, 4),
+            'first_chunk_seconds': round(self.first_chunk_seconds, 4) if self.first_chunk_seconds is not None else None,
+            'stages': {name: s.as_dict(wall) for name, s in self.stats.items()},
+        }
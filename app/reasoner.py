@@ -1,12 +1,52 @@
-from app.llm_groq import run_llm
-import json, re
-def explain_and_answer(question: str, evidence_texts: list):
-    prompt = f"""You are an expert assistant. Answer only from evidence.
-Question: {question}\n\nEvidence:\n"""
+from app.llm_groq import run_llm, run_llm_async, SYSTEM_PROMPT, DEFAULT_MODEL, DEFAULT_MAX_TOKENS
+from app.utils.chunking import count_tokens
+from app.context import pack_evidence, EVIDENCE_TOKEN_BUDGET
+from app.metrics import ADAPTIVE_ANSWERS
+import asyncio, hashlib, json, os, re
+from urllib.parse import urlparse
+
+PROMPT_HEADER = "You are an expert assistant. Answer only from evidence.\n"
+PROMPT_INSTRUCTIONS = "\nInstructions: Answer succinctly, extract factual fields if present, give short rationale and confidence (0-1). Return JSON with keys: answer, facts, rationale, confidence."
+BATCH_INSTRUCTIONS = "\nInstructions: Answer every question succinctly using only the evidence, extract factual fields if present, give a short rationale and confidence (0-1). Return a JSON array with one object per question, each with keys: id (the question number), answer, facts, rationale, confidence."
+BATCH_ANSWER_TOKENS = int(os.getenv('GROQ_BATCH_ANSWER_TOKENS', '400'))  # output budget per batched question
+# Adaptive reasoning: evidence depth from retrieval score margins, output budget
+# from the question, and a second pass only when the first is not confident
+ADAPTIVE_MIN_EVIDENCE = int(os.getenv('ADAPTIVE_MIN_EVIDENCE', '2'))
+ADAPTIVE_SCORE_MARGIN = float(os.getenv('ADAPTIVE_SCORE_MARGIN', '0.15'))  # relative to the top score
+ADAPTIVE_MIN_CONFIDENCE = float(os.getenv('ADAPTIVE_MIN_CONFIDENCE', '0.6'))
+ADAPTIVE_ANSWER_TOKENS = int(os.getenv('ADAPTIVE_ANSWER_TOKENS', '320'))
+GROQ_ESCALATION_MODEL = os.getenv('GROQ_ESCALATION_MODEL') or None  # None escalates on the same model
+# Changes whenever the model or any prompt text changes, so cached answers don't outlive them
+PROMPT_VERSION = DEFAULT_MODEL + ':' + hashlib.sha1(
+    (SYSTEM_PROMPT + PROMPT_HEADER + PROMPT_INSTRUCTIONS + BATCH_INSTRUCTIONS).encode('utf-8')).hexdigest()[:12]
+
+def prompt_version(adaptive: bool = False) -> str:
+    """Answer-cache version for answers produced with or without adaptive
+    reasoning; adaptive answers also depend on the escalation model and the
+    adaptive thresholds, so changing any of them misses the cache too."""
+    if not adaptive:
+        return PROMPT_VERSION
+    return (f"{PROMPT_VERSION}:adaptive:{GROQ_ESCALATION_MODEL or DEFAULT_MODEL}:{ADAPTIVE_MIN_EVIDENCE}:"
+            f"{ADAPTIVE_SCORE_MARGIN}:{ADAPTIVE_MIN_CONFIDENCE}:{ADAPTIVE_ANSWER_TOKENS}")
+
+def source_label(e: dict) -> str:
+    """How an evidence item's origin is shown to the LLM: the document's file
+    name when known (so answers can tell documents apart), and its page."""
+    url = e.get('document_url')
+    name = os.path.basename(urlparse(url).path) if url else ''
+    label = f"doc:{name or e.get('doc_id')}"
+    if e.get('page') is not None:
+        label += f", page {e['page']}"
+    return label
+
+def build_prompt(question: str, evidence_texts: list) -> str:
+    prompt = PROMPT_HEADER + f"Question: {question}\n\nEvidence:\n"
     for i,e in enumerate(evidence_texts,1):
-        prompt += f"[{i}] (doc:{e.get('doc_id')})\n{e.get('text_snippet')}\n\n"
-    prompt += "\nInstructions: Answer succinctly, extract factual fields if present, give short rationale and confidence (0-1). Return JSON with keys: answer, facts, rationale, confidence."
-    resp = run_llm(prompt)
+        prompt += f"[{i}] ({source_label(e)})\n{e.get('text_snippet')}\n\n"
+    prompt += PROMPT_INSTRUCTIONS
+    return prompt
+
+def parse_answer(resp) -> dict:
     content = resp.get('answer') if isinstance(resp, dict) else str(resp)
     try:
         m = re.search(r"\{.*\}", content, re.S)
@@ -14,4 +54,222 @@ Question: {question}\n\nEvidence:\n"""
         parsed = json.loads(jtext)
     except Exception:
         parsed = {'answer': content.strip(), 'facts': {}, 'rationale': '', 'confidence': 0.0}
+    if isinstance(resp, dict) and resp.get('error'):
+        parsed['error'] = resp['error']
     return parsed
+
+def explain_and_answer(question: str, evidence_texts: list, stats: dict = None):
+    resp = run_llm(build_prompt(question, pack_evidence(question, evidence_texts, stats=stats)))
+    return parse_answer(resp)
+
+async def explain_and_answer_async(question: str, evidence_texts: list, deadline: float = None, stats: dict = None,
+                                   max_tokens: int = None, model: str = None):
+    evidence = pack_evidence(question, evidence_texts, stats=stats)
+    resp = await run_llm_async(build_prompt(question, evidence), max_tokens=max_tokens or DEFAULT_MAX_TOKENS,
+                               deadline=deadline, model=model)
+    parsed = parse_answer(resp)
+    if (resp.get('metadata') or {}).get('finish_reason') == 'length':
+        parsed['truncated'] = True
+    return parsed
+
+def _relevance(e: dict, use_vector: bool) -> float:
+    if use_vector:
+        return float(e['vector_score'])
+    return float(e.get('similarity_score', e.get('score', 0.0)) or 0.0)
+
+def evidence_depth(evidence: list, min_k: int = ADAPTIVE_MIN_EVIDENCE, margin: float = ADAPTIVE_SCORE_MARGIN) -> int:
+    """How many of the ranked evidence items the first pass should use.
+
+    Keeps every item up to the last one scoring within ``margin`` of the top
+    item, and at least ``min_k``. Vector similarities are used when every item
+    has one, since fused (RRF) scores sit too close together for a margin to
+    mean anything; otherwise the items' own scores are.
+    """
+    if len(evidence) <= min_k:
+        return len(evidence)
+    use_vector = all(e.get('vector_score') is not None for e in evidence)
+    scores = [_relevance(e, use_vector) for e in evidence]
+    top = max(scores)
+    if top <= 0:
+        return len(evidence)
+    cutoff = top * (1 - margin)
+    depth = max((i + 1 for i, s in enumerate(scores) if s >= cutoff), default=0)
+    return max(depth, min_k)
+
+_LONG_ANSWER_RE = re.compile(
+    r"\b(list|explain|describe|how|why|conditions?|exclusions?|benefits|requirements|steps|differences?|compare)\b",
+    re.I)
+
+def expected_answer_tokens(question: str) -> int:
+    """Output budget for a question: ADAPTIVE_ANSWER_TOKENS for a short factual
+    answer, twice that for questions asking for lists or explanations."""
+    tokens = ADAPTIVE_ANSWER_TOKENS * (2 if _LONG_ANSWER_RE.search(question) else 1)
+    return min(tokens, DEFAULT_MAX_TOKENS)
+
+def _confident(parsed: dict) -> bool:
+    if parsed.get('error') or parsed.get('truncated'):
+        return False
+    try:
+        return float(parsed.get('confidence', 0.0)) >= ADAPTIVE_MIN_CONFIDENCE
+    except (TypeError, ValueError):
+        return False
+
+async def explain_and_answer_adaptive_async(question: str, evidence_texts: list, deadline: float = None,
+                                            stats: dict = None) -> dict:
+    """Answer from the strongest evidence first, escalating only when needed.
+
+    The first pass uses the top evidence_depth() items and a max_tokens of
+    expected_answer_tokens(). If its answer is not confident (confidence below
+    ADAPTIVE_MIN_CONFIDENCE, an error, or cut off at max_tokens), a second pass
+    uses all the evidence, the full GROQ_MAX_TOKENS budget and
+    GROQ_ESCALATION_MODEL when set. The parsed answer carries
+    'evidence_depth', the number of evidence items it was based on.
+    """
+    depth = evidence_depth(evidence_texts)
+    max_tokens = expected_answer_tokens(question)
+    parsed = await explain_and_answer_async(question, evidence_texts[:depth], deadline=deadline, stats=stats,
+                                            max_tokens=max_tokens)
+    can_escalate = (depth < len(evidence_texts) or GROQ_ESCALATION_MODEL is not None
+                    or (parsed.get('truncated') and max_tokens < DEFAULT_MAX_TOKENS))
+    if _confident(parsed) or not can_escalate:
+        ADAPTIVE_ANSWERS.inc(outcome='first_pass')
+        parsed['evidence_depth'] = depth
+        return parsed
+    ADAPTIVE_ANSWERS.inc(outcome='escalated')
+    escalated = await explain_and_answer_async(question, evidence_texts, deadline=deadline, stats=stats,
+                                               max_tokens=DEFAULT_MAX_TOKENS, model=GROQ_ESCALATION_MODEL)
+    if escalated.get('error') and not parsed.get('error'):
+        # Keep the first answer rather than replace it with an error
+        parsed['evidence_depth'] = depth
+        return parsed
+    escalated['evidence_depth'] = len(evidence_texts)
+    escalated['escalated'] = True
+    return escalated
+
+def _evidence_key(e) -> tuple:
+    return (e.get('doc_id'), e.get('chunk_id'))
+
+def group_by_evidence(items: list, max_prompt_tokens: int) -> list:
+    """Group (question, evidence) items whose evidence overlaps.
+
+    Returns lists of item indexes. An item joins the first group sharing at
+    least one evidence chunk if the group's prompt (system prompt, deduplicated
+    evidence and questions) stays within max_prompt_tokens; otherwise it
+    starts a new group.
+    """
+    base_tokens = count_tokens(SYSTEM_PROMPT + PROMPT_HEADER + BATCH_INSTRUCTIONS)
+    snippet_tokens = {}
+    groups = []
+    for i, (question, evidence) in enumerate(items):
+        for e in evidence:
+            key = _evidence_key(e)
+            if key not in snippet_tokens:
+                snippet_tokens[key] = count_tokens(e.get('text_snippet') or '')
+        keys = {_evidence_key(e) for e in evidence}
+        q_tokens = count_tokens(question) + 8
+        for g in groups:
+            if not g['keys'] & keys:
+                continue
+            tokens = g['tokens'] + q_tokens + sum(snippet_tokens[k] + 8 for k in keys - g['keys'])
+            if tokens <= max_prompt_tokens:
+                g['items'].append(i)
+                g['keys'] |= keys
+                g['tokens'] = tokens
+                break
+        else:
+            groups.append({
+                'items': [i],
+                'keys': keys,
+                'tokens': base_tokens + q_tokens + sum(snippet_tokens[k] + 8 for k in keys),
+            })
+    return [g['items'] for g in groups]
+
+def build_batch_prompt(questions: list, evidence_lists: list) -> str:
+    prompt = PROMPT_HEADER + "Questions:\n"
+    for i, q in enumerate(questions, 1):
+        prompt += f"Q{i}: {q}\n"
+    prompt += "\nEvidence:\n"
+    seen = set()
+    n = 0
+    for evidence in evidence_lists:
+        for e in evidence:
+            key = _evidence_key(e)
+            if key in seen:
+                continue
+            seen.add(key)
+            n += 1
+            prompt += f"[{n}] ({source_label(e)})\n{e.get('text_snippet')}\n\n"
+    prompt += BATCH_INSTRUCTIONS
+    return prompt
+
+def parse_batch_answers(content: str, count: int) -> dict:
+    """Map question number (1-based) to its parsed answer.
+
+    Only well-formed items are returned: objects with an in-range integer id
+    and a string answer. Missing or malformed items are simply absent.
+    """
+    try:
+        m = re.search(r"\[.*\]", content or '', re.S)
+        items = json.loads(m.group(0) if m else content)
+    except Exception:
+        return {}
+    if not isinstance(items, list):
+        return {}
+    parsed = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('answer'), str):
+            continue
+        try:
+            qid = int(item.get('id'))
+            confidence = float(item.get('confidence', 0.0))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= qid <= count and qid not in parsed:
+            parsed[qid] = {
+                'answer': item['answer'],
+                'facts': item.get('facts') or {},
+                'rationale': item.get('rationale') or '',
+                'confidence': confidence,
+            }
+    return parsed
+
+async def explain_and_answer_batch_async(items: list, max_prompt_tokens: int, deadline: float = None,
+                                         semaphore: asyncio.Semaphore = None, stats: dict = None) -> list:
+    """Answer (question, evidence) items, batching questions with shared evidence.
+
+    Each group of overlapping questions becomes one prompt asking for a JSON
+    array of answers; any question whose answer is missing or malformed is
+    retried on its own with explain_and_answer_async. A group's shared
+    evidence is packed once, with a budget of EVIDENCE_TOKEN_BUDGET per
+    question. Returns one parsed answer
+    per item, in order.
+    """
+    semaphore = semaphore or asyncio.Semaphore(len(items) or 1)
+    results = [None] * len(items)
+
+    async def run_group(group):
+        if len(group) == 1:
+            i = group[0]
+            async with semaphore:
+                results[i] = await explain_and_answer_async(items[i][0], items[i][1], deadline=deadline, stats=stats)
+            return
+        questions = [items[i][0] for i in group]
+        evidence = pack_evidence(' '.join(questions), [e for i in group for e in items[i][1]],
+                                 budget=EVIDENCE_TOKEN_BUDGET * len(group), stats=stats)
+        prompt = build_batch_prompt(questions, [evidence])
+        async with semaphore:
+            resp = await run_llm_async(prompt, max_tokens=BATCH_ANSWER_TOKENS * len(group),
+                                       deadline=deadline)
+        parsed = {} if resp.get('error') else parse_batch_answers(resp.get('answer'), len(group))
+        retry = []
+        for n, i in enumerate(group, 1):
+            if n in parsed:
+                results[i] = parsed[n]
+            else:
+                retry.append(i)
+        for i in retry:
+            async with semaphore:
+                results[i] = await explain_and_answer_async(items[i][0], items[i][1], deadline=deadline, stats=stats)
+
+    await asyncio.gather(*(run_group(g) for g in group_by_evidence(items, max_prompt_tokens)))
+    return results
@@ -1,29 +1,207 @@
-from app.embeddings_ import get_embedding
-try:
-    from app.pinecone_client import get_index
-except Exception:
-    get_index = None
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from app.embeddings_ import get_embeddings
+from app.lexical_index import lexical_index, reciprocal_rank_fusion, rerank
+from app.metrics import log_event
+
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'local')  # local | pinecone
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')  # vector | hybrid
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '20'))  # per list, before fusion
+RRF_K = int(os.getenv('RRF_K', '60'))
+RETRIEVAL_RERANK = os.getenv('RETRIEVAL_RERANK', '0') == '1'
+
+local_index = None
+if VECTOR_BACKEND != 'pinecone':
+    from app.vector_index import LocalVectorIndex
+    local_index = LocalVectorIndex()
+
+_get_index = None
+_pinecone_loaded = False
+
+def pinecone_index_getter():
+    """Pinecone's get_index, imported on first use so boot doesn't pay for the
+    client; None when the backend is local or unavailable."""
+    global _get_index, _pinecone_loaded
+    if VECTOR_BACKEND != 'pinecone':
+        return None
+    if not _pinecone_loaded:
+        try:
+            from app.pinecone_client import get_index as _get_index
+        except Exception as e:
+            log_event('vector_backend_unavailable', backend='pinecone', error=str(e))
+        _pinecone_loaded = True
+    return _get_index
+
+def vector_id(doc_id: str, chunk_id: str) -> str:
+    return f"{doc_id}::{chunk_id}"
+
+def has_vectors(doc_id: str) -> bool:
+    """Whether doc_id's vectors are already in the index.
+
+    Pinecone is persistent, so vectors upserted by an earlier ingest are assumed
+    to still be there.
+    """
+    if local_index is not None:
+        return local_index.has_namespace(doc_id)
+    return pinecone_index_getter() is not None
 
 def upsert_chunks(doc_id: str, chunks):
+    if local_index is None and pinecone_index_getter() is None:
+        return
+    upsert_embeddings(doc_id, chunks, get_embeddings([c['text'] for c in chunks]))
+
+def upsert_embeddings(doc_id: str, chunks, embeddings, flush: bool = True):
+    """Store precomputed embeddings (one row per chunk) under doc_id.
+
+    Pass flush=False when upserting a document in batches and call
+    flush_vectors() after the last one, so the local index saves it once.
+    """
+    if local_index is not None:
+        local_index.upsert(doc_id, [c['chunk_id'] for c in chunks], embeddings, flush=flush)
+        return
+    get_index = pinecone_index_getter()
     if get_index is None:
         return
     idx = get_index()
     vectors = []
-    for c in chunks:
-        emb = get_embedding(c['text'])
+    for c, emb in zip(chunks, embeddings):
         meta = {'doc_id': doc_id, 'chunk_id': c['chunk_id']}
-        vectors.append((f"{doc_id}::{c['chunk_id']}", emb, meta))
+        vectors.append((vector_id(doc_id, c['chunk_id']), emb.tolist(), meta))
     idx.upsert(vectors=vectors)
 
-def query_top_k(query_text: str, k: int =5):
-    if get_index is None:
-        return []
+def flush_vectors(doc_id: str):
+    """Persist doc_id's batched upserts; Pinecone stores each upsert as it goes."""
+    if local_index is not None:
+        local_index.flush(doc_id)
+
+def fetch_vectors(ids: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], np.ndarray]:
+    """Previously upserted vectors for (doc_id, chunk_id) pairs; missing ones are left out."""
+    by_doc = defaultdict(list)
+    for doc_id, chunk_id in ids:
+        by_doc[doc_id].append(chunk_id)
+    found = {}
+    if local_index is not None:
+        for doc_id, chunk_ids in by_doc.items():
+            for chunk_id, vec in local_index.fetch(doc_id, chunk_ids).items():
+                found[(doc_id, chunk_id)] = vec
+        return found
+    get_index = pinecone_index_getter()
+    if get_index is None or not by_doc:
+        return found
+    try:
+        wanted = {vector_id(d, c): (d, c) for d, cs in by_doc.items() for c in cs}
+        resp = get_index().fetch(ids=list(wanted))
+        for vid, v in (resp.get('vectors') or {}).items():
+            if vid in wanted:
+                found[wanted[vid]] = np.asarray(v.get('values'), dtype=np.float32)
+    except Exception as e:
+        log_event('vector_fetch_error', documents=len(by_doc), error=str(e))
+    return found
+
+def query_top_k(query_text: str, k: int =5, doc_id: Optional[str] = None):
+    return query_top_k_batch([query_text], k, doc_id)[0]
+
+DocIds = Union[str, Sequence[str], None]
+
+def _doc_id_list(doc_id: DocIds) -> Optional[List[str]]:
+    if doc_id is None:
+        return None
+    return [doc_id] if isinstance(doc_id, str) else list(doc_id)
+
+def _vector_top_k_batch(questions: List[str], k: int, doc_id: DocIds) -> List[List[Dict]]:
+    get_index = pinecone_index_getter()
+    if local_index is None and get_index is None:
+        return [[] for _ in questions]
+    q_embs = get_embeddings(questions)
+    doc_ids = _doc_id_list(doc_id)
+    if local_index is not None:
+        return [
+            [{'chunk_id': cid, 'doc_id': ns, 'score': score} for ns, cid, score in hits]
+            for hits in local_index.query_batch(q_embs, top_k=k, namespace=doc_ids)
+        ]
     idx = get_index()
-    q_emb = get_embedding(query_text)
-    resp = idx.query(vector=q_emb, top_k=k, include_metadata=True)
+    if doc_ids is None:
+        query_filter = None
+    elif len(doc_ids) == 1:
+        query_filter = {'doc_id': {'$eq': doc_ids[0]}}
+    else:
+        query_filter = {'doc_id': {'$in': doc_ids}}
     results = []
-    for match in resp.get('matches', []):
-        meta = match.get('metadata', {})
-        score = match.get('score', match.get('distance', 0))
-        results.append({'chunk_id': meta.get('chunk_id'), 'doc_id': meta.get('doc_id'), 'score': score})
+    for q_emb in q_embs:
+        resp = idx.query(vector=q_emb.tolist(), top_k=k, include_metadata=True, filter=query_filter)
+        results.append([
+            {'chunk_id': m.get('metadata', {}).get('chunk_id'), 'doc_id': m.get('metadata', {}).get('doc_id'),
+             'score': m.get('score', m.get('distance', 0))}
+            for m in resp.get('matches', [])
+        ])
     return results
+
+def _fuse(vector_hits: List[Dict], lexical_hits: Dict[str, List[tuple]]) -> List[Dict]:
+    """RRF over the vector ranking (one list across all documents) and each
+    document's BM25 ranking; BM25 scores are only comparable within a document."""
+    vector_scores = {(h['doc_id'], h['chunk_id']): h['score'] for h in vector_hits}
+    lexical_scores = {(doc_id, cid): score for doc_id, hits in lexical_hits.items() for cid, score in hits}
+    rankings = [[(h['doc_id'], h['chunk_id']) for h in vector_hits]]
+    rankings += [[(doc_id, cid) for cid, _ in hits] for doc_id, hits in lexical_hits.items()]
+    return [
+        {'chunk_id': cid, 'doc_id': doc_id, 'score': score,
+         'vector_score': vector_scores.get((doc_id, cid)), 'bm25_score': lexical_scores.get((doc_id, cid))}
+        for (doc_id, cid), score in reciprocal_rank_fusion(rankings, k=RRF_K)
+    ]
+
+def query_top_k_batch(questions: List[str], k: int = 5, doc_id: DocIds = None,
+                      chunk_map: Optional[Dict[str, Dict]] = None, mode: Optional[str] = None,
+                      chunk_maps: Optional[Dict[str, Dict[str, Dict]]] = None) -> List[List[Dict]]:
+    """Top-k chunks for every question, restricted to doc_id when given.
+
+    doc_id may also be a list, in which case each question is answered across
+    all of those documents at once: the vector search covers their namespaces
+    in one query and every hit keeps the doc_id it came from.
+
+    All questions are embedded in one batch. The local index answers them with
+    one similarity search per namespace; Pinecone gets one filtered query per
+    question. When chunk_map (chunk_id -> chunk, for a single doc_id) or
+    chunk_maps (doc_id -> chunk_id -> chunk) is given each hit also carries
+    its 'text' and 'page'.
+
+    In hybrid mode (RETRIEVAL_MODE, the default) each document's BM25 index is
+    searched too, built from its chunks if ingestion has not already built it;
+    the top RETRIEVAL_CANDIDATES of each list are combined with reciprocal
+    rank fusion, so 'score' is the fused score and 'vector_score' and
+    'bm25_score' keep the originals. RETRIEVAL_RERANK=1 reorders the fused
+    candidates with the local term-coverage reranker before the cut to k.
+    """
+    if not questions:
+        return []
+    mode = mode or RETRIEVAL_MODE
+    doc_ids = _doc_id_list(doc_id)
+    if chunk_maps is None and chunk_map is not None and doc_ids and len(doc_ids) == 1:
+        chunk_maps = {doc_ids[0]: chunk_map}
+    lexical = {}
+    if mode == 'hybrid' and doc_ids:
+        for d in doc_ids:
+            chunks = (chunk_maps or {}).get(d)
+            index = lexical_index.get_or_build(d, chunks.values() if chunks else None)
+            if index is not None:
+                lexical[d] = index
+    if not lexical and local_index is None and pinecone_index_getter() is None:
+        return [[] for _ in questions]
+
+    n = max(k, RETRIEVAL_CANDIDATES) if lexical else k
+    results = _vector_top_k_batch(questions, n, doc_id)
+    if lexical:
+        per_doc = {d: index.search_batch(questions, n) for d, index in lexical.items()}
+        results = [_fuse(v, {d: hits[i] for d, hits in per_doc.items()}) for i, v in enumerate(results)]
+    if chunk_maps is not None:
+        for hits in results:
+            for hit in hits:
+                chunk = chunk_maps.get(hit['doc_id'], {}).get(hit['chunk_id'])
+                hit['text'] = chunk['text'] if chunk else ''
+                hit['page'] = chunk.get('page') if chunk else None
+        if lexical and RETRIEVAL_RERANK:
+            # idf comes from the document's own index; across documents terms weigh equally
+            index = next(iter(lexical.values())) if len(lexical) == 1 else None
+            results = [rerank(q, hits, index) for q, hits in zip(questions, results)]
+    return [hits[:k] for hits in results]
@@ -1,8 +1,17 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, model_validator
+from typing import List, Optional, Union
+
+def _as_list(value) -> List[str]:
+    if not value:
+        return []
+    items = [value] if isinstance(value, str) else value
+    # Repeats are ingested and searched once
+    return [v for v in dict.fromkeys(items) if v]
 
 class EvidenceItem(BaseModel):
     doc_id: str
+    document_url: Optional[str] = None
     page: Optional[int]
     chunk_id: str
     text_snippet: str
@@ -17,8 +26,38 @@ class AnswerItem(BaseModel):
     rationale: str
 
 class RunRequest(BaseModel):
-    documents: str
+    # One document URL or several; questions are answered across all of them
+    documents: Optional[Union[str, List[str]]] = None
+    # Handle(s) returned by POST /documents; skips ingestion once those jobs are done
+    document_id: Optional[Union[str, List[str]]] = None
     questions: List[str]
 
+    @model_validator(mode='after')
+    def _needs_a_document(self):
+        if not self.document_urls() and not self.document_handles():
+            raise ValueError('Either documents or document_id is required')
+        return self
+
+    def document_urls(self) -> List[str]:
+        return _as_list(self.documents)
+
+    def document_handles(self) -> List[str]:
+        return _as_list(self.document_id)
+
 class RunResponse(BaseModel):
     answers: List[str]
+
+class DocumentRequest(BaseModel):
+    url: str
+
+class DocumentStatus(BaseModel):
+    document_id: str
+    document_url: str
+    status: str
+    doc_id: Optional[str] = None
+    chunks: Optional[int] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
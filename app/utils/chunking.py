@@ -1,43 +1,270 @@
-from typing import List, Dict
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+import os
 import re
+from app.metrics import log_event
+
+DEFAULT_MODEL = 'gpt-3.5-turbo'
+MAX_CHUNK_TOKENS = int(os.getenv('MAX_CHUNK_TOKENS', '700'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '50'))
+
+_SPACE_RE = re.compile(r'[^\S\n]+')
+# Sentence ends and line/section breaks; chunks are cut only at these offsets
+_BOUNDARY_RE = re.compile(r'[.!?]\s+|\n+')
+_APPROX_TOKEN_RE = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
 
 def clean_text(text: str) -> str:
     # Remove null characters and other problematic characters
     text = text.replace('\x00', '')
     # Clean other special characters but preserve newlines
-    text = re.sub(r'[^\S\n]+', ' ', text)
+    text = _SPACE_RE.sub(' ', text)
     return text.strip()
 
-def chunk_text_token_aware(text: str, max_chunk_length: int = 700) -> List[Dict]:
-    # Clean text before chunking
-    cleaned_text = clean_text(text)
-    chunks = []
-    current_chunk = ''
-    current_length = 0
-    
-    # Split by sentences while respecting paragraph breaks
-    sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', cleaned_text)
-    
-    for sentence in sentences:
-        sentence_length = len(sentence.split())
-        if current_length + sentence_length > max_chunk_length:
-            if current_chunk:
-                chunks.append({
-                    'text': current_chunk.strip(),
-                    'chunk_id': f'chunk_{len(chunks)}',
-                    'token_count': current_length
-                })
-            current_chunk = sentence
-            current_length = sentence_length
-        else:
-            current_chunk = f'{current_chunk} {sentence}' if current_chunk else sentence
-            current_length += sentence_length
-    
-    if current_chunk:
-        chunks.append({
-            'text': current_chunk.strip(),
-            'chunk_id': f'chunk_{len(chunks)}',
-            'token_count': current_length
-        })
-    
-    return chunks
+
+class Tokenizer:
+    """Token counting and token offsets on top of a tiktoken encoding.
+
+    Without an encoding (tiktoken could not load its BPE files, e.g. offline)
+    it falls back to counting words and punctuation, which tracks BPE counts
+    closely enough for chunk sizing.
+    """
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+        self.name = encoding.name if encoding is not None else 'regex-approx'
+
+    def count(self, text: str) -> int:
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        if self.encoding is not None:
+            return [len(t) for t in self.encoding.encode_ordinary_batch(texts)]
+        return [len(_APPROX_TOKEN_RE.findall(t)) for t in texts]
+
+    def offsets(self, text: str) -> List[int]:
+        """Character offset at which each token of text starts."""
+        if self.encoding is not None:
+            return self.encoding.decode_with_offsets(self.encoding.encode_ordinary(text))[1]
+        return [m.start() for m in _APPROX_TOKEN_RE.finditer(text)]
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model_name: str = DEFAULT_MODEL) -> Tokenizer:
+    try:
+        import tiktoken
+        try:
+            return Tokenizer(tiktoken.encoding_for_model(model_name))
+        except KeyError:
+            return Tokenizer(tiktoken.get_encoding('cl100k_base'))
+    except Exception as e:
+        log_event('tokenizer_fallback', model=model_name, error=str(e))
+        return Tokenizer()
+
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL) -> int:
+    return get_tokenizer(model_name).count(text)
+
+
+def _segments(text: str, tokenizer: Tokenizer, chunk_size: int):
+    """Split text at boundary offsets into (segment, token_count) pairs.
+
+    Segments are contiguous, so together they cover the text exactly and the
+    whole text is encoded once. A segment longer than chunk_size is cut at
+    token offsets.
+    """
+    cuts = [0] + [m.end() for m in _BOUNDARY_RE.finditer(text)] + [len(text)]
+    pieces = [text[a:b] for a, b in zip(cuts, cuts[1:]) if b > a]
+    for piece, count in zip(pieces, tokenizer.count_batch(pieces)):
+        if count <= chunk_size:
+            yield piece, count
+            continue
+        offs = tokenizer.offsets(piece)
+        # The first cut starts at 0, not the first token, so no leading whitespace is dropped
+        starts = [0] + offs[chunk_size::chunk_size]
+        ends = starts[1:] + [len(piece)]
+        for i, (a, b) in enumerate(zip(starts, ends)):
+            yield piece[a:b], min(chunk_size, len(offs) - i * chunk_size)
+
+
+class TextBuffer:
+    """Append-only cleaned text of one document, shared by the ChunkRecords cut
+    from it. Each page is stored once however many overlapping chunks cover it,
+    and release() drops the text once the chunks are persisted and indexed."""
+
+    __slots__ = ('_parts', '_starts', '_size')
+
+    def __init__(self):
+        self._parts: Optional[List[str]] = []
+        self._starts: List[int] = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, text: str) -> int:
+        """Add text at the end; returns its offset."""
+        start = self._size
+        self._parts.append(text)
+        self._starts.append(start)
+        self._size += len(text)
+        return start
+
+    def slice(self, start: int, end: int) -> str:
+        if self._parts is None or start >= end:
+            return ''
+        i = bisect_right(self._starts, start) - 1
+        pieces = []
+        while start < end and i < len(self._parts):
+            part, part_start = self._parts[i], self._starts[i]
+            pieces.append(part[start - part_start:end - part_start])
+            start = part_start + len(part)
+            i += 1
+        return pieces[0] if len(pieces) == 1 else ''.join(pieces)
+
+    @property
+    def released(self) -> bool:
+        return self._parts is None
+
+    def release(self):
+        self._parts = None
+        self._starts = []
+
+
+class ChunkRecord:
+    """A chunk stored as offsets into its document's TextBuffer.
+
+    Reads like the chunk dicts used elsewhere (``c['text']``, ``c.get('page')``,
+    ``c['id'] = ...``), so it can go anywhere they do. Its text is '' once the
+    buffer is released.
+    """
+
+    __slots__ = ('buffer', 'start', 'end', 'chunk_id', 'ordinal', 'token_count', 'page', 'id')
+    FIELDS = ('text', 'chunk_id', 'ordinal', 'token_count', 'page', 'id')
+
+    def __init__(self, buffer: Optional[TextBuffer], start: int, end: int, chunk_id: str, ordinal: Optional[int],
+                 token_count: int, page=None, id=None):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.chunk_id = chunk_id
+        self.ordinal = ordinal
+        self.token_count = token_count
+        self.page = page
+        self.id = id
+
+    @classmethod
+    def without_text(cls, chunk) -> 'ChunkRecord':
+        """A record keeping a chunk's metadata but not its text."""
+        return cls(None, 0, 0, chunk['chunk_id'], chunk.get('ordinal'), chunk.get('token_count'),
+                   chunk.get('page'), chunk.get('id'))
+
+    @property
+    def text(self) -> str:
+        return self.buffer.slice(self.start, self.end) if self.buffer is not None else ''
+
+    @property
+    def released(self) -> bool:
+        return self.buffer is None or self.buffer.released
+
+    def keys(self):
+        return self.FIELDS
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS or key == 'text':
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return f'ChunkRecord({self.chunk_id!r}, {self.start}:{self.end}, page={self.page!r})'
+
+
+def text_released(chunks) -> bool:
+    """Whether a document's chunks no longer carry their text."""
+    return bool(chunks) and isinstance(chunks[0], ChunkRecord) and chunks[0].released
+
+
+def iter_chunks(pages: Iterable[Dict], chunk_size: Optional[int] = None, overlap: int = CHUNK_OVERLAP_TOKENS,
+                model_name: str = DEFAULT_MODEL, buffer: Optional[TextBuffer] = None) -> Iterator[Dict]:
+    """Stream chunks of at most chunk_size tokens from {'page', 'text'} dicts.
+
+    Chunks are packed greedily from boundary-aligned segments and may span
+    pages; each chunk reports the page it starts on. Consecutive chunks share
+    up to ``overlap`` tokens of trailing segments.
+
+    With ``buffer`` each cleaned page is appended to it and the chunks are
+    ChunkRecords pointing into it instead of dicts holding their own copy of
+    the text; the texts are the same either way.
+    """
+    chunk_size = chunk_size or MAX_CHUNK_TOKENS
+    overlap = max(0, min(overlap, chunk_size // 2))
+    tokenizer = get_tokenizer(model_name)
+    pending = deque()  # (segment, tokens, page, offset in buffer)
+    pending_tokens = 0
+    fresh = 0  # segments not yet emitted in any chunk
+    n = 0
+
+    def make_chunk():
+        if buffer is None:
+            text = ''.join(s for s, _, _, _ in pending).strip()
+            return {'text': text, 'chunk_id': f'chunk_{n}', 'ordinal': n, 'token_count': pending_tokens,
+                    'page': pending[0][2]}
+        start, end = pending[0][3], pending[-1][3] + len(pending[-1][0])
+        raw = buffer.slice(start, end)
+        stripped = raw.lstrip()
+        start += len(raw) - len(stripped)
+        end = start + len(stripped.rstrip())
+        return ChunkRecord(buffer, start, end, f'chunk_{n}', n, pending_tokens, pending[0][2])
+
+    for page in pages:
+        text = clean_text(page.get('text', ''))
+        if not text:
+            continue
+        if pending:
+            pending.append(('\n', 0, page.get('page'), buffer.append('\n') if buffer is not None else None))
+        elif buffer is not None and len(buffer):
+            buffer.append('\n')
+        offset = buffer.append(text) if buffer is not None else None
+        for segment, tokens in _segments(text, tokenizer, chunk_size):
+            if fresh and pending_tokens + tokens > chunk_size:
+                chunk = make_chunk()
+                if chunk['text']:
+                    yield chunk
+                    n += 1
+                fresh = 0
+                # Keep trailing segments as overlap, but leave room for the new one
+                kept = 0
+                for i in range(len(pending) - 1, -1, -1):
+                    if kept + pending[i][1] > overlap:
+                        break
+                    kept += pending[i][1]
+                while pending and (pending_tokens > kept or pending_tokens + tokens > chunk_size):
+                    pending_tokens -= pending.popleft()[1]
+            pending.append((segment, tokens, page.get('page'), offset))
+            if offset is not None:
+                offset += len(segment)
+            pending_tokens += tokens
+            fresh += 1
+    if fresh:
+        chunk = make_chunk()
+        if chunk['text']:
+            yield chunk
+
+
+def chunk_text_token_aware(text: str, max_chunk_length: Optional[int] = None, model_name: str = DEFAULT_MODEL,
+                           chunk_size: Optional[int] = None, overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """Split text into chunks of at most chunk_size tokens (max_chunk_length is an alias)."""
+    return list(iter_chunks([{'page': None, 'text': text}], chunk_size or max_chunk_length, overlap, model_name))
@@ -0,0 +1,56 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class MemoryLimitExceeded(Exception):
+    """Raised when a reservation can't fit in a MemoryBudget in time."""
+
+
+class MemoryBudget:
+    """Bytes a worker process may spend on concurrent work at once.
+
+    Callers reserve an estimate up front and give it back when done; a caller
+    that doesn't fit waits for others to finish, up to ``timeout``. A request
+    larger than the whole budget fails immediately. A capacity of 0 disables
+    the budget.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None):
+        if not self.enabled:
+            return
+        if nbytes > self.capacity:
+            raise MemoryLimitExceeded(f'{nbytes} bytes exceeds the memory budget of {self.capacity} bytes')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.used + nbytes > self.capacity:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise MemoryLimitExceeded(f'Timed out waiting for {nbytes} bytes of the memory budget')
+                self._cond.wait(remaining)
+            self.used += nbytes
+
+    def release(self, nbytes: int):
+        if not self.enabled:
+            return
+        with self._cond:
+            self.used = max(0, self.used - nbytes)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = None):
+        self.acquire(nbytes, timeout)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class DeadlineExceeded(Exception):
+    """Raised when waiting for capacity would overrun the caller's deadline."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``.
+
+    Callers reserve capacity up front and are told how long to wait before the
+    reservation is covered, so concurrent callers queue fairly without polling.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> Tuple[float, float]:
+        """Take ``amount`` tokens, at most a full bucket, and return the seconds
+        to wait before using them and the number taken (what refund() should
+        give back)."""
+        if not self.enabled:
+            return 0.0, 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            # Never ask for more than a full bucket, or the request could never run
+            taken = min(amount, self.capacity)
+            self.level -= taken
+            return (0.0 if self.level >= 0 else -self.level / self.rate), taken
+
+    def refund(self, amount: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min limits for an upstream API.
+
+    ``pause`` lets a caller that saw a 429 with Retry-After hold back every
+    other caller sharing the limiter instead of letting them hit the same wall.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """Wait until one request carrying ``tokens`` tokens may be sent and
+        return the tokens actually reserved, for record_usage().
+
+        Raises DeadlineExceeded (after returning the reservation) if the wait
+        would end past ``deadline``, a ``time.monotonic()`` timestamp.
+        """
+        now = time.monotonic()
+        request_wait, requests = self.requests.reserve(1)
+        token_wait, reserved = self.tokens.reserve(tokens)
+        wait = max(request_wait, token_wait, self.blocked_until - now)
+        if deadline is not None and now + wait > deadline:
+            self.requests.refund(requests)
+            self.tokens.refund(reserved)
+            raise DeadlineExceeded(f'rate limit wait of {wait:.2f}s exceeds deadline')
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return reserved
+
+    def record_usage(self, reserved: float, actual: int):
+        """Correct a token reservation (as returned by acquire()) once the real usage is known."""
+        if actual < reserved:
+            self.tokens.refund(reserved - actual)
+        elif actual > reserved:
+            self.tokens.reserve(actual - reserved)
@@ -0,0 +1,269 @@
+"""In-process vector index used as an alternative to Pinecone.
+
+Vectors are grouped into namespaces (one per doc_id). Small namespaces are
+searched exactly with a single matrix multiply; namespaces past
+``ivf_threshold`` vectors also get an IVF index (k-means coarse quantizer)
+that only scans the ``nprobe`` closest lists. Namespaces can be saved as
+``.npy`` files, once per upsert or on flush(), and are loaded back
+memory-mapped.
+"""
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', '.cache/vector_index')  # empty keeps the index in memory only
+VECTOR_IVF_THRESHOLD = int(os.getenv('VECTOR_IVF_THRESHOLD', '20000'))
+VECTOR_IVF_NPROBE = int(os.getenv('VECTOR_IVF_NPROBE', '8'))
+
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def _normalise(vectors) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k of a (queries, n) score matrix, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp), np.empty((scores.shape[0], 0), dtype=np.float32)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class IVFIndex:
+    """Inverted-file index over a fixed matrix of unit vectors."""
+
+    def __init__(self, vectors: np.ndarray, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        n = vectors.shape[0]
+        self.nlist = max(1, min(n, nlist or int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalise(centroids)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        order = np.argsort(assign, kind='stable')
+        # Postings are one sorted array of row ids plus per-list offsets
+        self.postings = order.astype(np.int64)
+        self.offsets = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        probe_idx, _ = _top_k(queries @ self.centroids.T, min(nprobe, self.nlist))
+        all_idx, all_scores = [], []
+        for q, lists in zip(queries, probe_idx):
+            rows = np.concatenate([self.postings[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            scores = vectors[rows] @ q
+            top, top_scores = _top_k(scores[None, :], k)
+            all_idx.append(rows[top[0]])
+            all_scores.append(top_scores[0])
+        return all_idx, all_scores
+
+
+class Namespace:
+    """One namespace's ids and unit vectors.
+
+    Vectors live in the first ``size`` rows of a buffer that grows by
+    doubling, so appending a batch doesn't copy the whole matrix. Rows a
+    search may be reading (below ``size``) are never written in place: an
+    upsert that overwrites one copies the buffer first, and ids only grow by
+    appending, so a snapshot stays valid without holding the index lock.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray):
+        self.ids = ids
+        self.rows = {vid: i for i, vid in enumerate(ids)}
+        self.size = len(ids)
+        self._data = vectors
+        self.ivf = None
+        self.version = 0
+        self.dirty = False
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    def _reserve(self, rows: int, dim: int, copy: bool):
+        # Memory-mapped arrays are read-only, so updates work on a private copy
+        if not copy and rows <= len(self._data) and self._data.flags.writeable:
+            return
+        data = np.empty((max(rows, 2 * len(self._data), 64), dim), dtype=np.float32)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray):
+        rows, new_ids, overwrites = [], [], False
+        for vid, _ in zip(ids, vectors):
+            row = self.rows.get(vid)
+            if row is None:
+                row = self.rows[vid] = self.size + len(new_ids)
+                new_ids.append(vid)
+            elif row < self.size:
+                overwrites = True
+            rows.append(row)
+        self._reserve(self.size + len(new_ids), vectors.shape[1], copy=overwrites)
+        self._data[rows] = vectors[:len(rows)]
+        self.ids.extend(new_ids)
+        self.size += len(new_ids)
+        self.ivf = None
+        self.version += 1
+        self.dirty = True
+
+    def snapshot(self) -> Tuple[int, List[str], np.ndarray, Optional[IVFIndex]]:
+        """(version, ids, vectors, ivf) as of now; take it under the index lock."""
+        return self.version, self.ids, self.vectors, self.ivf
+
+    @staticmethod
+    def search(vectors: np.ndarray, ivf: Optional[IVFIndex], queries: np.ndarray, k: int, nprobe: int):
+        if ivf is not None:
+            return ivf.search(vectors, queries, k, nprobe)
+        idx, scores = _top_k(queries @ vectors.T, k)
+        return list(idx), list(scores)
+
+
+class LocalVectorIndex:
+    """Namespaced vector index with exact and IVF search and mmap persistence."""
+
+    def __init__(self, path: Optional[str] = VECTOR_INDEX_PATH, ivf_threshold: int = VECTOR_IVF_THRESHOLD,
+                 nprobe: int = VECTOR_IVF_NPROBE):
+        self.path = path or None
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._namespaces: Dict[str, Namespace] = {}
+        self._lock = threading.RLock()
+
+    def _files(self, namespace: str):
+        base = os.path.join(self.path, _SAFE_NAME_RE.sub('_', namespace))
+        return base + '.npy', base + '.ids.json'
+
+    def _get(self, namespace: str) -> Optional[Namespace]:
+        ns = self._namespaces.get(namespace)
+        if ns is None and self.path:
+            ns = self.load(namespace)
+        return ns
+
+    def has_namespace(self, namespace: str) -> bool:
+        with self._lock:
+            return self._get(namespace) is not None
+
+    def namespaces(self) -> List[str]:
+        with self._lock:
+            names = set(self._namespaces)
+        if self.path and os.path.isdir(self.path):
+            names.update(f[:-len('.ids.json')] for f in os.listdir(self.path) if f.endswith('.ids.json'))
+        return sorted(names)
+
+    def upsert(self, namespace: str, ids: Sequence[str], vectors, flush: bool = True):
+        """Add or replace vectors in namespace.
+
+        With ``flush=False`` the namespace is only written to disk by a later
+        flush(), so a document upserted in batches is saved once.
+        """
+        vectors = _normalise(vectors)
+        with self._lock:
+            ns = self._get(namespace)
+            if ns is None:
+                ns = Namespace([], np.empty((0, vectors.shape[1]), dtype=np.float32))
+                self._namespaces[namespace] = ns
+            ns.upsert(ids, vectors)
+            if flush and self.path:
+                self.save(namespace)
+
+    def flush(self, namespace: Optional[str] = None):
+        """Save namespace, or every namespace, changed since it was last saved."""
+        if not self.path:
+            return
+        with self._lock:
+            names = list(self._namespaces) if namespace is None else [namespace]
+            for name in names:
+                ns = self._namespaces.get(name)
+                if ns is not None and ns.dirty:
+                    self.save(name)
+
+    def fetch(self, namespace: str, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Stored (normalised) vectors for the ids present in namespace."""
+        with self._lock:
+            ns = self._get(namespace)
+            if ns is None:
+                return {}
+            return {vid: np.array(ns.vectors[ns.rows[vid]]) for vid in ids if vid in ns.rows}
+
+    def query(self, vector, top_k: int = 5,
+              namespace: Union[str, Sequence[str], None] = None) -> List[Tuple[str, str, float]]:
+        """Return up to top_k (namespace, id, cosine score) triples, best first.
+
+        namespace may be one name or several; without one every namespace is
+        searched. Results from several namespaces are merged by score.
+        """
+        return self.query_batch(vector, top_k, namespace)[0]
+
+    def query_batch(self, vectors, top_k: int = 5,
+                    namespace: Union[str, Sequence[str], None] = None) -> List[List[Tuple[str, str, float]]]:
+        """query() for a (queries, dim) matrix, one similarity search per namespace."""
+        queries = _normalise(vectors)
+        with self._lock:
+            if namespace is None:
+                names = self.namespaces()
+            else:
+                names = [namespace] if isinstance(namespace, str) else list(namespace)
+            spaces = [(n, ns, ns.snapshot()) for n, ns in ((n, self._get(n)) for n in names)
+                      if ns is not None and ns.size]
+        hits = [[] for _ in range(len(queries))]
+        for name, ns, (version, ids, vectors, ivf) in spaces:
+            if ivf is None and len(vectors) >= self.ivf_threshold:
+                # Built outside the lock; kept only if no upsert changed the namespace meanwhile
+                ivf = IVFIndex(np.asarray(vectors))
+                with self._lock:
+                    if ns.version == version:
+                        ns.ivf = ivf
+            idx, scores = Namespace.search(vectors, ivf, queries, top_k, self.nprobe)
+            for q_hits, q_idx, q_scores in zip(hits, idx, scores):
+                q_hits.extend((name, ids[i], float(s)) for i, s in zip(q_idx, q_scores))
+        for q_hits in hits:
+            q_hits.sort(key=lambda h: h[2], reverse=True)
+            del q_hits[top_k:]
+        return hits
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            if self.path:
+                for f in self._files(namespace):
+                    if os.path.exists(f):
+                        os.remove(f)
+
+    def save(self, namespace: str):
+        ns = self._namespaces[namespace]
+        os.makedirs(self.path, exist_ok=True)
+        vec_file, ids_file = self._files(namespace)
+        # Write to temp names first so a concurrent reader never sees half a namespace
+        np.save(vec_file + '.tmp.npy', np.asarray(ns.vectors, dtype=np.float32))
+        with open(ids_file + '.tmp', 'w') as f:
+            json.dump(ns.ids, f)
+        os.replace(vec_file + '.tmp.npy', vec_file)
+        os.replace(ids_file + '.tmp', ids_file)
+        ns.dirty = False
+
+    def load(self, namespace: str) -> Optional[Namespace]:
+        vec_file, ids_file = self._files(namespace)
+        if not (os.path.exists(vec_file) and os.path.exists(ids_file)):
+            return None
+        with open(ids_file) as f:
+            ids = json.load(f)
+        ns = Namespace(ids, np.load(vec_file, mmap_mode='r'))
+        self._namespaces[namespace] = ns
+        return ns
@@ -0,0 +1,70 @@
+"""Compare per-row create_chunk against bulk create_chunks.
+
+Needs DATABASE_URL pointing at a migrated Postgres. Usage:
+
+    python -m benchmarks.bench_bulk_ingest [--sizes 100 1000 10000]
+"""
+import argparse
+import json
+import time
+import uuid
+from app.db import SessionLocal
+from app import crud, models
+
+
+def make_chunks(n):
+    return [
+        {'text': f'Clause {i}: the insured shall notify the insurer within {i % 90} days. {uuid.uuid4()}',
+         'chunk_id': f'chunk_{i}', 'token_count': 20}
+        for i in range(n)
+    ]
+
+
+def per_row(url, chunks):
+    db = SessionLocal()
+    try:
+        for c in chunks:
+            crud.create_chunk(db, document_url=url, chunk_text=c['text'], token_count=c['token_count'],
+                              chunk_id=c['chunk_id'])
+    finally:
+        db.close()
+
+
+def bulk(url, chunks):
+    db = SessionLocal()
+    try:
+        crud.create_chunks(db, document_url=url, chunks=chunks)
+    finally:
+        db.close()
+
+
+def cleanup(url):
+    db = SessionLocal()
+    try:
+        db.query(models.DocumentChunk).filter(models.DocumentChunk.document_url == url).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        chunks = make_chunks(n)
+        for name, fn in (('per_row', per_row), ('bulk', bulk)):
+            url = f'bench://{name}/{uuid.uuid4()}'
+            start = time.perf_counter()
+            fn(url, chunks)
+            elapsed = time.perf_counter() - start
+            cleanup(url)
+            results.append({'chunks': n, 'mode': name, 'seconds': round(elapsed, 4),
+                            'chunks_per_second': round(n / elapsed, 1)})
+            print(json.dumps(results[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark the token-aware chunker against the previous word-count chunker.
+
+Usage:
+
+    python -m benchmarks.bench_chunking [--size-mb 1] [--chunk-size 700]
+"""
+import argparse
+import json
+import random
+import re
+import time
+from app.utils.chunking import chunk_text_token_aware, clean_text, get_tokenizer
+
+
+def legacy_chunk(text, max_chunk_length=700):
+    """The chunker this repo shipped before tiktoken: word counts and string concatenation."""
+    cleaned_text = clean_text(text)
+    chunks = []
+    current_chunk = ''
+    current_length = 0
+    sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', cleaned_text)
+    for sentence in sentences:
+        sentence_length = len(sentence.split())
+        if current_length + sentence_length > max_chunk_length:
+            if current_chunk:
+                chunks.append({'text': current_chunk.strip(), 'chunk_id': f'chunk_{len(chunks)}',
+                               'token_count': current_length})
+            current_chunk = sentence
+            current_length = sentence_length
+        else:
+            current_chunk = f'{current_chunk} {sentence}' if current_chunk else sentence
+            current_length += sentence_length
+    if current_chunk:
+        chunks.append({'text': current_chunk.strip(), 'chunk_id': f'chunk_{len(chunks)}',
+                       'token_count': current_length})
+    return chunks
+
+
+CLAUSES = [
+    'The Grace Period for payment of the premium shall be thirty (30) days.',
+    'Pre-existing Diseases are covered after thirty-six (36) months of continuous coverage.',
+    'AYUSH treatment is covered up to the Sum Insured in an AYUSH Hospital.',
+    'Room rent is capped at one percent (1%) of the Sum Insured per day.',
+    'Section 4.2 Exclusions:\nExpenses arising from hazardous sports are not payable.',
+]
+
+
+def policy_text(size_mb: float) -> str:
+    rng = random.Random(0)
+    parts, size = [], 0
+    while size < size_mb * 1024 * 1024:
+        clause = rng.choice(CLAUSES)
+        parts.append(clause)
+        size += len(clause) + 1
+    return ' '.join(parts)
+
+
+def timed(fn, *args, repeat=3, **kwargs):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=float, default=1.0)
+    parser.add_argument('--chunk-size', type=int, default=700)
+    args = parser.parse_args()
+
+    text = policy_text(args.size_mb)
+    tokenizer = get_tokenizer()
+    for name, fn, kwargs in (
+        ('legacy', legacy_chunk, {'max_chunk_length': args.chunk_size}),
+        ('token_aware', chunk_text_token_aware, {'chunk_size': args.chunk_size}),
+    ):
+        seconds, chunks = timed(fn, text, **kwargs)
+        # Measure real token counts so the two chunkers are compared on the same scale
+        tokens = tokenizer.count_batch([c['text'] for c in chunks])
+        print(json.dumps({
+            'chunker': name,
+            'tokenizer': tokenizer.name,
+            'input_bytes': len(text.encode()),
+            'seconds': round(seconds, 4),
+            'mb_per_second': round(args.size_mb / seconds, 2),
+            'chunks': len(chunks),
+            'max_chunk_tokens': max(tokens),
+            'chunks_over_budget': sum(t > args.chunk_size for t in tokens),
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end load benchmark for /hackrx/run against local stand-ins.
+
+Starts the fake Groq server from tests/fake_groq.py, serves generated policy
+PDFs and DOCX files from a local HTTP server, uses the in-process vector index
+and drives /hackrx/run in-process at a fixed concurrency. Needs DATABASE_URL
+pointing at a migrated Postgres. Usage:
+
+    python -m benchmarks.bench_e2e [--requests 40] [--concurrency 8] [--llm-latency 0.2]
+                                   [--rate-limit-every 0] [--cold] [--answer-cache]
+                                   [--documents-per-request 1] [--adaptive]
+
+By default every request reuses the same few documents (so after the first
+ingest the document cache serves them) and the answer cache is disabled so
+each question reaches the LLM; --cold gives every request a fresh URL and
+--answer-cache turns the answer cache back on. --adaptive sets
+ADAPTIVE_REASONING=true.
+
+The fake LLM answers a question with its clause (confidence 0.9) when the
+clause is in the prompt's evidence and with "Not found" (confidence 0.2)
+otherwise, so answer quality tracks whether retrieval and evidence depth got
+the right chunk to the LLM.
+
+Prints one JSON object: latency percentiles, throughput, answer quality,
+per-stage totals from app.metrics and LLM call/token counts. App logs go to
+stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from tests.fake_groq import FakeGroqServer
+
+QUESTIONS = [
+    'What is the grace period for premium payment?',
+    'What is the waiting period for pre-existing diseases?',
+    'Does the policy cover maternity expenses?',
+    'What is the waiting period for cataract surgery?',
+    'Are organ donor medical expenses covered?',
+    'What is the No Claim Discount offered?',
+    'Is there a benefit for preventive health check-ups?',
+    'How does the policy define a Hospital?',
+]
+
+CLAUSES = [
+    'A grace period of thirty days is provided for premium payment after the due date.',
+    'Pre-existing diseases are covered after thirty-six months of continuous coverage.',
+    'Maternity expenses are covered after twenty-four months, limited to two deliveries.',
+    'Cataract surgery has a waiting period of two years.',
+    'Medical expenses for an organ donor are covered when the organ is for an insured person.',
+    'A No Claim Discount of five percent on the base premium is offered on renewal.',
+    'Health check-up expenses are reimbursed at the end of every two continuous policy years.',
+    'A Hospital means an institution with at least ten inpatient beds and qualified nursing staff.',
+]
+
+
+def oracle_answer(body) -> str:
+    """Fake LLM reply: each question's clause if the prompt's evidence has it."""
+    prompt = body['messages'][-1]['content']
+    evidence = prompt.split('Evidence:', 1)[-1]
+
+    def reply(question):
+        if question in QUESTIONS and CLAUSES[QUESTIONS.index(question)] in evidence:
+            return {'answer': CLAUSES[QUESTIONS.index(question)], 'facts': {}, 'rationale': 'Quoted.',
+                    'confidence': 0.9}
+        return {'answer': 'Not found', 'facts': {}, 'rationale': '', 'confidence': 0.2}
+
+    if '\nQuestions:\n' in prompt:
+        asked = re.findall(r'^Q(\d+): (.*)$', prompt.split('Evidence:', 1)[0], re.M)
+        return json.dumps([dict(reply(q), id=int(n)) for n, q in asked])
+    question = re.search(r'^Question: (.*)$', prompt, re.M)
+    return json.dumps(reply(question.group(1) if question else ''))
+
+
+def policy_text(page: int) -> str:
+    lines = [f'Section {page}.{i}: {CLAUSES[(page + i) % len(CLAUSES)]}' for i in range(12)]
+    return '\n'.join(lines)
+
+
+def make_documents(directory: str, pages: int):
+    import pymupdf
+    import docx
+
+    names = []
+    pdf = pymupdf.open()
+    for p in range(pages):
+        page = pdf.new_page()
+        page.insert_textbox(pymupdf.Rect(40, 40, 560, 800), policy_text(p), fontsize=10)
+    pdf.save(os.path.join(directory, 'policy.pdf'))
+    names.append('policy.pdf')
+
+    document = docx.Document()
+    for p in range(pages):
+        for line in policy_text(p).split('\n'):
+            document.add_paragraph(line)
+        document.add_page_break()
+    document.save(os.path.join(directory, 'policy.docx'))
+    names.append('policy.docx')
+    return names
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(directory: str):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    return httpd, f'http://{host}:{port}'
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def drive(app, urls, questions, n_requests, concurrency, token):
+    import httpx
+
+    results = []
+    counter = iter(range(n_requests))
+    headers = {'Authorization': f'Bearer {token}'}
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport doesn't send lifespan events; run startup/shutdown as uvicorn would
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        async def worker():
+            for i in counter:
+                body = {'documents': urls(i), 'questions': questions}
+                start = time.perf_counter()
+                r = await client.post('/hackrx/run', json=body, headers=headers)
+                answers = r.json().get('answers') if r.status_code == 200 else None
+                results.append((time.perf_counter() - start, r.status_code, answers))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--questions', type=int, default=len(QUESTIONS))
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--llm-jitter', type=float, default=0.1)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth LLM call with a 429')
+    parser.add_argument('--retry-after', type=float, default=0.2)
+    parser.add_argument('--cold', action='store_true', help='use a fresh document URL for every request')
+    parser.add_argument('--answer-cache', action='store_true')
+    parser.add_argument('--documents-per-request', type=int, default=1,
+                        help='send this many different documents in each request')
+    parser.add_argument('--adaptive', action='store_true', help='set ADAPTIVE_REASONING=true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_e2e_')
+    docs_dir = os.path.join(workdir, 'docs')
+    os.makedirs(docs_dir)
+    names = make_documents(docs_dir, args.pages)
+    httpd, base_url = serve_directory(docs_dir)
+
+    with FakeGroqServer(answer=oracle_answer, latency=args.llm_latency, jitter=args.llm_jitter,
+                        rate_limit_every=args.rate_limit_every, retry_after=args.retry_after) as groq:
+        # Stand-ins must be configured before the app modules read their env
+        os.environ['GROQ_BASE_URL'] = groq.url
+        os.environ['GROQ_API_KEY'] = 'bench'
+        os.environ['VECTOR_BACKEND'] = 'local'
+        os.environ['VECTOR_INDEX_PATH'] = os.path.join(workdir, 'vector_index')
+        os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embeddings.sqlite3')
+        os.environ.setdefault('EMBEDDING_BACKEND', 'hashing')
+        if not args.answer_cache:
+            os.environ['ANSWER_CACHE_TTL'] = '0'
+        if args.adaptive:
+            os.environ['ADAPTIVE_REASONING'] = 'true'
+        for name, value in (('PINECONE_API_KEY', 'unused'), ('PINECONE_ENVIRONMENT', 'unused'),
+                            ('PINECONE_INDEX_NAME', 'unused'), ('HACKRX_TEAM_TOKEN', 'bench-token'),
+                            ('MAX_CHUNK_TOKENS', '700'), ('GROQ_MODEL', 'bench-model')):
+            os.environ.setdefault(name, value)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            from app.main import app
+            from app.config import settings
+            from app.metrics import STAGE_SECONDS, LLM_REQUESTS, LLM_TOKENS, ADAPTIVE_ANSWERS
+
+            stages_before = STAGE_SECONDS.snapshot()
+
+            def url(i, j=0):
+                url = f'{base_url}/{names[(i + j) % len(names)]}'
+                if args.cold:
+                    return f'{url}?r={i}-{j}'
+                # Past the generated files, the same file under another URL is another document
+                return f'{url}?copy={j}' if j >= len(names) else url
+
+            def urls(i):
+                if args.documents_per_request > 1:
+                    return [url(i, j) for j in range(args.documents_per_request)]
+                return url(i)
+
+            started = time.perf_counter()
+            results = asyncio.run(drive(app, urls, QUESTIONS[:args.questions], args.requests,
+                                        args.concurrency, settings.HACKRX_TEAM_TOKEN))
+            wall = time.perf_counter() - started
+            stages_after = STAGE_SECONDS.snapshot()
+    httpd.shutdown()
+
+    questions = QUESTIONS[:args.questions]
+    latencies = [seconds for seconds, status, _ in results if status == 200]
+    answered = [(q, a) for _, status, answers in results if status == 200 for q, a in zip(questions, answers)]
+    correct = sum(a == CLAUSES[QUESTIONS.index(q)] for q, a in answered)
+    max_tokens = [body.get('max_tokens') for body in groq.requests if body.get('max_tokens')]
+    stages = {}
+    for key, after in stages_after.items():
+        before = stages_before.get(key, {'count': 0, 'sum': 0.0})
+        count = after['count'] - before['count']
+        total = after['sum'] - before['sum']
+        if count:
+            stages[key[0]] = {'count': count, 'total_seconds': round(total, 4),
+                              'mean_ms': round(total / count * 1000, 2)}
+
+    report = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'questions_per_request': args.questions,
+        'cold': args.cold,
+        'documents_per_request': args.documents_per_request,
+        'adaptive': args.adaptive,
+        'ok': len(latencies),
+        'errors': len(results) - len(latencies),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(results) / wall, 2) if wall > 0 else None,
+        'latency_seconds': {
+            'p50': round(percentile(latencies, 50), 4) if latencies else None,
+            'p95': round(percentile(latencies, 95), 4) if latencies else None,
+            'p99': round(percentile(latencies, 99), 4) if latencies else None,
+            'max': round(max(latencies), 4) if latencies else None,
+        },
+        'quality': {
+            'answers': len(answered),
+            'correct': correct,
+            'accuracy': round(correct / len(answered), 4) if answered else None,
+        },
+        'stages': stages,
+        'llm': {
+            'requests': len(groq.requests),
+            'ok': LLM_REQUESTS.value(outcome='ok'),
+            'retries': LLM_REQUESTS.value(outcome='retry'),
+            'errors': LLM_REQUESTS.value(outcome='error'),
+            'prompt_tokens': LLM_TOKENS.value(kind='prompt'),
+            'completion_tokens': LLM_TOKENS.value(kind='completion'),
+            'mean_max_tokens': round(sum(max_tokens) / len(max_tokens), 1) if max_tokens else None,
+            'first_pass': ADAPTIVE_ANSWERS.value(outcome='first_pass'),
+            'escalated': ADAPTIVE_ANSWERS.value(outcome='escalated'),
+        },
+    }
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
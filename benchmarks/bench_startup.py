@@ -0,0 +1,102 @@
+"""Measure how long a worker takes to boot and serve its first request.
+
+Profiles ``import app.main`` with ``python -X importtime`` (total import time
+plus the heaviest top-level packages), then starts ``uvicorn app.main:app`` as
+the Procfile does and polls /health until it answers, several times. Uses the
+current environment (DATABASE_URL etc.); /health answers even when the
+database is unreachable, so the boot time doesn't depend on it. Usage:
+
+    python -m benchmarks.bench_startup [--runs 5] [--top 10] [--no-warm-up]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+DEFAULTS = (('PINECONE_API_KEY', 'unused'), ('PINECONE_ENVIRONMENT', 'unused'), ('PINECONE_INDEX_NAME', 'unused'),
+            ('HACKRX_TEAM_TOKEN', 'bench-token'), ('MAX_CHUNK_TOKENS', '700'), ('GROQ_API_KEY', 'bench'),
+            ('GROQ_MODEL', 'bench-model'))
+
+
+def import_profile(env, top):
+    """Seconds to import app.main and its heaviest packages, from -X importtime."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app.main'],
+                          env=env, capture_output=True, text=True, check=True)
+    packages = {}
+    total = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        if name == 'app.main':
+            total = int(cumulative_us) / 1e6
+        # A package's own row covers everything imported beneath it
+        if '.' not in name:
+            packages[name] = max(packages.get(name, 0), int(cumulative_us))
+    heaviest = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return total, [{'package': name, 'ms': round(us / 1000, 1)} for name, us in heaviest]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_response(env, timeout=30.0):
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1',
+                             '--port', str(port), '--ws', 'none', '--log-level', 'warning'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f'uvicorn exited with status {proc.returncode}')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=5) as r:
+                    r.read()
+                return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError('server did not answer /health')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--no-warm-up', action='store_true', help='set WARM_UP_ON_STARTUP=false')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for name, value in DEFAULTS:
+        env.setdefault(name, value)
+    if args.no_warm_up:
+        env['WARM_UP_ON_STARTUP'] = 'false'
+
+    import_seconds, heaviest = import_profile(env, args.top)
+    boots = [time_to_first_response(env) for _ in range(args.runs)]
+    print(json.dumps({
+        'import_seconds': round(import_seconds, 3) if import_seconds is not None else None,
+        'heaviest_imports': heaviest,
+        'runs': args.runs,
+        'first_response_seconds': {
+            'min': round(min(boots), 3),
+            'median': round(statistics.median(boots), 3),
+            'max': round(max(boots), 3),
+        },
+    }))
+
+
+if __name__ == '__main__':
+    main()
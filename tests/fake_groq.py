@@ -0,0 +1,101 @@
+"""Local stand-in for the Groq chat completions API.
+
+Runs an OpenAI-compatible ``/openai/v1/chat/completions`` endpoint on a
+background thread so the real Groq SDK can be pointed at it via base_url.
+Latency (a fixed part plus uniform jitter) and 429s (the first ``fail_first``
+requests and/or every ``rate_limit_every``-th one) are configurable, so it
+also serves as the LLM stand-in for benchmarks/bench_e2e.py. ``answer`` is
+either a fixed reply or a function of the request body, and token usage is
+estimated from the text at four characters per token.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqServer:
+    def __init__(self, answer='{"answer": "ok", "facts": {}, "rationale": "", "confidence": 0.9}',
+                 latency=0.0, fail_first=0, fail_status=429, retry_after=None, rate_limit_every=0,
+                 jitter=0.0):
+        self.answer = answer
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.rate_limit_every = rate_limit_every
+        self.requests = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _next_status(self, body):
+        with self._lock:
+            self.requests.append(body)
+            n = len(self.requests)
+        if n <= self.fail_first:
+            return self.fail_status
+        if self.rate_limit_every and n % self.rate_limit_every == 0:
+            return 429
+        return 200
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                status = server._next_status(body)
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + random.uniform(0, server.jitter))
+                if status == 200:
+                    content = server.answer(body) if callable(server.answer) else server.answer
+                    prompt_tokens = sum(len(m.get('content') or '') for m in body.get('messages', [])) // 4
+                    completion_tokens = len(content) // 4
+                    payload = {
+                        'id': f'chatcmpl-{len(server.requests)}',
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': body.get('model', 'fake'),
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': content},
+                            'finish_reason': 'stop'
+                        }],
+                        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                  'total_tokens': prompt_tokens + completion_tokens}
+                    }
+                else:
+                    payload = {'error': {'message': f'fake error {status}', 'type': 'rate_limit_exceeded'}}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429 and server.retry_after is not None:
+                    self.send_header('Retry-After', str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
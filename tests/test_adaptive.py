@@ -0,0 +1,95 @@
+import asyncio
+from unittest.mock import patch
+from app.answering import answer_questions
+from app.answer_cache import AnswerCache
+from app.reasoner import (evidence_depth, expected_answer_tokens, explain_and_answer_adaptive_async,
+                          prompt_version)
+from app.llm_groq import DEFAULT_MAX_TOKENS
+
+
+def _evidence(*scores, vector=True):
+    return [{'doc_id': 'd', 'chunk_id': f'c{i}', 'page': 1, 'text_snippet': f'chunk {i}',
+             'similarity_score': 0.03, 'vector_score': s if vector else None} for i, s in enumerate(scores)]
+
+
+def test_evidence_depth_follows_score_margin():
+    # One clear winner: only the minimum depth
+    assert evidence_depth(_evidence(0.9, 0.5, 0.4, 0.3, 0.2), min_k=2, margin=0.15) == 2
+    # Close scores further down the list are kept
+    assert evidence_depth(_evidence(0.9, 0.5, 0.85, 0.8, 0.2), min_k=2, margin=0.15) == 4
+    assert evidence_depth(_evidence(0.9), min_k=2) == 1
+    # Without vector scores the fused scores are used; equal ones keep everything
+    assert evidence_depth(_evidence(0.9, 0.1, 0.1, vector=False), min_k=1, margin=0.15) == 3
+
+
+def test_expected_answer_tokens():
+    short = expected_answer_tokens('What is the grace period for premium payment?')
+    long = expected_answer_tokens('List the exclusions for maternity expenses.')
+    assert short < long <= DEFAULT_MAX_TOKENS
+
+
+def _answer(confidence):
+    return '{"answer": "a", "facts": {}, "rationale": "", "confidence": %s}' % confidence
+
+
+@patch('app.reasoner.run_llm_async')
+def test_confident_first_pass_uses_top_evidence_only(mock_run):
+    async def fake(prompt, **kwargs):
+        return {'answer': _answer(0.9), 'metadata': {'finish_reason': 'stop'}}
+    mock_run.side_effect = fake
+    parsed = asyncio.run(explain_and_answer_adaptive_async('What is the grace period?',
+                                                           _evidence(0.9, 0.4, 0.3, 0.2)))
+    assert mock_run.call_count == 1
+    assert parsed['evidence_depth'] == 2 and not parsed.get('escalated')
+    prompt = mock_run.call_args.args[0]
+    assert 'chunk 1' in prompt and 'chunk 2' not in prompt
+    assert mock_run.call_args.kwargs['max_tokens'] == expected_answer_tokens('What is the grace period?')
+
+
+@patch('app.reasoner.GROQ_ESCALATION_MODEL', 'big-model')
+@patch('app.reasoner.run_llm_async')
+def test_low_confidence_escalates_to_all_evidence_and_larger_model(mock_run):
+    async def fake(prompt, **kwargs):
+        return {'answer': _answer(0.9 if kwargs.get('model') == 'big-model' else 0.1)}
+    mock_run.side_effect = fake
+    parsed = asyncio.run(explain_and_answer_adaptive_async('What is covered?', _evidence(0.9, 0.4, 0.3)))
+    assert mock_run.call_count == 2
+    second = mock_run.call_args
+    assert 'chunk 2' in second.args[0]
+    assert second.kwargs['max_tokens'] == DEFAULT_MAX_TOKENS and second.kwargs['model'] == 'big-model'
+    assert parsed['escalated'] and parsed['evidence_depth'] == 3 and parsed['confidence'] == 0.9
+
+
+@patch('app.answering.query_top_k_batch',
+       side_effect=lambda qs, k, doc_id, chunk_maps=None: [[
+           {'doc_id': 'd', 'chunk_id': f'c{i}', 'text': f'chunk {i}', 'score': 0.03, 'vector_score': s}
+           for i, s in enumerate((0.9, 0.4, 0.3))] for _ in qs])
+@patch('app.reasoner.run_llm_async')
+def test_adaptive_answers_list_only_used_sources(mock_run, mock_query):
+    async def fake(prompt, **kwargs):
+        return {'answer': _answer(0.8)}
+    mock_run.side_effect = fake
+    answers = asyncio.run(answer_questions(['q1'], [], cache=None, adaptive=True))
+    assert [s.chunk_id for s in answers[0].sources] == ['c0', 'c1']
+
+
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [[] for _ in qs])
+@patch('app.reasoner.run_llm_async')
+def test_adaptive_answers_are_cached_under_their_own_version(mock_run, mock_query):
+    async def fake(prompt, **kwargs):
+        return {'answer': _answer(0.8)}
+    mock_run.side_effect = fake
+    cache = AnswerCache(semantic=False)
+    asyncio.run(answer_questions(['q1'], [], doc_key='doc', cache=cache, adaptive=True))
+    calls = mock_run.call_count
+    asyncio.run(answer_questions(['q1'], [], doc_key='doc', cache=cache, adaptive=True))
+    assert mock_run.call_count == calls
+    # Plain answers don't reuse the adaptive ones
+    async def fake_plain(question, evidence, deadline=None, stats=None):
+        return {'answer': 'plain', 'facts': {}, 'rationale': '', 'confidence': 0.8}
+    with patch('app.answering.explain_and_answer_async', side_effect=fake_plain) as plain:
+        asyncio.run(answer_questions(['q1'], [], doc_key='doc', cache=cache))
+    assert plain.call_count == 1
+    assert prompt_version(True) != prompt_version(False)
+    with patch('app.reasoner.GROQ_ESCALATION_MODEL', 'big-model'):
+        assert prompt_version(True) != prompt_version(False) and 'big-model' in prompt_version(True)
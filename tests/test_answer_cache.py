@@ -0,0 +1,42 @@
+import time
+import numpy as np
+from app.answer_cache import AnswerCache
+from app.embeddings_ import HashingEmbedder, get_embeddings
+
+
+def embed(questions):
+    return get_embeddings(questions, embedder=HashingEmbedder(dim=256), cache=None)
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = AnswerCache(semantic=True, similarity=0.8, embed=embed)
+    cache.put_many('doc', 'v1', [('What is the grace period for premium payment?', 'thirty days')])
+    assert cache.get_many('doc', 'v1', ['what is the grace period for premium payment']) == ['thirty days']
+    assert cache.get_many('doc', 'v1', ['What is the grace period for the premium payment?']) == ['thirty days']
+    assert cache.get_many('doc', 'v1', ['Is AYUSH treatment covered?']) == [None]
+    # Other documents and prompt versions never share answers
+    assert cache.get_many('other', 'v1', ['What is the grace period for premium payment?']) == [None]
+    assert cache.get_many('doc', 'v2', ['What is the grace period for premium payment?']) == [None]
+    stats = cache.stats()
+    assert (stats['hits'], stats['semantic_hits'], stats['misses']) == (1, 1, 3)
+
+
+def test_ttl_and_lru_eviction():
+    cache = AnswerCache(max_entries=2, ttl=0.05, semantic=False)
+    cache.put_many('doc', 'v', [('a', 1), ('b', 2)])
+    cache.get_many('doc', 'v', ['a'])
+    cache.put_many('doc', 'v', [('c', 3)])
+    assert cache.get_many('doc', 'v', ['a', 'b', 'c']) == [1, None, 3]
+    time.sleep(0.06)
+    assert cache.get_many('doc', 'v', ['a', 'c']) == [None, None]
+
+
+def test_semantic_tier_is_off_by_default_and_scans_a_bounded_window():
+    assert not AnswerCache(embed=embed).semantic
+    cache = AnswerCache(semantic=True, similarity=0.8, embed=embed, max_candidates=2)
+    cache.put_many('doc', 'v', [('What is the grace period for premium payment?', 'thirty days')])
+    cache.put_many('doc', 'v', [('Is AYUSH treatment covered?', 'yes'), ('Is maternity covered?', 'no')])
+    # Still an exact hit, but pushed out of the near-duplicate window
+    assert cache.get_many('doc', 'v', ['what is the grace period for premium payment']) == ['thirty days']
+    assert cache.get_many('doc', 'v', ['What is the grace period for the premium payment?']) == [None]
+    assert sum(len(g) for g in cache._candidates.values()) == 2
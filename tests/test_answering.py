@@ -0,0 +1,37 @@
+import asyncio
+import time
+from unittest.mock import patch
+from app.answering import answer_questions
+from app.answer_cache import AnswerCache
+
+
+async def fake_explain(question, evidence, deadline=None, stats=None):
+    await asyncio.sleep(0.2)
+    if question == 'boom':
+        raise RuntimeError('llm down')
+    return {'answer': f'answer to {question}', 'facts': None, 'rationale': '', 'confidence': 0.9}
+
+
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [[] for _ in qs])
+@patch('app.answering.explain_and_answer_async', side_effect=fake_explain)
+def test_answers_concurrently_in_order(mock_explain, mock_query):
+    questions = ['q1', 'boom', 'q3', 'q4']
+    start = time.monotonic()
+    answers = asyncio.run(answer_questions(questions, [], concurrency=4, cache=None))
+    elapsed = time.monotonic() - start
+    assert [a.question for a in answers] == questions
+    assert answers[0].answer == 'answer to q1'
+    assert answers[1].answer.startswith('Error generating response')
+    assert answers[3].answer == 'answer to q4'
+    assert elapsed < 0.6
+
+
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [[] for _ in qs])
+@patch('app.answering.explain_and_answer_async', side_effect=fake_explain)
+def test_repeated_questions_are_served_from_cache(mock_explain, mock_query):
+    cache = AnswerCache(semantic=False)
+    asyncio.run(answer_questions(['q1', 'boom'], [], doc_key='doc', cache=cache))
+    answers = asyncio.run(answer_questions(['Q1?', 'boom'], [], doc_key='doc', cache=cache))
+    assert answers[0].answer == 'answer to q1' and answers[0].question == 'Q1?'
+    # Failed answers are not cached, so 'boom' was asked twice
+    assert mock_explain.call_count == 3
@@ -4,3 +4,29 @@ def test_chunking_short_text():
     chunks = chunk_text_token_aware(text, model_name='gpt-3.5-turbo', chunk_size=50)
     assert len(chunks) >= 1
     assert 'text' in chunks[0]
+
+
+def test_chunks_respect_token_budget_and_overlap():
+    text = ' '.join(f'Clause {i} applies to the insured.' for i in range(200))
+    chunks = chunk_text_token_aware(text, chunk_size=40, overlap=10)
+    assert len(chunks) > 1
+    assert all(c['token_count'] <= 40 for c in chunks)
+    # Consecutive chunks share their boundary sentence
+    last_sentence = chunks[0]['text'].rsplit('Clause', 1)[1]
+    assert chunks[1]['text'].startswith('Clause' + last_sentence)
+
+
+def test_iter_chunks_streams_pages_and_splits_long_runs():
+    import tiktoken
+    from app.utils.chunking import Tokenizer, iter_chunks, _segments
+    pages = [{'page': 1, 'text': 'Grace period is thirty days. ' * 30}, {'page': 2, 'text': 'Waiting period applies. ' * 30}]
+    chunks = list(iter_chunks(iter(pages), chunk_size=64, overlap=0))
+    assert chunks[0]['page'] == 1 and chunks[-1]['page'] == 2
+    assert [c['chunk_id'] for c in chunks] == [f'chunk_{i}' for i in range(len(chunks))]
+
+    # Byte-level encoding exercises the tiktoken code path without downloading BPE ranks
+    enc = tiktoken.Encoding(name='bytes', pat_str=r'\S+|\s+',
+                            mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+    pieces = list(_segments('y' * 100, Tokenizer(enc), 30))
+    assert [n for _, n in pieces] == [30, 30, 30, 10]
+    assert ''.join(p for p, _ in pieces) == 'y' * 100
@@ -0,0 +1,21 @@
+from app.context import pack_evidence
+from app.utils.chunking import count_tokens
+
+
+def test_pack_evidence_dedupes_and_keeps_relevant_sentences():
+    filler = ' '.join(f'Unrelated clause number {i} about office furniture.' for i in range(40))
+    evidence = [
+        {'chunk_id': 'c1', 'similarity_score': 0.9,
+         'text_snippet': filler + ' The grace period for premium payment is thirty days.'},
+        # Overlapping neighbour repeating the tail of c1
+        {'chunk_id': 'c2', 'similarity_score': 0.8,
+         'text_snippet': 'The grace period for premium payment is thirty days. Renewal needs a new proposal.'},
+    ]
+    stats = {}
+    packed = pack_evidence('What is the grace period for premium payment?', evidence,
+                           budget=60, snippet_max_tokens=40, stats=stats)
+    assert 'grace period' in packed[0]['text_snippet']
+    assert sum(count_tokens(p['text_snippet']) for p in packed) <= 60
+    # The repeated sentence is only sent once
+    assert ' '.join(p['text_snippet'] for p in packed).count('grace period') == 1
+    assert stats['packed_tokens'] < stats['evidence_tokens']
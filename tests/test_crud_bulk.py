@@ -0,0 +1,120 @@
+import functools
+import uuid
+from unittest.mock import patch
+import numpy as np
+from app.db import SessionLocal, get_engine, Base
+from app import crud, models
+
+Base.metadata.create_all(bind=get_engine())
+
+
+def test_create_chunks_dedupes_and_returns_ids():
+    url = f'test://{uuid.uuid4()}'
+    d1, d2 = uuid.uuid4().hex[:16], uuid.uuid4().hex[:16]
+    chunks = [
+        {'text': 'Grace period is thirty days.', 'chunk_id': 'chunk_0', 'token_count': 6},
+        {'text': 'Grace period is thirty days.', 'chunk_id': 'chunk_1', 'token_count': 6},
+        {'text': '\x00  ', 'chunk_id': 'chunk_2', 'token_count': 0},
+        {'text': 'Waiting period is 36 months.', 'chunk_id': 'chunk_3', 'token_count': 6},
+    ]
+    db = SessionLocal()
+    try:
+        first = crud.create_chunks(db, url, chunks, doc_id=d1)
+        assert [c['chunk_id'] for c in first] == ['chunk_0', 'chunk_3']
+        assert all(c['id'] for c in first)
+
+        # Re-ingesting the same text keeps the rows and re-tags them
+        second = crud.create_chunks(db, url, chunks, doc_id=d2)
+        assert [c['id'] for c in second] == [c['id'] for c in first]
+        assert len(crud.get_document_chunks(db, d2)) == 2
+        assert crud.get_document_chunks(db, d1) == []
+
+        rows = crud.get_chunks_by_ids(db, [(d2, 'chunk_3'), (d2, 'missing')])
+        assert list(rows) == [(d2, 'chunk_3')]
+        assert rows[(d2, 'chunk_3')].ordinal == 3
+        assert rows[(d2, 'chunk_3')].content_hash == crud.content_hash('Waiting period is 36 months.')
+    finally:
+        db.query(models.DocumentChunk).filter(models.DocumentChunk.document_url == url).delete()
+        db.commit()
+        db.close()
+
+
+def test_persistent_tier_serves_only_completed_documents():
+    from app.doc_cache import PersistentDocumentCache, make_entry
+    url = f'test://{uuid.uuid4()}'
+    doc_id = uuid.uuid4().hex[:16]
+    chunks = [{'text': f'Clause {i} applies.', 'chunk_id': f'chunk_{i}', 'ordinal': i, 'token_count': 3}
+              for i in range(4)]
+    persistent = PersistentDocumentCache(SessionLocal)
+    db = SessionLocal()
+    try:
+        # A failed ingest's first batch is committed but never marked complete
+        crud.create_chunks(db, url, chunks[:2], doc_id=doc_id)
+        assert persistent.get(doc_id) is None
+
+        crud.create_chunks(db, url, chunks[2:], doc_id=doc_id)
+        persistent.mark_complete(make_entry(doc_id, url, 'abc', chunks))
+        entry = persistent.get(doc_id)
+        assert len(entry['chunks']) == 4 and entry['content_hash'] == 'abc'
+
+        # Rows later re-tagged by another ingest of the same URL no longer add up
+        crud.create_chunks(db, url, chunks[:1], doc_id='other')
+        assert persistent.get(doc_id) is None
+
+        persistent.discard(doc_id)
+        assert crud.get_document_chunks(db, doc_id) == []
+        assert crud.get_completed_document(db, doc_id) is None
+    finally:
+        db.close()
+
+
+def test_shared_seen_set_dedupes_across_batches():
+    url = f'test://{uuid.uuid4()}'
+    doc_id = uuid.uuid4().hex[:16]
+    batches = [[{'text': 'Grace period is thirty days.', 'chunk_id': 'chunk_0', 'token_count': 6}],
+               [{'text': 'Grace period is thirty days.', 'chunk_id': 'chunk_1', 'token_count': 6},
+                {'text': 'Waiting period is 36 months.', 'chunk_id': 'chunk_2', 'token_count': 6}]]
+    seen = set()
+    db = SessionLocal()
+    try:
+        kept = [c['chunk_id'] for batch in batches for c in crud.create_chunks(db, url, batch, doc_id=doc_id, seen=seen)]
+        assert kept == ['chunk_0', 'chunk_2']
+        assert sorted(r.chunk_id for r in crud.get_document_chunks(db, doc_id)) == ['chunk_0', 'chunk_2']
+    finally:
+        crud.delete_document(db, doc_id)
+        db.close()
+
+def test_text_repeated_across_batches_keeps_one_row_per_chunk():
+    from app.doc_cache import PersistentDocumentCache, make_entry
+    from app.ingest import _run_pipeline
+    from app.lexical_index import LexicalIndex
+    from app.pipeline import IngestPipeline
+    from app.utils.chunking import iter_chunks, text_released
+    url = f'test://{uuid.uuid4()}'
+    doc_id = uuid.uuid4().hex[:16]
+    pages = [{'page': 1, 'text': 'Grace period is thirty days. Waiting period is 36 months. '
+                                 'Grace period is thirty days. Room rent is capped.'}]
+    small_chunks = lambda pages, buffer=None: iter_chunks(pages, chunk_size=6, overlap=0, buffer=buffer)
+    with patch('app.ingest.iter_chunks', side_effect=small_chunks), \
+            patch('app.ingest.IngestPipeline', side_effect=functools.partial(IngestPipeline, embed_batch=2)), \
+            patch('app.ingest.get_embeddings', side_effect=lambda texts: np.ones((len(texts), 4), dtype=np.float32)), \
+            patch('app.ingest.upsert_embeddings') as mock_upsert, patch('app.ingest.flush_vectors'), \
+            patch('app.ingest.lexical_index', LexicalIndex()):
+        chunks = _run_pipeline(url, doc_id, iter(pages), low_memory=True)
+    db = SessionLocal()
+    try:
+        # chunk_2 repeats chunk_0's text in the second batch and is dropped rather than re-tagging its row
+        assert [c['chunk_id'] for c in chunks] == ['chunk_0', 'chunk_1', 'chunk_3']
+        assert [c['chunk_id'] for call in mock_upsert.call_args_list for c in call.args[1]] == \
+            ['chunk_0', 'chunk_1', 'chunk_3']
+        assert text_released(chunks)
+        rows = crud.get_chunks_by_ids(db, [(doc_id, c['chunk_id']) for c in chunks])
+        assert rows[(doc_id, 'chunk_0')].chunk_text == 'Grace period is thirty days.'
+        assert len(rows) == len(chunks) == len(crud.get_document_chunks(db, doc_id))
+
+        persistent = PersistentDocumentCache(SessionLocal)
+        persistent.mark_complete(make_entry(doc_id, url, 'abc', chunks))
+        assert len(persistent.get(doc_id)['chunks']) == 3
+    finally:
+        crud.delete_document(db, doc_id)
+        db.close()
@@ -0,0 +1,45 @@
+import asyncio
+import uuid
+from app.db import AsyncSessionLocal, SessionLocal, dispose_async_engine
+from app import crud
+from app.main import health_check
+
+
+def run(fn):
+    # Pooled asyncpg connections belong to the loop that opened them
+    async def go():
+        try:
+            return await fn()
+        finally:
+            await dispose_async_engine()
+    return asyncio.run(go())
+
+
+def test_chunks_are_fetched_by_id_on_the_async_engine():
+    url = f'test://{uuid.uuid4()}'
+    doc_id = uuid.uuid4().hex[:16]
+    chunks = [
+        {'text': 'Grace period is thirty days.', 'chunk_id': 'chunk_0', 'token_count': 6},
+        {'text': 'Waiting period is 36 months.', 'chunk_id': 'chunk_1', 'token_count': 6},
+    ]
+    db = SessionLocal()
+    try:
+        crud.create_chunks(db, url, chunks, doc_id=doc_id)
+
+        async def go():
+            async with AsyncSessionLocal() as adb:
+                return await crud.get_chunks_by_ids_async(adb, [(doc_id, 'chunk_1'), (doc_id, 'missing')])
+
+        rows = run(go)
+        assert list(rows) == [(doc_id, 'chunk_1')]
+        assert rows[(doc_id, 'chunk_1')].chunk_text == 'Waiting period is 36 months.'
+    finally:
+        crud.delete_document(db, doc_id)
+        db.close()
+
+
+def test_health_reports_pool_utilization():
+    body = run(health_check)
+    assert body['status'] == 'healthy'
+    assert body['pool']['async']['checked_out'] == 0
+    assert 0 <= body['pool']['sync']['utilization'] <= 1
@@ -0,0 +1,102 @@
+from unittest.mock import MagicMock, patch
+import numpy as np
+from sqlalchemy.exc import OperationalError
+from app.doc_cache import DocumentCache, LRUDocumentCache, make_entry, stable_doc_id
+from app.extractors import Download
+from app.crud import content_hash
+import pytest
+from app.ingest import IngestError, ingest_document, _incremental_embed
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUDocumentCache(max_entries=2)
+    for doc_id in ('a', 'b'):
+        lru.put(make_entry(doc_id, 'u', None, []))
+    lru.get('a')
+    lru.put(make_entry('c', 'u', None, []))
+    assert lru.get('b') is None
+    assert lru.get('a') is not None
+
+
+def test_stable_doc_id():
+    assert stable_doc_id('u', 'h') == stable_doc_id('u', 'h')
+    assert stable_doc_id('u', 'h') != stable_doc_id('u', 'h2')
+
+
+def fake_download(url):
+    blob = Download(url, 'text/plain')
+    blob.write(b'Policy text. Grace period is thirty days.')
+    return blob.finish()
+
+
+@patch('app.ingest._indexed_hashes', return_value={})
+@patch('app.ingest.has_vectors', return_value=True)
+@patch('app.ingest.get_embeddings', side_effect=lambda texts: np.zeros((len(texts), 4), dtype=np.float32))
+@patch('app.ingest.upsert_embeddings')
+@patch('app.ingest._persist_chunks', side_effect=lambda url, doc_id, chunks, *args: chunks)
+@patch('app.ingest.download', side_effect=fake_download)
+def test_repeated_document_skips_pipeline(mock_download, mock_persist, mock_upsert, mock_embed, mock_has_vectors,
+                                          mock_hashes):
+    cache = DocumentCache(LRUDocumentCache())
+    with patch('app.ingest.probe_validators', return_value={'etag': '"v1"'}):
+        first = ingest_document('https://example.com/p.txt', cache)
+        second = ingest_document('https://example.com/p.txt', cache)
+    assert first['doc_id'] == second['doc_id']
+    assert mock_download.call_count == 1
+    assert mock_persist.call_count == 1
+    assert mock_upsert.call_count == 1
+    assert second['vector_ids'] == [f"{first['doc_id']}::chunk_0"]
+    assert second['chunks'][0]['page'] == 1
+
+    # Without validators the document is downloaded again but not re-ingested
+    with patch('app.ingest.probe_validators', return_value={}):
+        third = ingest_document('https://example.com/p.txt', cache)
+    assert third['doc_id'] == first['doc_id']
+    assert mock_download.call_count == 2
+    assert mock_persist.call_count == 1
+
+
+@patch('app.ingest.get_embeddings', side_effect=lambda texts: np.full((len(texts), 2), 2.0, dtype=np.float32))
+@patch('app.ingest.fetch_vectors', side_effect=lambda ids: {k: np.ones(2, dtype=np.float32) for k in ids})
+def test_reingest_only_embeds_changed_chunks(mock_fetch, mock_embed):
+    previous = {content_hash('Unchanged clause.'): ('old-doc', 'chunk_0')}
+    counts = {'reused': 0}
+    vectors = _incremental_embed(previous, counts)(['Unchanged clause.', 'New clause.'])
+    mock_embed.assert_called_once_with(['New clause.'])
+    assert vectors.tolist() == [[1.0, 1.0], [2.0, 2.0]]
+    assert counts['reused'] == 1
+
+
+@patch('app.ingest._indexed_hashes', return_value={})
+@patch('app.ingest.get_embeddings', side_effect=lambda texts: np.zeros((len(texts), 4), dtype=np.float32))
+@patch('app.ingest.upsert_embeddings', side_effect=RuntimeError('index unavailable'))
+@patch('app.ingest._persist_chunks', side_effect=lambda url, doc_id, chunks, *args: chunks)
+@patch('app.ingest.probe_validators', return_value={})
+@patch('app.ingest.download', side_effect=fake_download)
+def test_failed_ingest_is_discarded_and_reported(mock_download, mock_probe, mock_persist, mock_upsert, mock_embed,
+                                                 mock_hashes):
+    cache = DocumentCache(LRUDocumentCache())
+    with patch.object(cache, 'discard') as mock_discard:
+        with pytest.raises(IngestError, match='index unavailable'):
+            ingest_document('https://example.com/p.txt', cache)
+    mock_discard.assert_called_once()
+    assert len(cache.memory) == 0
+
+
+@patch('app.ingest._indexed_hashes', return_value={})
+@patch('app.ingest.get_embeddings', side_effect=lambda texts: np.zeros((len(texts), 4), dtype=np.float32))
+@patch('app.ingest.upsert_embeddings')
+@patch('app.ingest.probe_validators', return_value={})
+@patch('app.ingest.download', side_effect=fake_download)
+def test_failed_chunk_write_is_not_marked_complete(mock_download, mock_probe, mock_upsert, mock_embed, mock_hashes):
+    session = MagicMock()
+    session.execute.side_effect = OperationalError('INSERT', {}, Exception('connection lost'))
+    cache = DocumentCache(LRUDocumentCache())
+    with patch('app.ingest.SessionLocal', return_value=session), \
+            patch.object(cache, 'put') as mock_put, patch.object(cache, 'discard') as mock_discard:
+        with pytest.raises(IngestError, match='connection lost'):
+            ingest_document('https://example.com/p.txt', cache)
+    session.rollback.assert_called_once()
+    mock_upsert.assert_not_called()
+    mock_discard.assert_called_once()
+    mock_put.assert_not_called()
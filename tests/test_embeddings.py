@@ -0,0 +1,32 @@
+import numpy as np
+from app.embeddings_ import EmbeddingCache, HashingEmbedder, get_embeddings
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.encoded = 0
+
+    def encode(self, texts):
+        self.encoded += len(texts)
+        return super().encode(texts)
+
+
+def test_hashing_embeddings_are_deterministic_and_normalised():
+    texts = ['Grace period of thirty days', 'Waiting period for PED', '']
+    out = get_embeddings(texts, embedder=HashingEmbedder(dim=128), cache=None)
+    assert out.shape == (3, 128)
+    assert out.dtype == np.float32 and out.flags['C_CONTIGUOUS']
+    assert np.allclose(np.linalg.norm(out[:2], axis=1), 1.0)
+    assert np.array_equal(out, get_embeddings(texts, embedder=HashingEmbedder(dim=128), cache=None))
+    assert out[0] @ out[0] > out[0] @ out[1]
+
+
+def test_cache_skips_already_embedded_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'emb.sqlite3'))
+    embedder = CountingEmbedder()
+    first = get_embeddings(['a b', 'c d', 'a b'], embedder=embedder, cache=cache, batch_size=1)
+    assert embedder.encoded == 2
+    second = get_embeddings(['c d', 'a b', 'e f'], embedder=embedder, cache=cache)
+    assert embedder.encoded == 3
+    assert np.array_equal(second[0], first[1]) and np.array_equal(second[1], first[0])
@@ -0,0 +1,133 @@
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+import docx
+import pymupdf
+import pytest
+from app.extractors import (DocumentTooLarge, Download, DownloadError, download, iter_pages, iter_pdf_pages,
+                            sniff_kind, _iter_pdf_pages_parallel)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(tmp_path)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield tmp_path, f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_pdf(path, pages):
+    doc = pymupdf.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_pdf_pages_are_numbered(file_server):
+    root, base = file_server
+    make_pdf(root / 'policy.pdf', ['Grace period thirty days', 'Waiting period 36 months', 'AYUSH covered'])
+    with download(f'{base}/policy.pdf') as blob:
+        assert sniff_kind(blob) == 'pdf'
+        pages = list(iter_pages(blob))
+    assert [p['page'] for p in pages] == [1, 2, 3]
+    assert 'Waiting period' in pages[1]['text']
+
+
+def test_large_download_spools_to_disk(file_server):
+    root, base = file_server
+    (root / 'big.txt').write_text('clause\n' * 50000 + '\fsecond page')
+    with download(f'{base}/big.txt') as in_memory, download(f'{base}/big.txt', max_memory=1024) as spooled:
+        assert in_memory.path is None
+        assert spooled.path is not None
+        assert spooled.sha256 == in_memory.sha256
+        pages = list(iter_pages(spooled))
+    assert [p['page'] for p in pages] == [1, 2]
+    assert pages[1]['text'] == 'second page'
+
+
+def test_download_size_limit(file_server):
+    root, base = file_server
+    (root / 'big.txt').write_text('clause\n' * 50000)
+    with pytest.raises(DocumentTooLarge):
+        download(f'{base}/big.txt', max_bytes=100000)
+    with download(f'{base}/big.txt', max_bytes=400000) as blob:
+        assert blob.size == 350000
+
+
+def test_docx_and_html(file_server):
+    root, base = file_server
+    d = docx.Document()
+    d.add_paragraph('Room rent is capped at 1% of Sum Insured.')
+    d.add_page_break()
+    d.add_paragraph('ICU charges are capped at 2%.')
+    d.save(str(root / 'wording.docx'))
+    (root / 'faq.html').write_text('<html><head><style>p{}</style></head><body><p>Cataract is covered.</p><script>x()</script></body></html>')
+
+    with download(f'{base}/wording.docx') as blob:
+        assert sniff_kind(blob) == 'docx'
+        pages = list(iter_pages(blob))
+    assert [p['page'] for p in pages] == [1, 2]
+    assert 'ICU' in pages[1]['text']
+
+    with download(f'{base}/faq.html') as blob:
+        pages = list(iter_pages(blob))
+    assert pages[0]['text'].strip() == 'Cataract is covered.'
+
+
+def test_parallel_pdf_extraction_keeps_order(tmp_path):
+    make_pdf(tmp_path / 'long.pdf', [f'page marker {i}' for i in range(12)])
+    pages = list(_iter_pdf_pages_parallel(str(tmp_path / 'long.pdf'), 12, workers=2))
+    assert [p['page'] for p in pages] == list(range(1, 13))
+    assert all(f'page marker {i}' in p['text'] for i, p in enumerate(pages))
+
+
+def test_in_memory_pdf_with_many_pages_is_extracted_in_parallel(file_server):
+    root, base = file_server
+    make_pdf(root / 'long.pdf', [f'page marker {i}' for i in range(12)])
+    with download(f'{base}/long.pdf') as blob, \
+            patch('app.extractors._iter_pdf_pages_parallel', wraps=_iter_pdf_pages_parallel) as parallel:
+        assert blob.path is None
+        pages = list(iter_pdf_pages(blob, workers=2, parallel_min_pages=10))
+        spilled = blob.path
+        parallel.assert_called_once_with(spilled, 12, 2)
+    assert [p['page'] for p in pages] == list(range(1, 13))
+    assert all(f'page marker {i}' in p['text'] for i, p in enumerate(pages))
+    # The spilled copy goes away with the download
+    assert not os.path.exists(spilled)
+
+
+def test_interrupted_download_removes_its_spool_file():
+    def body(chunk_size):
+        yield b'x' * 4096
+        raise ConnectionResetError('connection reset by peer')
+    response = MagicMock(headers={'Content-Type': 'application/pdf'})
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = body
+    spooled = []
+    real_spill = Download.spill
+
+    def spill(blob):
+        spooled.append(real_spill(blob))
+        return spooled[-1]
+    with patch('requests.get', return_value=response), patch.object(Download, 'spill', spill):
+        with pytest.raises(ConnectionResetError):
+            download('https://example.com/big.pdf', max_memory=1024)
+    assert len(spooled) == 1 and not os.path.exists(spooled[0])
+
+
+def test_failed_download_is_an_ingest_error(file_server):
+    from app.ingest import IngestError, ingest_document
+    _, base = file_server
+    with pytest.raises(DownloadError, match='404'):
+        download(f'{base}/missing.pdf')
+    with pytest.raises(IngestError, match='Could not download'):
+        ingest_document(f'{base}/missing.pdf')
@@ -0,0 +1,76 @@
+import time
+import uuid
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from app.main import app
+from app.config import settings
+from app.db import SessionLocal
+from app import models
+
+HEADERS = {'Authorization': f'Bearer {settings.HACKRX_TEAM_TOKEN}'}
+DOC = {'doc_id': 'doc-job', 'content_hash': None, 'chunks': [{'chunk_id': 'chunk_0', 'text': 'Grace period is 30 days.'}]}
+
+
+def _delete_jobs(url):
+    with SessionLocal() as db:
+        db.execute(delete(models.IngestJob).where(models.IngestJob.document_url == url))
+        db.commit()
+
+
+def _wait_until_finished(client, handle, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        body = client.get(f'/documents/{handle}', headers=HEADERS).json()
+        if body['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return body
+        time.sleep(0.05)
+
+
+@patch('app.main.answer_questions')
+@patch('app.main.ingest_document')
+@patch('app.main.load_document', return_value=DOC)
+@patch('app.jobs.ingest_document', return_value=DOC)
+def test_prewarmed_document_skips_ingest_on_run(mock_job_ingest, mock_load, mock_inline_ingest, mock_answer):
+    url = f'https://example.com/{uuid.uuid4()}.pdf'
+
+    async def fake_answers(questions, chunks, *args, **kwargs):
+        assert [d['doc_id'] for d in kwargs['documents']] == ['doc-job']
+        return []
+    mock_answer.side_effect = fake_answers
+
+    try:
+        with TestClient(app) as client:
+            r = client.post('/documents', json={'url': url}, headers=HEADERS)
+            assert r.status_code == 202
+            handle = r.json()['document_id']
+            assert r.json()['status'] == 'queued'
+
+            body = _wait_until_finished(client, handle)
+            assert body['status'] == 'done'
+            assert body['doc_id'] == 'doc-job' and body['chunks'] == 1
+            mock_job_ingest.assert_called_once_with(url)
+
+            r = client.post('/hackrx/run', json={'document_id': handle, 'questions': ['q']}, headers=HEADERS)
+            assert r.status_code == 200
+            mock_load.assert_called_once_with('doc-job')
+            mock_inline_ingest.assert_not_called()
+    finally:
+        _delete_jobs(url)
+
+
+@patch('app.jobs.ingest_document', side_effect=RuntimeError('404 Not Found'))
+def test_failed_job_is_reported(mock_job_ingest):
+    url = f'https://example.com/{uuid.uuid4()}.pdf'
+    try:
+        with TestClient(app) as client:
+            handle = client.post('/documents', json={'url': url}, headers=HEADERS).json()['document_id']
+            body = _wait_until_finished(client, handle)
+            assert body['status'] == 'failed'
+            assert '404' in body['error']
+            r = client.post('/hackrx/run', json={'document_id': handle, 'questions': ['q']}, headers=HEADERS)
+            assert r.status_code == 422
+            assert client.get(f'/documents/{uuid.uuid4()}', headers=HEADERS).status_code == 404
+            assert client.post('/hackrx/run', json={'questions': ['q']}, headers=HEADERS).status_code == 422
+    finally:
+        _delete_jobs(url)
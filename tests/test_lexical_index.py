@@ -0,0 +1,45 @@
+from unittest.mock import patch
+from app.lexical_index import BM25Index, LexicalIndex, reciprocal_rank_fusion, rerank
+from app import retriever
+
+CHUNKS = [
+    {'chunk_id': 'chunk_0', 'text': 'The policy covers hospitalisation expenses for the insured person.'},
+    {'chunk_id': 'chunk_1', 'text': 'AYUSH treatment is covered up to the Sum Insured in an AYUSH hospital.'},
+    {'chunk_id': 'chunk_2', 'text': 'A grace period of thirty days is allowed for premium payment.'},
+    {'chunk_id': 'chunk_3', 'text': 'The policy period is one year and the policy is renewable.'},
+]
+
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index([c['chunk_id'] for c in CHUNKS], [c['text'] for c in CHUNKS])
+    hits = index.search_batch(['Is AYUSH treatment covered?', 'grace period for premium', 'xyz'], k=2)
+    assert hits[0][0][0] == 'chunk_1'
+    assert hits[1][0][0] == 'chunk_2'
+    assert hits[2] == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd']])
+    assert fused[0][0] == 'b'
+    assert {item for item, _ in fused} == {'a', 'b', 'c', 'd'}
+
+
+def test_rerank_prefers_full_phrase_coverage():
+    hits = [{'chunk_id': 'chunk_3', 'text': CHUNKS[3]['text']}, {'chunk_id': 'chunk_2', 'text': CHUNKS[2]['text']}]
+    assert rerank('grace period', hits)[0]['chunk_id'] == 'chunk_2'
+
+
+@patch('app.retriever._vector_top_k_batch',
+       side_effect=lambda qs, k, doc_id: [[{'chunk_id': 'chunk_0', 'doc_id': doc_id, 'score': 0.4},
+                                           {'chunk_id': 'chunk_3', 'doc_id': doc_id, 'score': 0.3}] for _ in qs])
+@patch('app.retriever.lexical_index', LexicalIndex())
+def test_hybrid_query_fuses_lexical_hits(mock_vector):
+    chunk_map = {c['chunk_id']: c for c in CHUNKS}
+    hits = retriever.query_top_k_batch(['AYUSH hospital'], k=2, doc_id='doc', chunk_map=chunk_map)[0]
+    assert 'chunk_1' in [h['chunk_id'] for h in hits]
+    lexical_hit = next(h for h in hits if h['chunk_id'] == 'chunk_1')
+    assert lexical_hit['bm25_score'] > 0 and lexical_hit['vector_score'] is None
+    assert lexical_hit['text'] == CHUNKS[1]['text']
+    # Vector-only mode ignores the lexical index
+    vector_only = retriever.query_top_k_batch(['AYUSH hospital'], k=2, doc_id='doc', chunk_map=chunk_map, mode='vector')[0]
+    assert [h['chunk_id'] for h in vector_only] == ['chunk_0', 'chunk_3']
@@ -0,0 +1,87 @@
+import asyncio
+import gc
+import time
+import pytest
+from app import llm_groq
+from app.utils.rate_limit import DeadlineExceeded, RateLimiter, TokenBucket
+from tests.fake_groq import FakeGroqServer
+
+
+@pytest.fixture(autouse=True)
+def no_limits(monkeypatch):
+    monkeypatch.setattr(llm_groq, 'limiter', RateLimiter())
+    monkeypatch.setattr(llm_groq, 'GROQ_BACKOFF_BASE', 0.01)
+
+
+def run(**kwargs):
+    async def go():
+        try:
+            return await llm_groq.run_llm_async('question', **kwargs)
+        finally:
+            await llm_groq.close_async_client()
+    return asyncio.run(go())
+
+
+def test_retries_429_honoring_retry_after(monkeypatch):
+    with FakeGroqServer(fail_first=2, retry_after=0.3) as server:
+        monkeypatch.setattr(llm_groq, 'GROQ_BASE_URL', server.url)
+        start = time.monotonic()
+        resp = run()
+        elapsed = time.monotonic() - start
+    assert 'error' not in resp
+    assert '"answer": "ok"' in resp['answer']
+    assert len(server.requests) == 3
+    assert elapsed >= 0.6
+
+
+def test_retries_server_errors_then_gives_up(monkeypatch):
+    monkeypatch.setattr(llm_groq, 'GROQ_MAX_RETRIES', 2)
+    with FakeGroqServer(fail_first=10, fail_status=503) as server:
+        monkeypatch.setattr(llm_groq, 'GROQ_BASE_URL', server.url)
+        resp = run()
+    assert resp['answer'].startswith('Error generating response')
+    assert len(server.requests) == 3
+
+
+def test_deadline_fails_fast(monkeypatch):
+    with FakeGroqServer(latency=2.0) as server:
+        monkeypatch.setattr(llm_groq, 'GROQ_BASE_URL', server.url)
+        start = time.monotonic()
+        resp = run(deadline=time.monotonic() + 0.3)
+        elapsed = time.monotonic() - start
+    assert 'error' in resp
+    assert elapsed < 1.5
+
+
+def test_async_client_is_dropped_with_its_loop(monkeypatch):
+    monkeypatch.setattr(llm_groq, 'GROQ_API_KEY', 'test')
+
+    async def build():
+        return llm_groq.get_async_client()
+
+    first = asyncio.run(build())
+    gc.collect()
+    # A later loop may reuse the dead loop's id, but never its client
+    assert len(llm_groq._async_clients) == 0
+    second = asyncio.run(build())
+    assert second is not first
+    gc.collect()
+    assert len(llm_groq._async_clients) == 0
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_minute=120, capacity=1)
+    assert bucket.reserve(1) == (0, 1)
+    wait, taken = bucket.reserve(1)
+    assert wait == pytest.approx(0.5, abs=0.05) and taken == 1
+
+
+def test_deadline_refund_returns_only_what_was_reserved():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+    asyncio.run(limiter.acquire(100))
+    level = limiter.tokens.level
+    # More than a full bucket is reserved as exactly one full bucket, and that is all that comes back
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(limiter.acquire(5000, deadline=time.monotonic()))
+    assert limiter.tokens.level == pytest.approx(level, abs=1)
+    assert limiter.tokens.reserve(5000)[1] == 600
@@ -0,0 +1,117 @@
+import gc
+import threading
+import time
+import tracemalloc
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.extractors import Download
+from app.ingest import _ensure_indexed
+from app.main import app
+from app.lexical_index import LexicalIndex
+from app.pipeline import IngestPipeline
+from app.utils.chunking import ChunkRecord, TextBuffer, iter_chunks, text_released
+from app.utils.memory import MemoryBudget, MemoryLimitExceeded
+
+
+def policy_pages(megabytes):
+    page = ''.join(f'Section {i}: A grace period of thirty days is provided for premium payment '
+                   f'after the due date. ' for i in range(40))
+    count = int(megabytes * 1024 * 1024 / len(page))
+    return [{'page': p + 1, 'text': page} for p in range(count)], count * len(page) / (1024 * 1024)
+
+
+def test_chunk_records_match_chunk_dicts_and_release_text():
+    pages = [{'page': 1, 'text': 'Grace period is thirty days. ' * 40},
+             {'page': 2, 'text': 'Waiting period applies.\n' * 40}]
+    chunks = list(iter_chunks(pages, chunk_size=64, overlap=16))
+    buffer = TextBuffer()
+    records = list(iter_chunks(pages, chunk_size=64, overlap=16, buffer=buffer))
+    assert all(isinstance(r, ChunkRecord) for r in records)
+    assert [dict(r) for r in records] == [dict(c, id=None) for c in chunks]
+    assert sum(len(r['text']) for r in records) > len(buffer)  # overlaps aren't stored twice
+
+    records[0]['id'] = 7
+    assert records[0].get('id') == 7 and not text_released(records)
+    buffer.release()
+    assert text_released(records) and records[0]['text'] == '' and records[0]['page'] == 1
+
+
+def test_low_memory_ingest_peak_per_megabyte():
+    pages, megabytes = policy_pages(1)
+    index = LexicalIndex()
+    iter_chunks([{'page': 1, 'text': 'warm up'}])  # load the tokenizer outside the measurement
+    gc.collect()
+    tracemalloc.start()
+    try:
+        buffer = TextBuffer()
+        pipeline = IngestPipeline(lambda ps: iter_chunks(ps, buffer=buffer),
+                                  lambda texts: np.zeros((len(texts), 8), dtype=np.float32),
+                                  lambda batch, vectors: batch)
+        chunks = pipeline.run(iter(pages))
+        index.build('doc', chunks)
+        buffer.release()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert chunks and text_released(chunks)
+    # The input pages are allocated before tracing starts; this is what ingesting them adds
+    assert peak / (1024 * 1024) / megabytes < 3.0
+    assert retained / (1024 * 1024) / megabytes < 0.5
+
+
+def test_memory_budget_waits_and_refuses():
+    budget = MemoryBudget(100)
+    with pytest.raises(MemoryLimitExceeded):
+        budget.acquire(101)
+    budget.acquire(80)
+    with pytest.raises(MemoryLimitExceeded):
+        budget.acquire(40, timeout=0.05)
+    threading.Timer(0.1, budget.release, args=(80,)).start()
+    start = time.monotonic()
+    with budget.reserve(40, timeout=2):
+        assert budget.used == 40
+    assert time.monotonic() - start >= 0.05
+    assert budget.used == 0
+    MemoryBudget(0).acquire(10 ** 12)  # disabled
+
+
+@patch('app.ingest.upsert_chunks')
+@patch('app.ingest.has_vectors', return_value=False)
+def test_released_entry_is_reindexed_from_the_database(mock_has_vectors, mock_upsert):
+    released = [ChunkRecord(None, 0, 0, 'chunk_0', 0, 5, page=1)]
+    stored = [{'text': 'grace period thirty days', 'chunk_id': 'chunk_0', 'ordinal': 0, 'token_count': 5, 'page': 1}]
+    cache = MagicMock()
+    cache.persistent.get.return_value = {'doc_id': 'doc-lm', 'chunks': stored}
+    index = LexicalIndex()
+    with patch('app.ingest.lexical_index', index):
+        entry = _ensure_indexed({'doc_id': 'doc-lm', 'chunks': released}, cache)
+    assert entry['chunks'] is released
+    mock_upsert.assert_called_once_with('doc-lm', stored)
+    assert [cid for cid, _ in index.get('doc-lm').search_batch(['grace period'], 1)[0]] == ['chunk_0']
+
+
+def _small_download(url):
+    blob = Download(url, 'text/plain')
+    blob.write(b'Grace period is thirty days. ' * 10)
+    return blob.finish()
+
+
+@patch('app.ingest.probe_validators', return_value={})
+@patch('app.ingest.download', side_effect=_small_download)
+def test_document_over_the_whole_budget_is_413_busy_budget_is_503(mock_download, mock_probe):
+    client = TestClient(app)
+    headers = {'Authorization': f'Bearer {settings.HACKRX_TEAM_TOKEN}'}
+    body = {'documents': 'https://example.com/policy.txt', 'questions': ['q']}
+    with patch('app.ingest.ingest_budget', MemoryBudget(100)):
+        r = client.post('/hackrx/run', json=body, headers=headers)
+    assert r.status_code == 413 and 'memory budget' in r.json()['detail']
+    assert 'Retry-After' not in r.headers
+    busy = MemoryBudget(1000)
+    busy.acquire(1000)
+    with patch('app.ingest.ingest_budget', busy), patch('app.ingest.INGEST_MEMORY_WAIT', 0.01):
+        r = client.post('/hackrx/run', json=body, headers=headers)
+    assert r.status_code == 503 and r.headers['Retry-After'] == '30'
@@ -0,0 +1,41 @@
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.metrics import Registry
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram('t_seconds', 'Test.', ['stage'], buckets=(0.1, 1.0))
+    hist.observe(0.05, stage='llm')
+    hist.observe(0.5, stage='llm')
+    hist.observe(5, stage='llm')
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="llm",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="llm"} 3' in text
+
+
+def test_metrics_endpoint_and_trace_header():
+    r = client.get('/metrics', headers={'X-Request-ID': 'abc123'})
+    assert r.status_code == 200
+    assert r.headers['X-Trace-Id'] == 'abc123'
+    assert 'hackrx_db_pool_connections{engine="async",state="utilization"}' in r.text
+    # The previous scrape was itself recorded
+    r = client.get('/metrics')
+    assert 'hackrx_http_request_seconds_count{method="GET",path="/metrics",status="200"}' in r.text
+
+
+def test_failing_gauge_callback_is_logged_as_event(capsys):
+    registry = Registry()
+    def broken():
+        raise RuntimeError('pool gone')
+    registry.gauge('t_pool', 'Test.', ['state'], callback=broken)
+    assert 't_pool' in registry.render()
+    record = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert record['event'] == 'metric_collect_error'
+    assert record['metric'] == 't_pool' and record['error'] == 'pool gone'
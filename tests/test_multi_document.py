@@ -0,0 +1,93 @@
+import asyncio
+import time
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app import retriever
+from app.answering import answer_questions
+from app.lexical_index import LexicalIndex
+from app.main import app, _documents_key
+from app.config import settings
+from app.schema import AnswerItem
+from app.vector_index import LocalVectorIndex
+from app.embeddings_ import get_embeddings
+
+client = TestClient(app)
+
+POLICY = [{'chunk_id': 'chunk_0', 'text': 'A grace period of thirty days is allowed for premium payment.', 'page': 3},
+          {'chunk_id': 'chunk_1', 'text': 'The policy period is one year.', 'page': 4}]
+BROCHURE = [{'chunk_id': 'chunk_0', 'text': 'Enjoy cashless treatment at over 5000 network hospitals.', 'page': 1},
+            {'chunk_id': 'chunk_1', 'text': 'Premium payment can be made monthly with a grace period.', 'page': 2}]
+
+
+def test_retrieval_spans_documents_and_keeps_their_chunks_apart():
+    index = LocalVectorIndex(path=None)
+    for doc_id, chunks in (('policy', POLICY), ('brochure', BROCHURE)):
+        index.upsert(doc_id, [c['chunk_id'] for c in chunks], get_embeddings([c['text'] for c in chunks]))
+    chunk_maps = {'policy': {c['chunk_id']: c for c in POLICY}, 'brochure': {c['chunk_id']: c for c in BROCHURE}}
+    with patch('app.retriever.local_index', index), patch('app.retriever.lexical_index', LexicalIndex()):
+        hits = retriever.query_top_k_batch(['grace period premium payment', 'network hospitals'], k=4,
+                                           doc_id=['policy', 'brochure'], chunk_maps=chunk_maps)
+    assert {h['doc_id'] for h in hits[0]} == {'policy', 'brochure'}
+    # chunk_0 exists in both documents; each hit gets its own document's text and page
+    for hit in hits[0] + hits[1]:
+        chunk = chunk_maps[hit['doc_id']][hit['chunk_id']]
+        assert hit['text'] == chunk['text'] and hit['page'] == chunk['page']
+    assert (hits[1][0]['doc_id'], hits[1][0]['chunk_id']) == ('brochure', 'chunk_0')
+
+
+def slow_ingest(url):
+    time.sleep(0.3)
+    name = url.rsplit('/', 1)[1]
+    return {'doc_id': f'doc-{name}', 'document_url': url, 'content_hash': name, 'chunks': POLICY}
+
+
+@patch('app.main.answer_questions')
+@patch('app.main.ingest_document', side_effect=slow_ingest)
+def test_documents_are_ingested_concurrently(mock_ingest, mock_answer):
+    seen = {}
+
+    async def fake_answers(questions, chunks, *args, **kwargs):
+        seen.update(kwargs)
+        return [AnswerItem(question=q, answer='ok', confidence=1.0, sources=[], rationale='') for q in questions]
+    mock_answer.side_effect = fake_answers
+
+    urls = [f'https://example.com/{n}.pdf' for n in ('policy', 'brochure', 'wording')]
+    headers = {'Authorization': f'Bearer {settings.HACKRX_TEAM_TOKEN}'}
+    started = time.monotonic()
+    r = client.post('/hackrx/run', json={'documents': urls + urls[:1], 'questions': ['q']}, headers=headers)
+    elapsed = time.monotonic() - started
+    assert r.status_code == 200
+    assert mock_ingest.call_count == 3
+    # Ingests overlap, so the request takes about as long as one of them
+    assert elapsed < 0.8
+    assert [d['document_url'] for d in seen['documents']] == urls
+
+    too_many = [f'https://example.com/{n}.pdf' for n in range(settings.MAX_DOCUMENTS_PER_REQUEST + 1)]
+    r = client.post('/hackrx/run', json={'documents': too_many, 'questions': ['q']}, headers=headers)
+    assert r.status_code == 422
+
+
+async def fake_explain(question, evidence, deadline=None, stats=None):
+    return {'answer': 'Thirty days.', 'facts': {}, 'rationale': '', 'confidence': 0.9}
+
+
+@patch('app.answering.explain_and_answer_async', side_effect=fake_explain)
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [
+    [{'doc_id': d, 'chunk_id': 'chunk_0', 'score': 0.5, **chunk_maps[d]['chunk_0']} for d in doc_id] for _ in qs])
+def test_sources_are_attributed_to_document_and_page(mock_query, mock_explain):
+    documents = [{'doc_id': 'policy', 'document_url': 'https://example.com/policy.pdf', 'chunks': POLICY},
+                 {'doc_id': 'brochure', 'document_url': 'https://example.com/brochure.pdf', 'chunks': BROCHURE}]
+    [item] = asyncio.run(answer_questions(['grace period?'], None, cache=None, documents=documents))
+    assert [(s.document_url, s.page) for s in item.sources] == [
+        ('https://example.com/policy.pdf', 3), ('https://example.com/brochure.pdf', 1)]
+
+
+def test_documents_key_is_the_content_hash_regardless_of_url_and_order():
+    policy = {'doc_id': 'doc-a', 'document_url': 'https://a.example/p.pdf', 'content_hash': 'h1'}
+    mirror = {'doc_id': 'doc-b', 'document_url': 'https://b.example/p.pdf', 'content_hash': 'h1'}
+    brochure = {'doc_id': 'doc-c', 'document_url': 'https://a.example/b.pdf', 'content_hash': 'h2'}
+    assert _documents_key([policy]) == _documents_key([mirror]) == 'h1'
+    assert _documents_key([policy, brochure]) == _documents_key([brochure, mirror])
+    assert _documents_key([policy, brochure]) != _documents_key([policy])
+    # Without a hash there is nothing content-based to key on: no answer caching
+    assert _documents_key([policy, {'doc_id': 'legacy', 'content_hash': None}]) is None
@@ -0,0 +1,51 @@
+import time
+import numpy as np
+import pytest
+from app.pipeline import IngestPipeline
+
+
+def slow_pages(n, delay=0.02):
+    for i in range(n):
+        time.sleep(delay)
+        yield {'page': i + 1, 'text': f'page {i + 1}'}
+
+
+def chunker(pages):
+    for page in pages:
+        for j in range(3):
+            yield {'text': f"{page['text']} part {j}", 'chunk_id': f"{page['page']}_{j}", 'page': page['page']}
+
+
+def embed(texts):
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_pipeline_keeps_order_and_overlaps_stages():
+    sunk = []
+
+    def sink(batch, vectors):
+        assert vectors.shape == (len(batch), 4)
+        sunk.append(len(batch))
+        return [c for c in batch if not c['chunk_id'].endswith('_2')]
+
+    pipeline = IngestPipeline(chunker, embed, sink, queue_size=2, embed_batch=4)
+    kept = pipeline.run(slow_pages(20))
+    report = pipeline.report()
+    assert [c['chunk_id'] for c in kept][:4] == ['1_0', '1_1', '2_0', '2_1']
+    assert len(kept) == 40
+    assert sum(sunk) == 60
+    assert report['stages']['extract']['items'] == 20
+    # The first batch is indexed long before extraction of the last page finishes
+    assert report['first_chunk_seconds'] < report['wall_seconds'] / 2
+
+
+def test_stage_failure_propagates():
+    def bad_chunker(pages):
+        for page in pages:
+            if page['page'] == 3:
+                raise ValueError('corrupt page')
+            yield from chunker([page])
+
+    pipeline = IngestPipeline(bad_chunker, embed, lambda batch, vectors: batch, queue_size=1, embed_batch=2)
+    with pytest.raises(ValueError):
+        pipeline.run(slow_pages(50, delay=0))
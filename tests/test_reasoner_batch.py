@@ -0,0 +1,45 @@
+import asyncio
+import json
+from unittest.mock import patch
+from app.reasoner import group_by_evidence, parse_batch_answers, explain_and_answer_batch_async
+
+
+def ev(*chunk_ids):
+    return [{'doc_id': 'd', 'chunk_id': c, 'text_snippet': f'text of {c}'} for c in chunk_ids]
+
+
+def test_groups_only_questions_with_overlapping_evidence():
+    items = [('q1', ev('c1', 'c2')), ('q2', ev('c2', 'c3')), ('q3', ev('c9'))]
+    assert group_by_evidence(items, 6000) == [[0, 1], [2]]
+    # A budget too small for two questions keeps everything separate
+    assert group_by_evidence(items, 1) == [[0], [1], [2]]
+
+
+def test_parse_batch_answers_drops_malformed_items():
+    content = 'Sure: ' + json.dumps([
+        {'id': 1, 'answer': 'a1', 'confidence': 0.8},
+        {'id': 2, 'answer': None},
+        {'id': 7, 'answer': 'out of range'},
+    ])
+    parsed = parse_batch_answers(content, 2)
+    assert list(parsed) == [1]
+    assert parsed[1]['answer'] == 'a1' and parsed[1]['confidence'] == 0.8
+    assert parse_batch_answers('not json', 2) == {}
+
+
+async def fake_single(question, evidence, deadline=None, stats=None):
+    return {'answer': f'single {question}', 'facts': {}, 'rationale': '', 'confidence': 0.5}
+
+
+@patch('app.reasoner.explain_and_answer_async', side_effect=fake_single)
+@patch('app.reasoner.run_llm_async')
+def test_batch_falls_back_per_question(mock_llm, mock_single):
+    async def fake_llm(prompt, max_tokens=None, deadline=None):
+        return {'answer': json.dumps([{'id': 1, 'answer': 'batched q1', 'confidence': 0.9}])}
+    mock_llm.side_effect = fake_llm
+    items = [('q1', ev('c1')), ('q2', ev('c1')), ('q3', ev('c5'))]
+    results = asyncio.run(explain_and_answer_batch_async(items, 6000))
+    assert [r['answer'] for r in results] == ['batched q1', 'single q2', 'single q3']
+    assert mock_llm.call_count == 1
+    # Shared evidence appears once in the batched prompt
+    assert mock_llm.call_args[0][0].count('text of c1') == 1
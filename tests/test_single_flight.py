@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import numpy as np
+import pytest
+from app.db import advisory_lock
+from app.doc_cache import DocumentCache, LRUDocumentCache
+from app.ingest import ingest_document
+from app.utils.single_flight import SingleFlight
+from tests.test_doc_cache import fake_download
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'result'
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, 'k', slow)
+        started.wait()
+        followers = [pool.submit(flight.do, 'k', slow) for _ in range(3)]
+        results = [leader.result()] + [f.result() for f in followers]
+    assert len(calls) == 1
+    assert results[0] == ('result', False)
+    assert all(r == ('result', True) for r in results[1:])
+    assert not flight.in_flight('k')
+
+
+def test_followers_see_leader_error():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, 'k', failing)
+        started.wait()
+        follower = pool.submit(flight.do, 'k', failing)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_advisory_lock_excludes_second_holder():
+    with advisory_lock('test:lock', timeout=1) as first:
+        assert first
+        with advisory_lock('test:lock', timeout=0.2) as second:
+            assert not second
+    with advisory_lock('test:lock', timeout=0.2) as again:
+        assert again
+
+
+def slow_download(url):
+    time.sleep(0.2)
+    return fake_download(url)
+
+
+@patch('app.ingest._indexed_hashes', return_value={})
+@patch('app.ingest.get_embeddings', side_effect=lambda texts: np.zeros((len(texts), 4), dtype=np.float32))
+@patch('app.ingest.upsert_embeddings')
+@patch('app.ingest._persist_chunks', side_effect=lambda url, doc_id, chunks, *args: chunks)
+@patch('app.ingest.probe_validators', return_value={})
+@patch('app.ingest.download', side_effect=slow_download)
+def test_concurrent_ingests_of_same_url_coalesce(mock_download, mock_probe, mock_persist, mock_upsert, mock_embed,
+                                                 mock_hashes):
+    cache = DocumentCache(LRUDocumentCache())
+    with ThreadPoolExecutor(4) as pool:
+        entries = list(pool.map(lambda _: ingest_document('https://example.com/same.txt', cache), range(4)))
+    assert len({e['doc_id'] for e in entries}) == 1
+    assert mock_download.call_count == 1
+    assert mock_persist.call_count == 1
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+PROBE = "import sys, app.main; print(sorted(m for m in ('groq', 'httpx', 'requests') if m in sys.modules))"
+
+
+def test_importing_app_defers_heavy_clients():
+    # A fresh interpreter, since the test session itself has already imported these
+    out = subprocess.run([sys.executable, '-c', PROBE], env=dict(os.environ), capture_output=True, text=True,
+                         check=True)
+    assert out.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_app_imports_without_settings_or_database():
+    # Nothing at import may need DATABASE_URL and the other required settings
+    env = {k: v for k, v in os.environ.items() if k in ('PATH', 'HOME', 'PYTHONPATH')}
+    probe = ("import app.main; from app import config, db; "
+             "print(config.get_settings.cache_info().currsize, db.get_engine.cache_info().currsize, "
+             "db.get_async_engine.cache_info().currsize)")
+    out = subprocess.run([sys.executable, '-c', probe], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == '0 0 0'
+
+
+def test_settings_are_read_on_first_use(monkeypatch):
+    from app import config
+    config.get_settings.cache_clear()
+    try:
+        monkeypatch.setenv('INGEST_WORKERS', '7')
+        assert config.settings.INGEST_WORKERS == 7
+        monkeypatch.setenv('INGEST_WORKERS', '3')
+        # Built once, then cached
+        assert config.settings.INGEST_WORKERS == 7
+    finally:
+        config.get_settings.cache_clear()
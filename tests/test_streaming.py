@@ -0,0 +1,59 @@
+import asyncio
+import json
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.answering import iter_answers
+from app.config import settings
+
+client = TestClient(app)
+
+
+async def fake_explain(question, evidence, deadline=None, stats=None):
+    await asyncio.sleep(0.3 if question == 'slow' else 0.01)
+    return {'answer': f'answer to {question}', 'facts': {'limit': '30 days'}, 'rationale': '', 'confidence': 0.7}
+
+
+def fake_ingest(url):
+    return {'doc_id': 'doc-1', 'content_hash': None, 'chunks': []}
+
+
+@patch('app.main.ingest_document', side_effect=fake_ingest)
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [
+    [{'doc_id': doc_id[0], 'chunk_id': 'c0', 'text': 'evidence', 'score': 0.5}] for _ in qs])
+@patch('app.answering.explain_and_answer_async', side_effect=fake_explain)
+def test_stream_emits_answers_as_they_complete(mock_explain, mock_query, mock_ingest):
+    headers = {'Authorization': f'Bearer {settings.HACKRX_TEAM_TOKEN}'}
+    data = {'documents': 'https://example.com/doc.txt', 'questions': ['slow', 'fast']}
+    r = client.post('/hackrx/run/stream', json=data, headers=headers)
+    assert r.status_code == 200
+    events = [json.loads(line) for line in r.text.splitlines()]
+    assert [e['event'] for e in events] == ['ingest', 'ingest', 'answer', 'answer', 'done']
+    # The fast question is streamed before the slow one
+    assert [e['index'] for e in events[2:4]] == [1, 0]
+    assert events[2]['answer'] == 'answer to fast'
+    assert events[2]['sources'][0]['extracted_facts'] == ['limit: 30 days']
+
+
+@patch('app.answering.query_top_k_batch', side_effect=lambda qs, k, doc_id, chunk_maps=None: [[] for _ in qs])
+def test_closing_stream_cancels_outstanding_calls(mock_query):
+    cancelled = []
+
+    async def explain(question, evidence, deadline=None, stats=None):
+        try:
+            await asyncio.sleep(0 if question == 'fast' else 5)
+        except asyncio.CancelledError:
+            cancelled.append(question)
+            raise
+        return {'answer': question, 'confidence': 1.0}
+
+    async def consume_first():
+        answers = iter_answers(['fast', 'slow1', 'slow2'], [], cache=None)
+        first = await answers.__anext__()
+        await answers.aclose()
+        return first
+
+    with patch('app.answering.explain_and_answer_async', side_effect=explain):
+        index, item = asyncio.run(asyncio.wait_for(consume_first(), 2))
+    assert (index, item.answer) == (0, 'fast')
+    assert sorted(cancelled) == ['slow1', 'slow2']
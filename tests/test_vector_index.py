@@ -0,0 +1,87 @@
+import numpy as np
+from app.vector_index import LocalVectorIndex
+
+
+def random_unit(n, dim, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def test_exact_search_is_namespaced():
+    index = LocalVectorIndex(path=None)
+    vecs = random_unit(50, 16)
+    index.upsert('doc_a', [f'chunk_{i}' for i in range(50)], vecs)
+    index.upsert('doc_b', ['chunk_0'], vecs[7:8])
+    hits = index.query(vecs[7], top_k=3, namespace='doc_a')
+    assert hits[0][:2] == ('doc_a', 'chunk_7')
+    assert abs(hits[0][2] - 1.0) < 1e-5
+    assert {h[0] for h in index.query(vecs[7], top_k=2)} == {'doc_a', 'doc_b'}
+
+
+def test_ivf_recall_on_clustered_data():
+    rng = np.random.default_rng(1)
+    centers = random_unit(20, 32, seed=2)
+    vecs = centers[rng.integers(0, 20, 4000)] + rng.normal(scale=0.05, size=(4000, 32)).astype(np.float32)
+    index = LocalVectorIndex(path=None, ivf_threshold=1000, nprobe=4)
+    index.upsert('big', [str(i) for i in range(4000)], vecs)
+    exact = LocalVectorIndex(path=None)
+    exact.upsert('big', [str(i) for i in range(4000)], vecs)
+    queries = vecs[:50]
+    recall = np.mean([
+        len({h[1] for h in index.query(q, 10)} & {h[1] for h in exact.query(q, 10)}) / 10
+        for q in queries
+    ])
+    assert recall > 0.9
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+    vecs = random_unit(10, 8)
+    index = LocalVectorIndex(path=str(tmp_path))
+    index.upsert('doc', [f'c{i}' for i in range(10)], vecs)
+    reloaded = LocalVectorIndex(path=str(tmp_path))
+    assert reloaded.has_namespace('doc')
+    assert isinstance(reloaded._namespaces['doc'].vectors, np.memmap)
+    assert reloaded.query(vecs[3], 1)[0][1] == 'c3'
+    reloaded.upsert('doc', ['c3', 'c10'], random_unit(2, 8, seed=5))
+    assert len(LocalVectorIndex(path=str(tmp_path)).load('doc').ids) == 11
+
+
+def test_query_batch_matches_single_queries():
+    index = LocalVectorIndex(path=None)
+    vecs = random_unit(30, 16)
+    index.upsert('doc', [f'c{i}' for i in range(30)], vecs)
+    batch = index.query_batch(vecs[:5], top_k=3, namespace='doc')
+    single = [index.query(v, top_k=3, namespace='doc') for v in vecs[:5]]
+    assert [[h[1] for h in hits] for hits in batch] == [[h[1] for h in hits] for hits in single]
+    assert np.allclose([[h[2] for h in hits] for hits in batch], [[h[2] for h in hits] for hits in single], atol=1e-6)
+
+
+def test_batched_upserts_grow_amortised_and_save_on_flush(tmp_path):
+    index = LocalVectorIndex(path=str(tmp_path))
+    vecs = random_unit(1000, 8)
+    buffers = set()
+    for start in range(0, 1000, 10):
+        index.upsert('doc', [f'c{i}' for i in range(start, start + 10)], vecs[start:start + 10], flush=False)
+        buffers.add(id(index._namespaces['doc']._data))
+    # Capacity doubles, so 100 batches reallocate only a handful of times
+    assert len(buffers) <= 6
+    assert not LocalVectorIndex(path=str(tmp_path)).has_namespace('doc')
+    index.flush()
+    reloaded = LocalVectorIndex(path=str(tmp_path)).load('doc')
+    assert len(reloaded.ids) == 1000
+    assert np.allclose(reloaded.vectors, vecs, atol=1e-6)
+
+
+def test_snapshot_is_unaffected_by_later_upserts():
+    index = LocalVectorIndex(path=None)
+    vecs = random_unit(20, 8)
+    index.upsert('doc', [f'c{i}' for i in range(10)], vecs[:10])
+    ns = index._namespaces['doc']
+    _, ids, vectors, _ = ns.snapshot()
+    before = np.array(vectors)
+    # Overwrites an existing row and appends new ones
+    index.upsert('doc', ['c0'] + [f'c{i}' for i in range(10, 20)], vecs[9:20])
+    assert ids[:10] == [f'c{i}' for i in range(10)] and len(vectors) == 10
+    assert np.array_equal(vectors, before)
+    assert index.query(vecs[9], 2, namespace='doc')[0][2] > 0.999
+    assert len(ns.vectors) == 20